@@ -6,9 +6,77 @@ import os
 class Settings(BaseSettings):
     app_name: str = "TSPRTG Tag Manager"
     database_url: str = "sqlite:///./tsprtg.db"
+    # SQLite storage profile: "production" (WAL, synchronous=NORMAL, mmap,
+    # larger page cache, busy timeout, in-memory temp tables, one writer
+    # connection) or "default" (SQLite's own defaults)
+    sqlite_profile: str = "production"
+    sqlite_mmap_size: int = 268435456  # bytes
+    sqlite_cache_size: int = -65536  # negative: KiB per connection
+    sqlite_busy_timeout_ms: int = 5000
+    # Async driver URL for the loader and health read endpoints; derived
+    # from database_url when unset (sqlite+aiosqlite, postgresql+asyncpg)
+    async_database_url: Optional[str] = None
+    # Worker processes started by run.py (0 = CPU count) and how long a
+    # stopping worker may take to finish its in-flight requests
+    web_workers: int = 0
+    web_graceful_timeout: int = 30
+    # Reader connection pools (the writer always has exactly one connection)
+    db_pool_size: int = 20
+    db_max_overflow: int = 20
     # Use environment variable or generate random token if not set
     admin_token: Optional[str] = os.getenv("ADMIN_TOKEN")
     cors_origins: str = "*"  # String instead of list for env parsing
+    # Maximum number of rendered loader bundles kept in memory
+    loader_cache_size: int = 10000
+    # Bundles rendered when a worker starts, before it accepts requests
+    # (the busiest containers of the last day)
+    loader_warm_containers: int = 500
+    # Token-bucket limits on /c/{id}/l.js per client IP and per container
+    # (requests per second and burst; rate 0 = no limit), per worker process,
+    # and the number of buckets kept per limit
+    loader_rate_per_ip: float = 50
+    loader_burst_per_ip: int = 100
+    loader_rate_per_container: float = 0
+    loader_burst_per_container: int = 1000
+    loader_rate_max_keys: int = 100000
+    # How often each worker checks the config version for admin writes made
+    # by other workers (0 = never, for a single process)
+    config_poll_interval_ms: int = 1000
+    # Batched health log writer: queue bound, flush every N rows or T ms
+    log_queue_size: int = 10000
+    log_batch_size: int = 500
+    log_flush_interval_ms: int = 200
+    # What to do when the queue is full: drop_newest, drop_oldest or block
+    log_overflow_policy: str = "drop_newest"
+    log_block_timeout_ms: int = 5
+    # Static publish mode: output directory served by nginx, worker processes (0 = CPU count)
+    publish_dir: str = "./public"
+    publish_workers: int = 0
+    # Request/DB instrumentation exposed at /metrics; per-container series cap
+    metrics_enabled: bool = True
+    metrics_max_containers: int = 1000
+    # Where worker processes share their metrics; set by run.py for its workers
+    metrics_dir: str = ""
+    # Health log retention: rows older than N days move to gzip NDJSON
+    # segments under archive_dir (0 = keep everything in the database)
+    log_retention_days: int = 0
+    archive_dir: str = "./archive"
+    archive_interval_minutes: int = 60
+    archive_segment_rows: int = 50000
+    archive_delete_batch: int = 1000
+    # Top referers / user agents per container: items tracked per summary
+    # (0 disables) and how often in-memory counts are merged into the database
+    topk_capacity: int = 100
+    topk_snapshot_seconds: int = 60
+    # Live health stream (/api/health/stream): counters pushed every tick,
+    # stats re-read from the rollups once per snapshot interval whatever the
+    # number of clients, loads listed per tick, events buffered per client
+    live_tick_ms: int = 1000
+    live_snapshot_seconds: int = 30
+    live_max_loads: int = 50
+    live_client_queue: int = 100
+    # Rows read per short transaction by the streaming log export
+    export_batch_rows: int = 5000
     
     class Config:
         env_file = ".env"
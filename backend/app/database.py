@@ -1,16 +1,224 @@
-from sqlalchemy import create_engine
+from contextvars import ContextVar
+from typing import Optional
+import time
+
+from sqlalchemy import Delete, Insert, Select, Update, create_engine, event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.orm import Session, sessionmaker
 from .config import settings
 
-engine = create_engine(
-    settings.database_url, connect_args={"check_same_thread": False}
+# Storage profiles: "production" applies the pragmas below on every SQLite
+# connection, "default" leaves SQLite's defaults (rollback journal, FULL sync)
+SQLITE_PROFILES = ('production', 'default')
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL: readers never block the writer and the writer never blocks readers
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints; a power loss can only drop the last commits
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def make_engine(url: str, profile: str = 'default', writer: bool = False) -> Engine:
+    """Create an engine for ``url`` with the given storage profile.
+
+    With the production profile on SQLite, the reader pool holds
+    ``DB_POOL_SIZE`` connections (plus ``DB_MAX_OVERFLOW``) and the writer
+    engine exactly one, so writes queue up in the pool instead of failing
+    with "database is locked".
+    """
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile: {profile}")
+    if not _is_sqlite(url):
+        return create_engine(url)
+
+    if profile == 'default':
+        return create_engine(url, connect_args={"check_same_thread": False})
+
+    if writer:
+        pool = {"pool_size": 1, "max_overflow": 0, "pool_timeout": settings.sqlite_busy_timeout_ms / 1000}
+    else:
+        pool = {"pool_size": settings.db_pool_size, "max_overflow": settings.db_max_overflow}
+    new_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": settings.sqlite_busy_timeout_ms / 1000},
+        **pool
+    )
+    event.listen(new_engine, "connect", _apply_sqlite_pragmas)
+    return new_engine
+
+
+# Async drivers for the URL schemes the app supports
+_ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+
+def async_database_url(url: str) -> str:
+    """The async driver URL for a sync ``DATABASE_URL`` (overridable with ``ASYNC_DATABASE_URL``)"""
+    scheme, sep, rest = url.partition('://')
+    return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def make_async_engine(url: str, profile: str = 'default') -> AsyncEngine:
+    """Create the async engine used by the loader and health read endpoints.
+
+    It only ever reads. With the production profile on SQLite it keeps a
+    pool of connections (aiosqlite defaults to one new connection, and
+    thread, per session) with the same pragmas as the sync engine.
+    """
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile: {profile}")
+    if not url.startswith('sqlite') or profile == 'default':
+        return create_async_engine(url)
+
+    new_engine = create_async_engine(
+        url,
+        connect_args={"timeout": settings.sqlite_busy_timeout_ms / 1000},
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow
+    )
+    event.listen(new_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return new_engine
+
+
+engine = make_engine(settings.database_url, settings.sqlite_profile)
+# A single connection all writes go through (the reader engine elsewhere)
+if _is_sqlite(settings.database_url) and settings.sqlite_profile == 'production':
+    writer_engine = make_engine(settings.database_url, settings.sqlite_profile, writer=True)
+else:
+    writer_engine = engine
+
+
+async_engine = make_async_engine(
+    settings.async_database_url or async_database_url(settings.database_url),
+    settings.sqlite_profile
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _is_write(statement) -> bool:
+    # SELECT ... FOR UPDATE reads rows the transaction is about to write
+    return isinstance(statement, (Insert, Update, Delete)) or (
+        isinstance(statement, Select) and statement._for_update_arg is not None
+    )
+
+
+class RoutingSession(Session):
+    """Session that sends flushes, INSERT/UPDATE/DELETE and SELECT ... FOR
+    UPDATE statements to the writer engine and everything else to the
+    reader pool.
+
+    Once a transaction has written, every later statement goes to the writer
+    too, until commit or rollback, so its reads see its own uncommitted rows.
+    """
+
+    def __init__(self, reader: Engine, writer: Engine, **kw):
+        super().__init__(**kw)
+        self.reader = reader
+        self.writer = writer
+        self._writing = 0
+        self._pinned = False
+
+    def use_writer(self) -> None:
+        """Send the rest of this transaction to the writer, reads included"""
+        self._pinned = True
+
+    def commit(self) -> None:
+        try:
+            super().commit()
+        finally:
+            self._pinned = False
+
+    def rollback(self) -> None:
+        try:
+            super().rollback()
+        finally:
+            self._pinned = False
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._pinned = False
+
+    def execute(self, statement, *args, **kw):
+        # ORM bulk INSERT/UPDATE asks for a bind by mapper only, so mark the
+        # whole statement execution as a write
+        if _is_write(statement):
+            self._writing += 1
+            try:
+                return super().execute(statement, *args, **kw)
+            finally:
+                self._writing -= 1
+        return super().execute(statement, *args, **kw)
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._pinned or self._flushing or self._writing or _is_write(clause):
+            self._pinned = True
+            return self.writer
+        return self.reader
+
+
+def make_session_factory(reader: Engine, writer: Engine) -> sessionmaker:
+    return sessionmaker(
+        class_=RoutingSession, reader=reader, writer=writer,
+        autocommit=False, autoflush=False
+    )
+
+
+SessionLocal = make_session_factory(engine, writer_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 
 Base = declarative_base()
 
 
+class QueryStats:
+    """SQL statement count and time spent for one request"""
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Set by the metrics middleware for the duration of a request. The context
+# is copied into the threadpool that runs sync endpoints, so queries made
+# there are attributed to the request as well.
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar('current_query_stats', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_query_stats.get() is not None:
+        conn.info['query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    stats = current_query_stats.get()
+    if stats is not None and started is not None:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - started
+
+
+for _engine in {engine, writer_engine, async_engine.sync_engine}:
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -19,5 +227,25 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=writer_engine)
+    # create_all skips tables that already exist; add nullable columns and
+    # indexes introduced later
+    inspector = inspect(engine)
+    with writer_engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(
+                        f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                    )
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=writer_engine, checkfirst=True)
@@ -1,8 +1,19 @@
+import logging
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
 from .database import init_db
-from .routers import advertisers, scripts, advertiser_scripts, loader, health
+from .routers import advertisers, scripts, advertiser_scripts, loader, health, publish, configuration
+from .services.archiver import retention_worker
+from .services.config_version import config_watcher
+from .services.heavy_hitters import heavy_hitters
+from .services.loader_cache import warm_loader_cache
+from .services.log_writer import log_writer
+from .services.metrics import MetricsMiddleware, render_metrics, shared_metrics
+
+logger = logging.getLogger(__name__)
 
 # Create FastAPI app
 app = FastAPI(
@@ -18,20 +29,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Per-route request time and SQL statement count/time, exported at /metrics
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(advertisers.router)
 app.include_router(scripts.router)
 app.include_router(advertiser_scripts.router)
 app.include_router(loader.router)
 app.include_router(health.router)
+app.include_router(publish.router)
+app.include_router(configuration.router)
 
 
 @app.on_event("startup")
 def startup_event():
     """Initialize database on startup"""
     init_db()
+    config_watcher.start()
+    # Runs before the server accepts connections
+    warmed = warm_loader_cache(settings.loader_warm_containers)
+    if warmed:
+        logger.info("Rendered %d loader bundles", warmed)
+    log_writer.start()
+    heavy_hitters.start()
+    retention_worker.start()
+    shared_metrics.start()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """Flush pending health logs before exit"""
+    retention_worker.stop()
+    config_watcher.stop()
+    log_writer.stop()
+    # After the log writer, so the last rows are in the snapshot
+    heavy_hitters.stop()
+    # Last, so the master keeps the final counters of this worker
+    shared_metrics.stop()
 
 
 @app.get("/")
@@ -44,6 +83,12 @@ def root():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    """Prometheus metrics in the text exposition format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api")
 def api_root():
     """API root endpoint"""
@@ -53,6 +98,8 @@ def api_root():
             "advertisers": "/api/advertisers",
             "scripts": "/api/scripts",
             "health": "/api/health",
+            "publish": "/api/publish",
+            "config": "/api/config",
             "loader": "/c/{container_id}/l.js"
         }
     }
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Index, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.sql import func
 from ..database import Base
+import logging
 import secrets
 import string
 
+logger = logging.getLogger(__name__)
+
 
 def generate_container_id():
     """Generate unique container ID like 'adv_a1b2c3d4'
@@ -16,6 +20,11 @@ def generate_container_id():
 
 class Advertiser(Base):
     __tablename__ = "advertisers"
+    __table_args__ = (
+        # Sorted listing by name; SQLite appends the rowid (id), which the
+        # keyset pagination on (name, id) relies on
+        Index("ix_advertisers_name", "name"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -24,3 +33,45 @@ class Advertiser(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+
+# Full-text index over name and domains for the advertiser search (SQLite
+# only). It is an external content table kept in sync by triggers, so bulk
+# statements that bypass the ORM update it too.
+SEARCH_TABLE = "advertisers_fts"
+
+_SEARCH_DDL = (
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+    "name, domains, content='advertisers', content_rowid='id', prefix='2 3')",
+    f"CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON advertisers BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, name, domains) VALUES (new.id, new.name, new.domains); END",
+    f"CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON advertisers BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, domains) "
+    "VALUES ('delete', old.id, old.name, old.domains); END",
+    f"CREATE TRIGGER {SEARCH_TABLE}_au AFTER UPDATE OF name, domains ON advertisers BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, domains) "
+    "VALUES ('delete', old.id, old.name, old.domains); "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, name, domains) VALUES (new.id, new.name, new.domains); END",
+    # Index the rows that existed before the table was created
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_search_index(target, connection, **kw):
+    """Create the search index on the first create_all (init_db) that lacks it"""
+    if connection.dialect.name != 'sqlite':
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,)
+    ).first()
+    if exists is not None:
+        return
+    try:
+        connection.exec_driver_sql(_SEARCH_DDL[0])
+    except OperationalError:
+        # SQLite built without FTS5: the search falls back to LIKE
+        logger.warning("SQLite has no FTS5, advertiser search will scan the table")
+        return
+    for statement in _SEARCH_DDL[1:]:
+        connection.exec_driver_sql(statement)
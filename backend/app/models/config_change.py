@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from ..database import Base
+
+
+class ConfigChange(Base):
+    """One admin write to advertisers or scripts; ``version`` is the config version.
+
+    Neither id set means the change can affect every container (global
+    scripts, bulk imports).
+    """
+    __tablename__ = "config_changes"
+    # Never reuse a version, even after the latest row was deleted
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    version = Column(Integer, primary_key=True, autoincrement=True)
+    advertiser_id = Column(Integer, nullable=True)
+    container_id = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
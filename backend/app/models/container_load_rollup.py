@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from ..database import Base
+
+
+class ContainerLoadRollup(Base):
+    """Loader requests per container, hour and domain check result"""
+    __tablename__ = "container_load_rollups"
+
+    container_id = Column(String, primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)  # UTC, truncated to the hour
+    is_allowed = Column(Boolean, primary_key=True)
+    loads = Column(Integer, nullable=False, default=0)
+    last_load = Column(DateTime(timezone=True), nullable=True)  # latest created_at in the bucket
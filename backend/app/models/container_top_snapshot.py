@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Date, String, Text
+from ..database import Base
+
+
+class ContainerTopSnapshot(Base):
+    """Space-Saving summary of the heaviest referers / user agents per container, UTC day and kind"""
+    __tablename__ = "container_top_snapshots"
+
+    container_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    kind = Column(String, primary_key=True)  # referers, user_agents, denied_referers
+    summary = Column(Text, nullable=False)  # JSON [[value, count, error], ...]
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Date, LargeBinary, String
+from ..database import Base
+
+
+class ContainerUniqueSketch(Base):
+    """HyperLogLog sketch of distinct visitors (IP + user agent) per container and UTC day"""
+    __tablename__ = "container_unique_sketches"
+
+    container_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    sketch = Column(LargeBinary, nullable=False)  # HyperLogLog.to_bytes()
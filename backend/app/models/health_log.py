@@ -1,14 +1,23 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Index
 from sqlalchemy.sql import func
 from ..database import Base
 
 
 class HealthLog(Base):
     __tablename__ = "health_logs"
+    __table_args__ = (
+        # Per-container time range scans and aggregates (also covers container_id lookups).
+        # SQLite appends the rowid (id) to every index, which the keyset
+        # pagination on (created_at, id) relies on.
+        Index("ix_health_logs_container_created", "container_id", "created_at"),
+        Index("ix_health_logs_container_allowed_created", "container_id", "is_allowed", "created_at"),
+        Index("ix_health_logs_container_host_created", "container_id", "referer_host", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    container_id = Column(String, nullable=False, index=True)
+    container_id = Column(String, nullable=False)
     referer = Column(Text, nullable=True)
+    referer_host = Column(String, nullable=True)  # normalized host, for filtering
     ip_address = Column(String, nullable=True)
     user_agent = Column(Text, nullable=True)
     is_allowed = Column(Boolean, default=False)
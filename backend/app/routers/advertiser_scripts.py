@@ -5,6 +5,8 @@ from typing import List
 from ..database import get_db
 from ..models.script import Script
 from ..schemas.schemas import ScriptCreate, ScriptUpdate, ScriptResponse
+from ..services.config_version import record_config_change
+from ..services.loader_cache import loader_cache
 
 router = APIRouter(prefix="/api/advertisers", tags=["advertiser-scripts"])
 
@@ -32,8 +34,10 @@ def create_advertiser_script(advertiser_id: int, script: ScriptCreate, db: Sessi
     )
     
     db.add(db_script)
+    record_config_change(db, advertiser_id)
     db.commit()
     db.refresh(db_script)
+    loader_cache.invalidate_advertiser(advertiser_id)
     
     return db_script
 
@@ -70,8 +74,10 @@ def update_advertiser_script(
     if script_update.is_defer is not None:
         db_script.is_defer = script_update.is_defer
     
+    record_config_change(db, advertiser_id)
     db.commit()
     db.refresh(db_script)
+    loader_cache.invalidate_advertiser(advertiser_id)
     
     return db_script
 
@@ -88,7 +94,9 @@ def delete_advertiser_script(advertiser_id: int, script_id: int, db: Session = D
         raise HTTPException(status_code=404, detail="Script not found")
     
     db.delete(db_script)
+    record_config_change(db, advertiser_id)
     db.commit()
+    loader_cache.invalidate_advertiser(advertiser_id)
     
     return {"message": "Script deleted successfully"}
 
@@ -105,7 +113,9 @@ def toggle_advertiser_script(advertiser_id: int, script_id: int, db: Session = D
         raise HTTPException(status_code=404, detail="Script not found")
     
     db_script.is_enabled = not db_script.is_enabled
+    record_config_change(db, advertiser_id)
     db.commit()
     db.refresh(db_script)
+    loader_cache.invalidate_advertiser(advertiser_id)
     
     return db_script
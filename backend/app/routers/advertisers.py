@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 import json
 
 from ..database import get_db
@@ -9,32 +10,49 @@ from ..schemas.schemas import (
     AdvertiserCreate, AdvertiserUpdate, AdvertiserResponse,
     ContainerCodeResponse, StatsResponse
 )
+from ..services.advertiser_search import (
+    decode_advertiser_cursor, encode_advertiser_cursor, list_advertisers_page,
+    render_advertisers_json
+)
+from ..services.config_version import record_config_change
 from ..services.container_generator import generate_container_code
+from ..services.domain_matcher import forget_domain_matcher
 from ..services.health_checker import get_container_stats
+from ..services.loader_cache import get_loader_bundle, loader_cache
+from ..services.uniques import unique_visitor_stats
 
 router = APIRouter(prefix="/api/advertisers", tags=["advertisers"])
 
 
 @router.get("", response_model=List[AdvertiserResponse])
-def list_advertisers(db: Session = Depends(get_db)):
-    """Get list of all advertisers"""
-    advertisers = db.query(Advertiser).all()
-    
-    # Convert domains from JSON string to list
-    result = []
-    for adv in advertisers:
-        adv_dict = {
-            "id": adv.id,
-            "name": adv.name,
-            "container_id": adv.container_id,
-            "domains": json.loads(adv.domains) if adv.domains else [],
-            "is_active": adv.is_active,
-            "created_at": adv.created_at,
-            "updated_at": adv.updated_at
-        }
-        result.append(AdvertiserResponse(**adv_dict))
-    
-    return result
+def list_advertisers(
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: str = Query("created_at", pattern="^(created_at|name|container_id)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    q: Optional[str] = Query(None, min_length=2, max_length=200),
+    db: Session = Depends(get_db)
+):
+    """Get a page of advertisers, optionally matching a search term.
+
+    ``q`` matches words of the name or allowed domains by prefix, and
+    container ids by prefix. When more rows follow, the ``X-Next-Cursor``
+    header holds the cursor of the next page.
+    """
+    try:
+        after = decode_advertiser_cursor(cursor, sort) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows = list_advertisers_page(
+        db, limit=limit + 1, sort=sort, descending=order == "desc", after=after, q=q
+    )
+    
+    # Rendered directly, without building an AdvertiserResponse per row
+    response = Response(render_advertisers_json(rows[:limit]), media_type="application/json")
+    if len(rows) > limit:
+        response.headers["X-Next-Cursor"] = encode_advertiser_cursor(sort, rows[limit - 1])
+    return response
 
 
 @router.post("", response_model=AdvertiserResponse)
@@ -54,6 +72,8 @@ def create_advertiser(advertiser: AdvertiserCreate, db: Session = Depends(get_db
             )
             
             db.add(db_advertiser)
+            db.flush()
+            record_config_change(db, db_advertiser.id, db_advertiser.container_id)
             db.commit()
             db.refresh(db_advertiser)
             break
@@ -117,8 +137,10 @@ def update_advertiser(
     if advertiser_update.is_active is not None:
         db_advertiser.is_active = advertiser_update.is_active
     
+    record_config_change(db, db_advertiser.id, db_advertiser.container_id)
     db.commit()
     db.refresh(db_advertiser)
+    loader_cache.invalidate_container(db_advertiser.container_id)
     
     return AdvertiserResponse(
         id=db_advertiser.id,
@@ -139,8 +161,12 @@ def delete_advertiser(advertiser_id: int, db: Session = Depends(get_db)):
     if not db_advertiser:
         raise HTTPException(status_code=404, detail="Advertiser not found")
     
+    container_id = db_advertiser.container_id
     db.delete(db_advertiser)
+    record_config_change(db, advertiser_id, container_id)
     db.commit()
+    loader_cache.invalidate_container(container_id)
+    forget_domain_matcher(advertiser_id)
     
     return {"message": "Advertiser deleted successfully"}
 
@@ -170,5 +196,7 @@ def get_advertiser_stats(advertiser_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Advertiser not found")
     
     stats = get_container_stats(db, advertiser.container_id)
+    uniques = unique_visitor_stats(db, advertiser.container_id, datetime.utcnow().date())
+    sizes = get_loader_bundle(db, advertiser).size_stats()
     
-    return StatsResponse(**stats)
+    return StatsResponse(**stats, **uniques, **sizes)
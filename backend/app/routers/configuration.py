@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..schemas.schemas import ConfigDocument, ConfigImportResponse
+from ..services.config_io import ConfigImportError, export_config, import_config
+from ..services.config_version import record_config_change
+from ..services.loader_cache import loader_cache
+
+router = APIRouter(prefix="/api/config", tags=["config"])
+
+
+@router.get("/export", response_model=ConfigDocument)
+def export_configuration(db: Session = Depends(get_db)):
+    """Get all advertisers, their domains and scripts, and the global scripts as one document"""
+    return export_config(db)
+
+
+@router.post("/import", response_model=ConfigImportResponse)
+def import_configuration(
+    document: ConfigDocument,
+    prune: bool = False,
+    dry_run: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Apply a configuration document in a single transaction.
+
+    Advertisers are upserted on container_id and scripts on (owner, name).
+    With ?prune=true, scripts of the imported owners missing from the
+    document are deleted. ?dry_run=true reports the changes and rolls back.
+    """
+    try:
+        result = import_config(db, document, prune=prune)
+    except ConfigImportError as e:
+        db.rollback()
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception:
+        db.rollback()
+        raise
+
+    if dry_run:
+        db.rollback()
+    else:
+        record_config_change(db)
+        db.commit()
+        loader_cache.invalidate_all()
+    return ConfigImportResponse(**result, dry_run=dry_run)
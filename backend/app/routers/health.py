@@ -1,52 +1,232 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timedelta
 
-from ..database import get_db
-from ..schemas.schemas import HealthStatusResponse, HealthLogResponse
-from ..services.health_checker import get_all_containers_health, get_container_logs
+from ..database import get_async_db, get_db
+from ..models.advertiser import Advertiser
+from ..schemas.schemas import HealthStatusResponse, HealthLogResponse, LoadSeriesResponse, TopResponse
+from ..services.health_checker import (
+    decode_log_cursor, encode_log_cursor, get_all_container_stats,
+    get_all_containers_health, get_container_logs
+)
+from ..services.archiver import read_archived_logs
+from ..services.heavy_hitters import get_top_hitters
+from ..services.log_export import FORMATS, export_logs
+from ..services.live_events import live_events
+from ..services.metrics import loader_stats, shared_metrics
+from ..services.rollups import get_load_series, to_utc_naive
 
 router = APIRouter(prefix="/api/health", tags=["health"])
 
 
 @router.get("", response_model=HealthStatusResponse)
-def get_health_status(db: Session = Depends(get_db)):
+async def get_health_status(db: AsyncSession = Depends(get_async_db)):
     """Get overall health status of the system"""
-    health = get_all_containers_health(db)
+    health = await db.run_sync(get_all_containers_health)
     return HealthStatusResponse(**health)
 
 
+@router.get("/loader")
+def get_loader_stats():
+    """Get in-memory loader cache, rate limit, health log writer and live stream
+    statistics of the worker process that answers, and under ``run.py`` those
+    of every worker in ``workers``"""
+    stats = loader_stats()
+    if shared_metrics.enabled:
+        return {**stats, "workers": shared_metrics.worker_stats(stats)}
+    return stats
+
+
+@router.get("/stream")
+async def stream_health_events():
+    """Server-Sent Events: a ``snapshot`` of ``/api/health`` and
+    ``/api/health/containers``, then ``counters`` and ``loads`` as
+    containers are loaded, and a new snapshot every ``LIVE_SNAPSHOT_SECONDS``.
+    """
+    return StreamingResponse(
+        live_events.subscribe(),
+        media_type="text/event-stream",
+        # No buffering in nginx, or events arrive in bursts
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/export")
+def export_health_logs(
+    format: str = "ndjson",
+    advertiser_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    gzip: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Stream health logs as NDJSON or CSV, optionally gzip-compressed.
+
+    Filters by advertiser (container) and [start, end). The body is produced
+    batch by batch, so exports of any size use constant memory.
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    
+    container_id = None
+    if advertiser_id is not None:
+        advertiser = db.query(Advertiser).filter(Advertiser.id == advertiser_id).first()
+        if not advertiser:
+            raise HTTPException(status_code=404, detail="Advertiser not found")
+        container_id = advertiser.container_id
+    
+    filename = f"health_logs-{container_id or 'all'}.{format}"
+    media_type = FORMATS[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        export_logs(format, container_id, start, end, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @router.get("/containers")
-def get_containers_health(db: Session = Depends(get_db)):
+async def get_containers_health(db: AsyncSession = Depends(get_async_db)):
     """Get health status of all containers with detailed stats"""
-    from ..models.advertiser import Advertiser
-    from ..services.health_checker import get_container_stats
+    return await db.run_sync(get_all_container_stats)
+
+
+@router.get("/containers/{advertiser_id}/logs", response_model=List[HealthLogResponse])
+async def get_advertiser_logs(
+    advertiser_id: int,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    is_allowed: Optional[bool] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    referer_host: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get logs for a specific advertiser's container, newest first.
+
+    When more rows follow, the ``X-Next-Cursor`` header holds the cursor of
+    the next page (the ``cursor`` of the last row).
+    """
+    advertiser = await db.get(Advertiser, advertiser_id)
+    
+    if not advertiser:
+        raise HTTPException(status_code=404, detail="Advertiser not found")
+    
+    try:
+        after = decode_log_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    advertisers = db.query(Advertiser).all()
+    logs = await db.run_sync(
+        get_container_logs,
+        advertiser.container_id,
+        limit=limit + 1,
+        after=after,
+        is_allowed=is_allowed,
+        start=start,
+        end=end,
+        referer_host=referer_host
+    )
     
-    containers_health = []
-    for advertiser in advertisers:
-        stats = get_container_stats(db, advertiser.container_id)
-        containers_health.append({
-            "advertiser_id": advertiser.id,
-            "advertiser_name": advertiser.name,
-            **stats
-        })
+    page = []
+    for log in logs[:limit]:
+        item = HealthLogResponse.model_validate(log)
+        item.cursor = encode_log_cursor(log)
+        page.append(item)
+    if len(logs) > limit:
+        response.headers["X-Next-Cursor"] = page[-1].cursor
     
-    return containers_health
+    return page
 
 
-@router.get("/containers/{advertiser_id}/logs", response_model=List[HealthLogResponse])
-def get_advertiser_logs(advertiser_id: int, db: Session = Depends(get_db)):
-    """Get logs for a specific advertiser's container"""
-    from ..models.advertiser import Advertiser
+@router.get("/containers/{advertiser_id}/loads", response_model=LoadSeriesResponse)
+async def get_advertiser_loads(
+    advertiser_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: str = "hour",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get allowed/denied loads per hour or day (default: the last 7 days).
+
+    Served from the hourly rollups, never from raw logs.
+    """
+    advertiser = await db.get(Advertiser, advertiser_id)
     
-    advertiser = db.query(Advertiser).filter(Advertiser.id == advertiser_id).first()
+    if not advertiser:
+        raise HTTPException(status_code=404, detail="Advertiser not found")
+    
+    end = to_utc_naive(end) if end else datetime.utcnow()
+    start = to_utc_naive(start) if start else end - timedelta(days=7)
+    
+    try:
+        points = await db.run_sync(get_load_series, advertiser.container_id, start, end, interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return LoadSeriesResponse(
+        container_id=advertiser.container_id,
+        interval=interval,
+        start=start,
+        end=end,
+        points=points
+    )
+
+
+@router.get("/containers/{advertiser_id}/top", response_model=TopResponse)
+async def get_advertiser_top(
+    advertiser_id: int,
+    k: int = Query(10, ge=1, le=100),
+    days: int = Query(1, ge=1, le=90),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the top referer hosts, user agents and denied referer hosts of the
+    last ``days`` UTC days (1 = today).
+
+    Served from the periodic heavy hitter snapshots, so the latest
+    ``TOPK_SNAPSHOT_SECONDS`` of traffic are not included yet.
+    """
+    advertiser = await db.get(Advertiser, advertiser_id)
     
     if not advertiser:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Advertiser not found")
     
-    logs = get_container_logs(db, advertiser.container_id, limit=100)
+    end_day = datetime.utcnow().date()
+    start_day = end_day - timedelta(days=days - 1)
+    top = await db.run_sync(get_top_hitters, advertiser.container_id, start_day, end_day, k)
+    
+    return TopResponse(
+        container_id=advertiser.container_id,
+        start_day=start_day,
+        end_day=end_day,
+        **top
+    )
+
+
+@router.get("/containers/{advertiser_id}/archive", response_model=List[HealthLogResponse])
+def get_archived_logs(
+    advertiser_id: int,
+    start: datetime,
+    end: Optional[datetime] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """Get a container's logs from the archive segments, oldest first"""
+    advertiser = db.query(Advertiser).filter(Advertiser.id == advertiser_id).first()
+    
+    if not advertiser:
+        raise HTTPException(status_code=404, detail="Advertiser not found")
     
-    return logs
+    return read_archived_logs(
+        advertiser.container_id,
+        start,
+        end or datetime.utcnow(),
+        limit=limit
+    )
@@ -1,18 +1,62 @@
 from fastapi import APIRouter, Depends, Request, Response
-from sqlalchemy.orm import Session
-import json
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from urllib.parse import urlparse
+import math
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models.advertiser import Advertiser
-from ..models.health_log import HealthLog
-from ..services.container_generator import generate_loader_script, minify_js
+from ..services.compression import negotiate_encoding
+from ..services.domain_matcher import get_domain_matcher
+from ..services.container_generator import generate_bootstrap_script
+from ..services.loader_cache import CachedBundle, loader_cache, make_etag, render_loader_bundle
+from ..services.log_writer import log_writer
+from ..services.metrics import record_container_load, record_rate_limited
+from ..services.rate_limiter import loader_rate_limiter
 
 router = APIRouter(tags=["loader"])
 
+NOT_FOUND_JS = b"// TSPRTG: Container not found or inactive\n"
+NOT_FOUND_ETAG = make_etag(NOT_FOUND_JS)
+RATE_LIMITED_JS = b"// TSPRTG: Too many requests\n"
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET",
+    "Access-Control-Allow-Headers": "*"
+}
+
+# Domain-checked bootstrap, differs per referer. Every page view must reach
+# the backend, which logs the load: caches may store it but revalidate each
+# time, and a matching ETag gets an empty 304
+BOOTSTRAP_HEADERS = {
+    **CORS_HEADERS,
+    "Cache-Control": "no-cache",
+    "Vary": "Referer"
+}
+
+# Rate-limited bootstrap: nobody may cache the refusal
+RATE_LIMITED_HEADERS = {
+    **CORS_HEADERS,
+    "Cache-Control": "no-store"
+}
+
+# Content-addressed bundle: the URL changes whenever the content does
+BUNDLE_HEADERS = {
+    **CORS_HEADERS,
+    "Cache-Control": "public, max-age=31536000, immutable",
+    "Vary": "Accept-Encoding"
+}
+
 
 def is_domain_allowed(referer: str, allowed_domains: list) -> bool:
-    """Check if referer domain is in allowed domains list"""
+    """Check if referer domain is in allowed domains list
+
+    Linear reference implementation for ad-hoc lists. The loader endpoint
+    uses the compiled per-advertiser matcher from services.domain_matcher.
+    """
     if not referer:
         return False
     
@@ -41,64 +85,162 @@ def is_domain_allowed(referer: str, allowed_domains: list) -> bool:
         return False
 
 
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def js_response(request: Request, body: bytes, etag: str, headers: dict, encoding: str = None) -> Response:
+    """Build a JavaScript response, answering 304 when If-None-Match matches"""
+    headers = {**headers, "ETag": etag}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    
+    # Client (or nginx) already holds this exact representation
+    if etag_matches(request.headers.get('if-none-match', ''), etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(
+        content=body,
+        media_type="application/javascript",
+        headers=headers
+    )
+
+
+async def find_advertiser(db: AsyncSession, container_id: str) -> Optional[Advertiser]:
+    result = await db.execute(
+        select(Advertiser).where(Advertiser.container_id == container_id).limit(1)
+    )
+    return result.scalars().first()
+
+
+async def cached_bundle(advertiser: Advertiser) -> CachedBundle:
+    """The advertiser's bundle from the cache; a miss is rendered in the threadpool"""
+    bundle = loader_cache.get(advertiser.container_id)
+    if bundle is None:
+        bundle = await run_in_threadpool(render_loader_bundle, advertiser)
+    return bundle
+
+
 @router.get("/c/{container_id}/l.js")
-def load_container(
+async def load_container(
     container_id: str,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Public endpoint to load container JavaScript"""
+    """Public endpoint to load the container bootstrap.
+
+    The bootstrap is the only domain-checked response. It is a tiny script
+    that injects the immutable, content-addressed bundle
+    ``/c/{container_id}/{hash}.js``. Its body depends on the Referer, so it
+    carries ``Vary: Referer`` (nginx keys its cache on the referer host).
+
+    Runs on the event loop with the async engine, so concurrency is not
+    capped by the threadpool. Requests over the per-IP or per-container
+    rate get a 429 without touching the database or the health log.
+    """
+    ip_address = request.client.host if request.client else None
+    limit, retry_after = loader_rate_limiter.check(ip_address, container_id)
+    if limit is not None:
+        record_rate_limited(limit)
+        return Response(
+            content=RATE_LIMITED_JS,
+            status_code=429,
+            media_type="application/javascript",
+            headers={**RATE_LIMITED_HEADERS, "Retry-After": str(math.ceil(retry_after))}
+        )
     
     # Get advertiser by container_id
-    advertiser = db.query(Advertiser).filter(
-        Advertiser.container_id == container_id
-    ).first()
+    advertiser = await find_advertiser(db, container_id)
     
     # Get request info
     referer = request.headers.get('referer', '')
-    ip_address = request.client.host if request.client else None
     user_agent = request.headers.get('user-agent', '')
     
     # Default response
-    js_code = "// TSPRTG: Container not found or inactive\n"
+    js_code = NOT_FOUND_JS
+    etag = NOT_FOUND_ETAG
     is_allowed = False
     
     if advertiser:
-        # Parse allowed domains with error handling
-        try:
-            allowed_domains = json.loads(advertiser.domains) if advertiser.domains else []
-        except json.JSONDecodeError:
-            # If JSON parsing fails, treat as no domains configured
-            allowed_domains = []
-        
         # Check if domain is allowed and advertiser is active
-        is_allowed = is_domain_allowed(referer, allowed_domains) and advertiser.is_active
+        is_allowed = advertiser.is_active and get_domain_matcher(advertiser).matches(referer)
         
         if is_allowed:
-            # Generate loader script
-            js_code = generate_loader_script(db, advertiser)
-            # Minify the code
-            js_code = minify_js(js_code)
+            # Rendered and minified bundle, served from the in-memory cache
+            bundle = await cached_bundle(advertiser)
+            bundle_url = f"//{request.url.netloc}/c/{container_id}/{bundle.content_hash}.js"
+            js_code = generate_bootstrap_script(bundle_url).encode('utf-8')
+            etag = make_etag(js_code)
     
-    # Log the request
-    log_entry = HealthLog(
+    # Log the request (written in batches by the background log writer)
+    log_row = dict(
         container_id=container_id,
         referer=referer,
         ip_address=ip_address,
         user_agent=user_agent,
         is_allowed=is_allowed
     )
-    db.add(log_entry)
-    db.commit()
+    if log_writer.may_block:
+        # Waiting for room in a full queue must not stall the event loop
+        await run_in_threadpool(log_writer.submit, **log_row)
+    else:
+        log_writer.submit(**log_row)
+    record_container_load(advertiser.container_id if advertiser else None, is_allowed)
     
-    # Return JavaScript with appropriate headers
+    return js_response(request, js_code, etag, BOOTSTRAP_HEADERS)
+
+
+def bundle_not_found() -> Response:
     return Response(
-        content=js_code,
+        content=NOT_FOUND_JS,
+        status_code=404,
         media_type="application/javascript",
-        headers={
-            "Cache-Control": "public, max-age=300",  # 5 minutes cache
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET",
-            "Access-Control-Allow-Headers": "*"
-        }
+        headers={**BUNDLE_HEADERS, "Cache-Control": "no-store"}
     )
+
+
+@router.get("/c/{container_id}/{bundle_hash}.js")
+async def load_bundle(
+    container_id: str,
+    bundle_hash: str,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Public endpoint serving the immutable, content-addressed container bundle.
+
+    Only the hash handed out by a domain-checked bootstrap is served: the
+    current one, or one invalidated recently enough for a page that had
+    just run the previous bootstrap to still request it. Any other hash is a 404, never a redirect to the
+    current bundle, which would bypass the referer allowlist.
+    """
+    bundle = loader_cache.get(container_id)
+    
+    if bundle is None:
+        advertiser = await find_advertiser(db, container_id)
+        
+        if not advertiser or not advertiser.is_active:
+            return bundle_not_found()
+        
+        bundle = await run_in_threadpool(render_loader_bundle, advertiser)
+    
+    if bundle.content_hash != bundle_hash:
+        bundle = loader_cache.get_retired(container_id, bundle_hash)
+        if bundle is None:
+            return bundle_not_found()
+    
+    # Pick a precompressed variant; nothing is compressed per request
+    encoding = negotiate_encoding(request.headers.get('accept-encoding', ''), bundle.variants)
+    js_code, etag = bundle.representation(encoding)
+    
+    return js_response(request, js_code, etag, BUNDLE_HEADERS, encoding)
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..schemas.schemas import PublishResponse
+from ..services.publisher import PublishInProgress, publish, read_manifest
+
+router = APIRouter(prefix="/api/publish", tags=["publish"])
+
+
+@router.post("", response_model=PublishResponse)
+def publish_bundles(full: bool = False, db: Session = Depends(get_db)):
+    """Pre-render changed container bundles (all of them with ?full=true) to disk"""
+    try:
+        result = publish(db, full=full)
+    except PublishInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PublishResponse(**result)
+
+
+@router.get("")
+def get_publish_status():
+    """Get the time and size of the last static publish"""
+    manifest = read_manifest()
+    return {
+        "published_at": manifest.get("published_at"),
+        "containers": len(manifest.get("containers", {}))
+    }
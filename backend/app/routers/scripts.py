@@ -5,6 +5,8 @@ from typing import List
 from ..database import get_db
 from ..models.script import Script
 from ..schemas.schemas import ScriptCreate, ScriptUpdate, ScriptResponse
+from ..services.config_version import record_config_change
+from ..services.loader_cache import invalidate_script_change
 
 router = APIRouter(prefix="/api/scripts", tags=["scripts"])
 
@@ -32,8 +34,10 @@ def create_script(script: ScriptCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_script)
+    record_config_change(db, db_script.advertiser_id)
     db.commit()
     db.refresh(db_script)
+    invalidate_script_change(db_script.advertiser_id)
     
     return db_script
 
@@ -77,8 +81,10 @@ def update_script(
     if script_update.is_defer is not None:
         db_script.is_defer = script_update.is_defer
     
+    record_config_change(db, db_script.advertiser_id)
     db.commit()
     db.refresh(db_script)
+    invalidate_script_change(db_script.advertiser_id)
     
     return db_script
 
@@ -91,8 +97,11 @@ def delete_script(script_id: int, db: Session = Depends(get_db)):
     if not db_script:
         raise HTTPException(status_code=404, detail="Script not found")
     
+    advertiser_id = db_script.advertiser_id
     db.delete(db_script)
+    record_config_change(db, advertiser_id)
     db.commit()
+    invalidate_script_change(advertiser_id)
     
     return {"message": "Script deleted successfully"}
 
@@ -106,7 +115,9 @@ def toggle_script(script_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Script not found")
     
     db_script.is_enabled = not db_script.is_enabled
+    record_config_change(db, db_script.advertiser_id)
     db.commit()
     db.refresh(db_script)
+    invalidate_script_change(db_script.advertiser_id)
     
     return db_script
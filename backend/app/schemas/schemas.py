@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Dict
+from datetime import date, datetime
 
 
 # Advertiser Schemas
@@ -65,20 +65,79 @@ class ScriptResponse(ScriptBase):
         from_attributes = True
 
 
+# Bulk Configuration Import/Export
+class ConfigAdvertiser(AdvertiserBase):
+    # Existing advertisers are matched on it; a new one is generated if empty
+    container_id: Optional[str] = None
+    scripts: List[ScriptBase] = Field(default_factory=list)
+
+
+class ConfigDocument(BaseModel):
+    # Omit on import to leave global scripts untouched
+    global_scripts: Optional[List[ScriptBase]] = None
+    advertisers: List[ConfigAdvertiser] = Field(default_factory=list)
+
+
+class ConfigImportResponse(BaseModel):
+    advertisers_created: int
+    advertisers_updated: int
+    scripts_created: int
+    scripts_updated: int
+    scripts_unchanged: int
+    scripts_deleted: int
+    dry_run: bool = False
+
+
 # Health Log Schemas
 class HealthLogResponse(BaseModel):
     id: int
     container_id: str
     referer: Optional[str] = None
+    referer_host: Optional[str] = None
     ip_address: Optional[str] = None
     user_agent: Optional[str] = None
     is_allowed: bool
     created_at: datetime
+    # Position of this row; pass as ``cursor`` to continue after it
+    cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+# Top referers / user agents
+class TopItem(BaseModel):
+    value: str
+    count: int
+    # The true count is between count - error and count
+    error: int
+
+
+class TopResponse(BaseModel):
+    container_id: str
+    start_day: date
+    end_day: date
+    referers: List[TopItem]
+    user_agents: List[TopItem]
+    denied_referers: List[TopItem]
+
+
+# Load Time Series
+class LoadPoint(BaseModel):
+    bucket_start: datetime
+    allowed: int
+    denied: int
+    total: int
+
+
+class LoadSeriesResponse(BaseModel):
+    container_id: str
+    interval: str  # 'hour' or 'day'
+    start: datetime
+    end: datetime
+    points: List[LoadPoint]
+
+
 # Container Code Response
 class ContainerCodeResponse(BaseModel):
     container_id: str
@@ -92,6 +151,18 @@ class StatsResponse(BaseModel):
     loads_week: int
     last_load: Optional[datetime] = None
     status: str  # 'active', 'inactive', 'never'
+    # Distinct visitors (IP + user agent) of the current UTC day and the last
+    # 7 / 30 UTC days, estimated with HyperLogLog sketches. uniques_error is
+    # the relative standard error (0.0163): about 95% of estimates are within
+    # twice that of the true count.
+    uniques_today: int = 0
+    uniques_week: int = 0
+    uniques_month: int = 0
+    uniques_error: float = 0.0
+    # Loader bundle size and precompressed variant sizes/savings per encoding
+    bundle_bytes: Optional[int] = None
+    compressed_bytes: Dict[str, int] = Field(default_factory=dict)
+    bytes_saved: Dict[str, int] = Field(default_factory=dict)
 
 
 # Health Status Response
@@ -101,3 +172,15 @@ class HealthStatusResponse(BaseModel):
     active_containers: int
     inactive_containers: int
     never_loaded_containers: int
+
+
+# Static Publish Response
+class PublishResponse(BaseModel):
+    publish_dir: str
+    published_at: str
+    total: int
+    rendered: int
+    unchanged: int
+    removed: int
+    bytes_written: int
+    duration_ms: float
@@ -0,0 +1,221 @@
+"""Pre-fork process supervisor for the API server (used by ``run.py``).
+
+The master process prepares the database, binds the listening socket once
+and starts ``WEB_WORKERS`` uvicorn worker processes that all accept on it;
+the kernel spreads connections between them. Workers are started with the
+``spawn`` method, so each one imports the application afresh.
+
+* A worker only counts as ready once its startup handlers have run
+  (database, config watcher, loader cache warm-up, background threads),
+  right before it starts accepting connections.
+* SIGHUP restarts the workers one at a time: a replacement is started and
+  must be ready before the old worker gets SIGTERM. uvicorn then stops
+  accepting, finishes in-flight requests (up to ``WEB_GRACEFUL_TIMEOUT``
+  seconds) and flushes the health log queue. New code and ``.env``
+  settings are picked up this way without refusing or dropping requests.
+* A worker that exits unexpectedly is replaced.
+* SIGTERM or SIGINT stops all workers gracefully and exits.
+
+Workers share their metrics through a scratch ``METRICS_DIR`` so that any
+of them can answer ``/metrics`` for all; the master keeps the counters of
+the workers it has stopped or lost (see ``services.metrics``).
+"""
+from multiprocessing.connection import wait
+from typing import List, Optional
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+APP = "app.main:app"
+
+# How long a new worker may take to become ready
+READY_TIMEOUT = 120
+# Pause before replacing a worker that died, so a crash loop does not spin
+RESPAWN_DELAY = 1.0
+
+_spawn = multiprocessing.get_context("spawn")
+
+
+class _WorkerServer(uvicorn.Server):
+    """uvicorn server that reports when it starts accepting connections"""
+
+    def __init__(self, config: uvicorn.Config, ready):
+        super().__init__(config)
+        self.ready = ready
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            self.ready.set()
+
+    async def shutdown(self, sockets=None) -> None:
+        # Event streams never end on their own and would hold up the
+        # graceful shutdown until it times out
+        from .services.live_events import live_events
+        live_events.close()
+        await super().shutdown(sockets=sockets)
+
+
+def _serve(sock: socket.socket, ready, graceful_timeout: int) -> None:
+    """Worker process entry point"""
+    # Reloads are the master's business
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    config = uvicorn.Config(APP, timeout_graceful_shutdown=graceful_timeout or None)
+    _WorkerServer(config, ready).run(sockets=[sock])
+
+
+class Worker:
+    def __init__(self, sock: socket.socket, graceful_timeout: int):
+        self.graceful_timeout = graceful_timeout
+        self.ready = _spawn.Event()
+        self.process = _spawn.Process(
+            target=_serve, args=(sock, self.ready, graceful_timeout), name="tsprtg-worker", daemon=False
+        )
+        self.process.start()
+        self.stopping = False
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Wait until the worker accepts connections; False if it died or timed out"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.ready.wait(0.1):
+                return True
+            if not self.process.is_alive():
+                return False
+        return False
+
+    def terminate(self) -> None:
+        self.stopping = True
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def join(self) -> None:
+        """Wait for a terminated worker, killing it if it outlives the grace period"""
+        self.process.join(self.graceful_timeout + 5)
+        if self.process.is_alive():
+            logger.warning("Worker %s did not stop in time, killing it", self.pid)
+            self.process.kill()
+            self.process.join()
+
+
+class Supervisor:
+    def __init__(self, host: str, port: int, workers: int, graceful_timeout: int, backlog: int = 2048):
+        self.host = host
+        self.port = port
+        self.count = workers if workers > 0 else (os.cpu_count() or 1)
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.workers: List[Worker] = []
+        self.metrics = None
+        self._reload = False
+        self._exit = False
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        sock.set_inheritable(True)
+        return sock
+
+    def _prepare_database(self) -> None:
+        """Create tables and indexes once, before workers race to do it"""
+        from .main import app  # noqa: F401  (registers every model)
+        from .database import engine, init_db, writer_engine
+        init_db()
+        # Workers open their own connections
+        engine.dispose()
+        writer_engine.dispose()
+
+    def _share_metrics(self) -> None:
+        """Give the workers, which inherit the environment, a metrics directory"""
+        from .services.metrics import SharedMetrics
+        directory = tempfile.mkdtemp(prefix="tsprtg-metrics-")
+        os.environ["METRICS_DIR"] = directory
+        self.metrics = SharedMetrics(directory)
+
+    def _retire(self, worker: Worker) -> None:
+        try:
+            self.metrics.retire(worker.pid)
+        except Exception:
+            logger.exception("Could not keep the metrics of worker %s", worker.pid)
+
+    def _on_reload(self, signum, frame) -> None:
+        self._reload = True
+
+    def _on_exit(self, signum, frame) -> None:
+        self._exit = True
+
+    def run(self) -> int:
+        self._prepare_database()
+        self.sock = self._bind()
+        self._share_metrics()
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTERM, self._on_exit)
+        signal.signal(signal.SIGINT, self._on_exit)
+        logger.info("Listening on %s:%d with %d workers (master %d)", self.host, self.port, self.count, os.getpid())
+        try:
+            self.workers = [Worker(self.sock, self.graceful_timeout) for _ in range(self.count)]
+            for worker in self.workers:
+                if not worker.wait_ready(READY_TIMEOUT):
+                    logger.error("Worker %s failed to start", worker.pid)
+                    return 1
+            while not self._exit:
+                if self._reload:
+                    self._reload = False
+                    self.rolling_restart()
+                self._replace_dead()
+                wait([worker.process.sentinel for worker in self.workers], timeout=0.5)
+            return 0
+        finally:
+            self._stop_all()
+            self.sock.close()
+            shutil.rmtree(self.metrics.directory, ignore_errors=True)
+
+    def rolling_restart(self) -> None:
+        """Replace every worker by a new one, one at a time"""
+        logger.info("Restarting %d workers", len(self.workers))
+        for index, old in enumerate(list(self.workers)):
+            if self._exit:
+                return
+            new = Worker(self.sock, self.graceful_timeout)
+            if not new.wait_ready(READY_TIMEOUT):
+                # Keep the old workers serving rather than run short
+                logger.error("New worker %s failed to start, restart aborted", new.pid)
+                new.terminate()
+                new.join()
+                self._retire(new)
+                return
+            self.workers[index] = new
+            old.terminate()
+            old.join()
+            self._retire(old)
+        logger.info("Workers restarted")
+
+    def _replace_dead(self) -> None:
+        for index, worker in enumerate(self.workers):
+            if worker.process.is_alive() or worker.stopping or self._exit:
+                continue
+            logger.warning("Worker %s exited with code %s, starting a new one", worker.pid, worker.process.exitcode)
+            self._retire(worker)
+            time.sleep(RESPAWN_DELAY)
+            self.workers[index] = Worker(self.sock, self.graceful_timeout)
+
+    def _stop_all(self) -> None:
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,173 @@
+"""Paginated, searchable advertiser listing.
+
+Pages are read with keyset pagination on the sort column plus ``id``, so
+every page is an index range scan whatever its depth. ``created_at`` order
+is ``id`` order, which follows creation time.
+
+A search term matches advertisers whose name or allowed domains contain
+words starting with it (through the ``advertisers_fts`` FTS5 index, or a
+LIKE scan where FTS5 is unavailable) or whose container_id starts with it.
+
+Rows are written straight to JSON, without a Pydantic model per row.
+``domains`` is stored as JSON text: it is parsed and re-serialized, keeping
+only its strings, and a value that is not a JSON list is sent as ``[]``,
+so a malformed row can not break or inject into the response.
+"""
+from typing import List, Optional, Tuple
+import base64
+import json
+import re
+
+from sqlalchemy import and_, column, or_, select, table, text, union_all
+from sqlalchemy.orm import Session
+
+from ..models.advertiser import SEARCH_TABLE, Advertiser
+
+SORTS = {
+    'created_at': Advertiser.id,
+    'name': Advertiser.name,
+    'container_id': Advertiser.container_id,
+}
+
+LIST_COLUMNS = (
+    Advertiser.id, Advertiser.name, Advertiser.container_id, Advertiser.domains,
+    Advertiser.is_active, Advertiser.created_at, Advertiser.updated_at,
+)
+
+_WORD = re.compile(r'\w+')
+
+# Whether the FTS5 table exists, per database URL
+_search_index = {}
+
+
+def encode_advertiser_cursor(sort: str, row) -> str:
+    """Opaque cursor pointing just past ``row`` in ``sort`` order"""
+    value = row.id if sort == 'created_at' else getattr(row, sort)
+    raw = json.dumps([sort, value, row.id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_advertiser_cursor(cursor: str, sort: str) -> Tuple[object, int]:
+    """Inverse of encode_advertiser_cursor; raises ValueError on malformed input
+    or on a cursor of another sort order"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, advertiser_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort or not isinstance(advertiser_id, int):
+        raise ValueError("Invalid cursor")
+    return value, advertiser_id
+
+
+def _has_search_index(db: Session) -> bool:
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _search_index:
+        _search_index[key] = bind.dialect.name == 'sqlite' and db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_TABLE}
+        ).first() is not None
+    return _search_index[key]
+
+
+def _search_condition(db: Session, q: str, id_order: Optional[Tuple[int, Optional[int], bool]] = None):
+    """Filter matching ``q``.
+
+    In ``created_at`` (id) order, ``id_order`` is (limit, after id,
+    descending): both lookups then stop after ``limit`` ids in that order,
+    instead of collecting every match of a common word before sorting.
+    """
+    # container_id prefix, as a range so the unique index is used
+    prefixed = and_(Advertiser.container_id >= q, Advertiser.container_id < q + '\uffff')
+    words = _WORD.findall(q.lower())
+    if not words:
+        return prefixed
+    if not _has_search_index(db):
+        pattern = f"%{q}%"
+        return or_(Advertiser.name.ilike(pattern), Advertiser.domains.ilike(pattern), prefixed)
+
+    fts = table(SEARCH_TABLE, column('rowid'))
+    # One phrase, last word as a prefix: "shop.co" -> "shop co"*
+    matches = select(fts.c.rowid).where(
+        text(f"{SEARCH_TABLE} MATCH :match").bindparams(match='"' + ' '.join(words) + '"*')
+    )
+    by_container = select(Advertiser.id).where(prefixed)
+    if id_order is not None:
+        limit, after_id, descending = id_order
+        if after_id is not None:
+            matches = matches.where(fts.c.rowid < after_id if descending else fts.c.rowid > after_id)
+            by_container = by_container.where(
+                Advertiser.id < after_id if descending else Advertiser.id > after_id
+            )
+        matches = select(
+            matches.order_by(fts.c.rowid.desc() if descending else fts.c.rowid).limit(limit).subquery()
+        )
+        by_container = select(
+            by_container.order_by(Advertiser.id.desc() if descending else Advertiser.id).limit(limit).subquery()
+        )
+    # A single IN over both lookups; with OR, SQLite merges and sorts every match
+    return Advertiser.id.in_(union_all(matches, by_container))
+
+
+def list_advertisers_page(
+    db: Session,
+    limit: int = 50,
+    sort: str = 'created_at',
+    descending: bool = False,
+    after: Optional[Tuple[object, int]] = None,
+    q: Optional[str] = None
+) -> List:
+    """Up to ``limit`` rows of ``LIST_COLUMNS`` following ``after``"""
+    column = SORTS[sort]
+    query = db.query(*LIST_COLUMNS)
+    if q:
+        id_order = None
+        if column is Advertiser.id:
+            id_order = (limit, after[1] if after else None, descending)
+        query = query.filter(_search_condition(db, q, id_order))
+
+    if after is not None:
+        value, advertiser_id = after
+        if column is Advertiser.id:
+            query = query.filter(Advertiser.id < advertiser_id if descending else Advertiser.id > advertiser_id)
+        # Written as a bounded range plus a tie-break: SQLite turns the
+        # equivalent "a > x OR (a = x AND id > y)" into a full index scan
+        elif descending:
+            query = query.filter(column <= value, or_(column < value, Advertiser.id < advertiser_id))
+        else:
+            query = query.filter(column >= value, or_(column > value, Advertiser.id > advertiser_id))
+
+    if column is Advertiser.id:
+        order = [Advertiser.id.desc() if descending else Advertiser.id]
+    else:
+        order = [column.desc(), Advertiser.id.desc()] if descending else [column, Advertiser.id]
+    return query.order_by(*order).limit(limit).all()
+
+
+def _timestamp(value) -> str:
+    return json.dumps(value.isoformat()) if value is not None else 'null'
+
+
+def _domains(raw_domains) -> str:
+    """The stored domains as a JSON list of strings; ``[]`` if they do not parse"""
+    try:
+        domains = json.loads(raw_domains) if raw_domains else []
+    except json.JSONDecodeError:
+        domains = []
+    if not isinstance(domains, list):
+        domains = []
+    return json.dumps([domain for domain in domains if isinstance(domain, str)])
+
+
+def render_advertisers_json(rows) -> bytes:
+    """Serialize rows of ``LIST_COLUMNS`` like a list of ``AdvertiserResponse``"""
+    dumps = json.dumps
+    items = [
+        f'{{"name":{dumps(row.name)},"domains":{_domains(row.domains)},'
+        f'"is_active":{"true" if row.is_active else "false"},"id":{row.id},'
+        f'"container_id":{dumps(row.container_id)},"created_at":{_timestamp(row.created_at)},'
+        f'"updated_at":{_timestamp(row.updated_at)}}}'
+        for row in rows
+    ]
+    return ('[' + ','.join(items) + ']').encode('utf-8')
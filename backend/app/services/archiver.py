@@ -0,0 +1,231 @@
+"""Retention for health_logs: archive old rows into compressed segment files.
+
+Rows older than ``LOG_RETENTION_DAYS`` are moved, oldest first, into
+append-only gzip NDJSON segments partitioned by UTC day::
+
+    {archive_dir}/health_logs/2024-05-01/000000012345-000000061234.ndjson.gz
+
+A segment is named after the id range it holds and is written (and
+fsynced) before its rows are deleted. Deletes run in transactions of
+``ARCHIVE_DELETE_BATCH`` rows so the loader's log writer is never blocked
+for long. If a run is interrupted between the two steps, the next one
+rewrites the same segment and readers skip ids they have already seen.
+
+Container statistics come from the hourly rollups, which are kept.
+"""
+from datetime import date, datetime, timedelta
+from threading import Event, Thread
+from typing import Dict, Iterator, List, Optional
+import fcntl
+import gzip
+import json
+import logging
+import os
+import time
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.health_log import HealthLog
+from .publisher import write_atomic
+from .rollups import to_utc_naive
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+LOCK_NAME = '.archive.lock'
+
+_COLUMNS = ('id', 'container_id', 'referer', 'ip_address', 'user_agent', 'is_allowed', 'created_at')
+
+
+class ArchiveInProgress(RuntimeError):
+    """Raised when another process is archiving into the same directory"""
+
+
+def _segments_root(archive_dir: str) -> str:
+    return os.path.join(archive_dir, 'health_logs')
+
+
+def _encode_row(row) -> bytes:
+    record = dict(zip(_COLUMNS, row))
+    record['is_allowed'] = bool(record['is_allowed'])
+    record['created_at'] = record['created_at'].isoformat()
+    return json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _write_segments(archive_dir: str, rows: List) -> int:
+    """Write rows (sorted by id) into one segment per UTC day; return the count"""
+    by_day: Dict[date, List] = {}
+    for row in rows:
+        by_day.setdefault(row[6].date(), []).append(row)
+
+    for day, day_rows in by_day.items():
+        directory = os.path.join(_segments_root(archive_dir), day.isoformat())
+        os.makedirs(directory, exist_ok=True)
+        name = f"{day_rows[0][0]:012d}-{day_rows[-1][0]:012d}{SEGMENT_SUFFIX}"
+        data = gzip.compress(b''.join(_encode_row(row) for row in day_rows), compresslevel=6, mtime=0)
+        write_atomic(os.path.join(directory, name), data, fsync=True)
+    return len(by_day)
+
+
+def _delete_archived(session_factory, ids: List[int], batch_size: int) -> None:
+    """Delete archived ids in short transactions (ids are a contiguous id-ordered run)"""
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        db = session_factory()
+        try:
+            db.query(HealthLog).filter(
+                HealthLog.id >= chunk[0],
+                HealthLog.id <= chunk[-1]
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+def archive_old_logs(
+    retention_days: Optional[int] = None,
+    archive_dir: Optional[str] = None,
+    session_factory=SessionLocal,
+    now: Optional[datetime] = None
+) -> Dict:
+    """Move health logs older than the retention period into segment files.
+
+    Rows are read in id order, which follows creation time, and the run
+    stops at the first row that is still within the retention period, so
+    it only ever touches rows it archives.
+    """
+    retention_days = settings.log_retention_days if retention_days is None else retention_days
+    archive_dir = os.path.abspath(archive_dir or settings.archive_dir)
+    if retention_days <= 0:
+        return {'rows_archived': 0, 'segments_written': 0, 'duration_ms': 0.0}
+
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    os.makedirs(_segments_root(archive_dir), exist_ok=True)
+
+    lock_file = open(os.path.join(archive_dir, LOCK_NAME), 'w')
+    try:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ArchiveInProgress("Another archive run is in progress")
+
+        started = time.perf_counter()
+        archived = 0
+        segments = 0
+        last_id = 0
+        while True:
+            db = session_factory()
+            try:
+                rows = db.query(*[getattr(HealthLog, column) for column in _COLUMNS]).filter(
+                    HealthLog.id > last_id
+                ).order_by(HealthLog.id).limit(settings.archive_segment_rows).all()
+            finally:
+                db.close()
+
+            expired = []
+            for row in rows:
+                if row[6] is None or row[6] >= cutoff:
+                    break
+                expired.append(row)
+            if not expired:
+                break
+
+            segments += _write_segments(archive_dir, expired)
+            ids = [row[0] for row in expired]
+            _delete_archived(session_factory, ids, settings.archive_delete_batch)
+            archived += len(expired)
+            last_id = ids[-1]
+            if len(expired) < len(rows):
+                break
+    finally:
+        lock_file.close()
+
+    return {
+        'rows_archived': archived,
+        'segments_written': segments,
+        'cutoff': cutoff.isoformat(),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def _segment_files(archive_dir: str, start: datetime, end: datetime) -> Iterator[str]:
+    root = _segments_root(archive_dir)
+    if not os.path.isdir(root):
+        return
+    first, last = start.date().isoformat(), end.date().isoformat()
+    for day in sorted(os.listdir(root)):
+        if first <= day <= last:
+            directory = os.path.join(root, day)
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(SEGMENT_SUFFIX):
+                    yield os.path.join(directory, name)
+
+
+def read_archived_logs(
+    container_id: str,
+    start: datetime,
+    end: datetime,
+    limit: int = 1000,
+    archive_dir: Optional[str] = None
+) -> List[Dict]:
+    """Return archived log rows of a container in [start, end), oldest first"""
+    archive_dir = os.path.abspath(archive_dir or settings.archive_dir)
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    # Cheap pre-filter before parsing a line
+    needle = ('"container_id":' + json.dumps(container_id) + ',').encode('utf-8')
+
+    results: List[Dict] = []
+    seen = set()
+    for path in _segment_files(archive_dir, start, end):
+        with gzip.open(path, 'rb') as segment:
+            for line in segment:
+                if needle not in line:
+                    continue
+                record = json.loads(line)
+                created_at = datetime.fromisoformat(record['created_at'])
+                if not (start <= created_at < end) or record['id'] in seen:
+                    continue
+                seen.add(record['id'])
+                record['created_at'] = created_at
+                results.append(record)
+                if len(results) >= limit:
+                    return results
+    return results
+
+
+class RetentionWorker:
+    """Background thread that runs archive_old_logs every ``interval_minutes``"""
+
+    def __init__(self, interval_minutes: int):
+        self.interval = interval_minutes * 60
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self.last_result: Optional[Dict] = None
+
+    def start(self) -> None:
+        if settings.log_retention_days <= 0 or self.interval <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='health-log-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_result = archive_old_logs()
+            except ArchiveInProgress:
+                # Another worker process is on it
+                continue
+            except Exception:
+                logger.exception("Health log archiving failed")
+
+
+retention_worker = RetentionWorker(settings.archive_interval_minutes)
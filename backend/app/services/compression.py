@@ -0,0 +1,86 @@
+from typing import Dict, Iterable, Optional
+import gzip
+
+# Optional encoders: brotli and zstd are used only when their libraries are
+# installed; gzip is always available from the standard library.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Server preference when the client accepts several encodings equally
+ENCODING_PREFERENCE = ('br', 'zstd', 'gzip')
+
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=11)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=19).compress(body)
+    # mtime=0 keeps the output (and its ETag) deterministic
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def available_encodings() -> tuple:
+    """Content codings that can be produced in this environment"""
+    encodings = []
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+    encodings.append('gzip')
+    return tuple(encodings)
+
+
+def compress_variants(body: bytes) -> Dict[str, bytes]:
+    """Compress a body once with every available encoder at a high level.
+
+    Variants that are not smaller than the identity body are skipped.
+    """
+    variants = {}
+    for encoding in available_encodings():
+        compressed = _compress(encoding, body)
+        if len(compressed) < len(body):
+            variants[encoding] = compressed
+    return variants
+
+
+def negotiate_encoding(accept_encoding: str, available: Iterable[str]) -> Optional[str]:
+    """Pick the best available content coding for an Accept-Encoding header.
+
+    Returns None when the identity body should be sent.
+    """
+    if not accept_encoding:
+        return None
+
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding] = quality
+
+    best = None
+    best_quality = 0.0
+    available = set(available)
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in available:
+            continue
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best = encoding
+            best_quality = quality
+    return best
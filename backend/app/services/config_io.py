@@ -0,0 +1,188 @@
+"""Bulk import and export of the advertiser and script configuration.
+
+The whole configuration is one JSON document: global scripts plus every
+advertiser (keyed by ``container_id``) with its domains and scripts. An
+import is applied in a single transaction, with a few set-based statements
+instead of one commit per object:
+
+* advertisers are upserted on ``container_id`` (advertisers without one get
+  a fresh id, checked against the existing ones in memory, so there is no
+  collision retry loop);
+* scripts are matched by owner and name: existing ones that differ are
+  updated in bulk by primary key, the others inserted in bulk;
+* with ``prune``, scripts of the imported owners that are not in the
+  document are deleted (advertisers are never deleted). Global scripts
+  are only imported, or pruned, when ``global_scripts`` is present.
+
+Either everything is applied or nothing is.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models.advertiser import Advertiser, generate_container_id
+from ..models.script import Script
+from ..schemas.schemas import ConfigDocument
+
+SCRIPT_FIELDS = ('name', 'script_type', 'content', 'is_enabled', 'priority', 'is_async', 'is_defer')
+
+# Stays below SQLite's bound parameter limit in IN (...) lists
+_CHUNK = 500
+
+
+class ConfigImportError(ValueError):
+    """The document is consistent with the schema but cannot be applied"""
+
+
+def _chunks(items: List, size: int = _CHUNK) -> Iterable[List]:
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+def export_config(db: Session) -> Dict:
+    """The full configuration as a ``ConfigDocument``-shaped dict"""
+    columns = [getattr(Script, field) for field in SCRIPT_FIELDS]
+    scripts: Dict[Optional[int], List[Dict]] = {}
+    for advertiser_id, *values in db.query(Script.advertiser_id, *columns).order_by(Script.priority, Script.id):
+        scripts.setdefault(advertiser_id, []).append(dict(zip(SCRIPT_FIELDS, values)))
+
+    advertisers = []
+    for advertiser_id, container_id, name, domains, is_active in db.query(
+        Advertiser.id, Advertiser.container_id, Advertiser.name, Advertiser.domains, Advertiser.is_active
+    ).order_by(Advertiser.id):
+        advertisers.append({
+            'container_id': container_id,
+            'name': name,
+            'domains': json.loads(domains) if domains else [],
+            'is_active': is_active,
+            'scripts': scripts.get(advertiser_id, []),
+        })
+    return {'global_scripts': scripts.get(None, []), 'advertisers': advertisers}
+
+
+def _check_unique_names(owner: str, scripts) -> None:
+    names = set()
+    for script in scripts:
+        if script.name in names:
+            raise ConfigImportError(f"duplicate script name {script.name!r} in {owner}")
+        names.add(script.name)
+
+
+def _upsert_advertisers(db: Session, rows: List[Dict]) -> None:
+    if db.get_bind().dialect.name == 'postgresql':
+        stmt = postgresql.insert(Advertiser)
+    else:
+        stmt = sqlite.insert(Advertiser)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['container_id'],
+        set_={
+            'name': stmt.excluded.name,
+            'domains': stmt.excluded.domains,
+            'is_active': stmt.excluded.is_active,
+            'updated_at': func.now(),
+        }
+    )
+    for chunk in _chunks(rows):
+        db.execute(stmt, chunk)
+
+
+def import_config(db: Session, document: ConfigDocument, prune: bool = False) -> Dict:
+    """Apply ``document`` (without committing) and return what was changed"""
+    container_ids = [a.container_id for a in document.advertisers if a.container_id]
+    if len(container_ids) != len(set(container_ids)):
+        raise ConfigImportError("duplicate container_id in advertisers")
+    _check_unique_names("global_scripts", document.global_scripts or [])
+    for advertiser in document.advertisers:
+        _check_unique_names(f"advertiser {advertiser.container_id or advertiser.name!r}", advertiser.scripts)
+
+    # Read on the writer connection, inside the import transaction
+    db.use_writer()
+    existing = dict(db.execute(select(Advertiser.container_id, Advertiser.id)).all())
+    taken = set(existing)
+
+    advertiser_rows = []
+    for advertiser in document.advertisers:
+        container_id = advertiser.container_id
+        if not container_id:
+            container_id = generate_container_id()
+            while container_id in taken:
+                container_id = generate_container_id()
+            taken.add(container_id)
+        advertiser_rows.append({
+            'container_id': container_id,
+            'name': advertiser.name,
+            'domains': json.dumps(advertiser.domains),
+            'is_active': advertiser.is_active,
+        })
+    created = sum(1 for row in advertiser_rows if row['container_id'] not in existing)
+    _upsert_advertisers(db, advertiser_rows)
+
+    ids = dict(existing)
+    new_ids = [row['container_id'] for row in advertiser_rows if row['container_id'] not in existing]
+    for chunk in _chunks(new_ids):
+        ids.update(db.execute(
+            select(Advertiser.container_id, Advertiser.id)
+            .where(Advertiser.container_id.in_(chunk))
+        ).all())
+
+    # Scripts of every owner in the document, keyed by (owner, name)
+    wanted: Dict[Tuple[Optional[int], str], Dict] = {}
+    # Global scripts are only touched when the document has the key
+    owners: List[Optional[int]] = [None] if document.global_scripts is not None else []
+    for script in document.global_scripts or []:
+        wanted[(None, script.name)] = script.model_dump()
+    for advertiser, row in zip(document.advertisers, advertiser_rows):
+        advertiser_id = ids[row['container_id']]
+        owners.append(advertiser_id)
+        for script in advertiser.scripts:
+            wanted[(advertiser_id, script.name)] = script.model_dump()
+
+    current: Dict[Tuple[Optional[int], str], int] = {}
+    unchanged = set()
+    stale: List[int] = []
+    owner_ids = [owner for owner in owners if owner is not None]
+    queries = [Script.advertiser_id.in_(chunk) for chunk in _chunks(owner_ids)]
+    if None in owners:
+        queries.append(Script.advertiser_id.is_(None))
+    columns = [getattr(Script, field) for field in SCRIPT_FIELDS]
+    for condition in queries:
+        for script_id, advertiser_id, *values in db.execute(
+            select(Script.id, Script.advertiser_id, *columns)
+            .where(condition).order_by(Script.id)
+        ):
+            key = (advertiser_id, values[0])
+            # Extra scripts sharing a name (created one by one) are left alone
+            # unless pruning
+            if key in wanted and key not in current:
+                current[key] = script_id
+                if wanted[key] == dict(zip(SCRIPT_FIELDS, values)):
+                    unchanged.add(key)
+            else:
+                stale.append(script_id)
+
+    # Identical scripts are not rewritten, so re-importing an export is cheap
+    updates = [
+        {'id': current[key], **values} for key, values in wanted.items()
+        if key in current and key not in unchanged
+    ]
+    inserts = [{'advertiser_id': key[0], **values} for key, values in wanted.items() if key not in current]
+    if updates:
+        db.execute(update(Script), updates)
+    if inserts:
+        db.execute(insert(Script), inserts)
+    deleted = 0
+    if prune:
+        for chunk in _chunks(stale):
+            deleted += db.execute(delete(Script).where(Script.id.in_(chunk))).rowcount
+
+    return {
+        'advertisers_created': created,
+        'advertisers_updated': len(advertiser_rows) - created,
+        'scripts_created': len(inserts),
+        'scripts_updated': len(updates),
+        'scripts_unchanged': len(unchanged),
+        'scripts_deleted': deleted,
+    }
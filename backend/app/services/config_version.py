@@ -0,0 +1,126 @@
+"""Config version: keeps in-process caches coherent across worker processes.
+
+Every admin write to advertisers or scripts appends a row to
+``config_changes`` in its own transaction (``record_config_change``), so
+the config version (the latest row's ``version``) is bumped if and only if
+the write commits. The process that handled the write invalidates its
+caches right away, as before.
+
+In every process, ``ConfigWatcher`` polls for rows past the last version it
+has seen, one indexed query every ``CONFIG_POLL_INTERVAL_MS``, and drops
+the affected loader bundles. Other workers are therefore at most one
+interval behind, and requests never query the version themselves. Only the
+newest ``KEEP_CHANGES`` rows are kept; a worker that fell further behind
+clears its whole cache.
+"""
+from threading import Event, Lock, Thread
+from typing import Optional
+import logging
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.config_change import ConfigChange
+from .loader_cache import loader_cache
+
+logger = logging.getLogger(__name__)
+
+KEEP_CHANGES = 1000
+
+
+def record_config_change(db: Session, advertiser_id: Optional[int] = None,
+                         container_id: Optional[str] = None) -> None:
+    """Bump the config version in the caller's transaction (commit follows).
+
+    Without ids the change affects every container.
+    """
+    db.execute(insert(ConfigChange).values(advertiser_id=advertiser_id, container_id=container_id))
+    db.execute(delete(ConfigChange).where(
+        ConfigChange.version <= select(func.max(ConfigChange.version)).scalar_subquery() - KEEP_CHANGES
+    ))
+
+
+def current_config_version(db: Session) -> int:
+    return db.query(func.max(ConfigChange.version)).scalar() or 0
+
+
+class ConfigWatcher:
+    """Applies config changes made by other processes to this process's caches"""
+
+    def __init__(self, interval_ms: int, session_factory=SessionLocal):
+        self.interval = interval_ms / 1000
+        self.session_factory = session_factory
+        self.version = 0
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self.checks = 0
+        self.changes_applied = 0
+
+    def sync(self) -> int:
+        """Invalidate what changed since the last check; returns the number of changes"""
+        with self._lock:
+            db = self.session_factory()
+            try:
+                changes = db.execute(
+                    select(ConfigChange.version, ConfigChange.advertiser_id, ConfigChange.container_id)
+                    .where(ConfigChange.version > self.version)
+                    .order_by(ConfigChange.version)
+                ).all()
+                oldest = None
+                if changes and self.version:
+                    oldest = db.query(func.min(ConfigChange.version)).scalar()
+            finally:
+                db.close()
+            self.checks += 1
+            if not changes:
+                return 0
+
+            if oldest is not None and oldest > self.version + 1:
+                # Changes we never saw were already pruned
+                loader_cache.invalidate_all()
+            else:
+                for _, advertiser_id, container_id in changes:
+                    if container_id is not None:
+                        loader_cache.invalidate_container(container_id)
+                    elif advertiser_id is not None:
+                        loader_cache.invalidate_advertiser(advertiser_id)
+                    else:
+                        loader_cache.invalidate_all()
+                        break
+            self.version = changes[-1][0]
+            self.changes_applied += len(changes)
+            return len(changes)
+
+    def start(self) -> None:
+        if self.interval <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        # Caches start empty: only changes from now on matter
+        db = self.session_factory()
+        try:
+            self.version = current_config_version(db)
+        finally:
+            db.close()
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='config-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Config version check failed")
+
+
+config_watcher = ConfigWatcher(settings.config_poll_interval_ms)
@@ -1,7 +1,8 @@
 from sqlalchemy.orm import Session
 from ..models.advertiser import Advertiser
 from ..models.script import Script
-import json
+from .js_minifier import fragment_cache, join_minified, minify
+from typing import List
 
 
 def generate_container_code(advertiser: Advertiser) -> str:
@@ -16,7 +17,7 @@ def generate_container_code(advertiser: Advertiser) -> str:
     }}
     var s=d.createElement('script');
     s.async=true;
-    s.src='//tsprtg.com/c/'+c+'/l.js?v='+(+new Date());
+    s.src='//tsprtg.com/c/'+c+'/l.js';
     (d.body||d.head).appendChild(s);
     w._tsprtg=w._tsprtg||{{}};
     w._tsprtg.cid=c;
@@ -26,8 +27,20 @@ def generate_container_code(advertiser: Advertiser) -> str:
     return code
 
 
-def generate_loader_script(db: Session, advertiser: Advertiser) -> str:
-    """Generate the loader JavaScript that will be served at /c/{container_id}/l.js"""
+def generate_bootstrap_script(bundle_url: str) -> str:
+    """Generate the tiny bootstrap served at /c/{container_id}/l.js.
+
+    It only injects the immutable bundle, which holds the actual scripts.
+    """
+    return (
+        "(function(d){var s=d.createElement('script');s.async=true;"
+        f"s.src='{bundle_url}';"
+        "(d.body||d.head).appendChild(s);})(document);\n"
+    )
+
+
+def _loader_fragments(db: Session, advertiser: Advertiser) -> List[str]:
+    """Build the loader source as a list of newline-terminated fragments"""
     
     # Get global scripts (advertiser_id is NULL)
     global_scripts = db.query(Script).filter(
@@ -45,68 +58,46 @@ def generate_loader_script(db: Session, advertiser: Advertiser) -> str:
     all_scripts = global_scripts + advertiser_scripts
     
     # Generate JavaScript code
-    js_code = "(function(){\n"
-    js_code += "'use strict';\n"
-    js_code += f"console.log('TSPRTG Container loaded: {advertiser.container_id}');\n"
+    fragments = [
+        "(function(){\n"
+        "'use strict';\n"
+        f"console.log('TSPRTG Container loaded: {advertiser.container_id}');\n"
+    ]
     
     for script in all_scripts:
         if script.script_type == 'external':
             # Load external script
             async_attr = "s.async=true;" if script.is_async else ""
             defer_attr = "s.defer=true;" if script.is_defer else ""
-            js_code += f"""
+            fragments.append(f"""
 var s=document.createElement('script');
 s.src='{script.content}';
 {async_attr}
 {defer_attr}
 (document.body||document.head).appendChild(s);
-"""
+""")
         elif script.script_type == 'inline':
             # Execute inline script
-            js_code += f"\n// Script: {script.name}\n"
-            js_code += f"{script.content}\n"
+            fragments.append(f"\n// Script: {script.name}\n{script.content}\n")
     
-    js_code += "})();\n"
+    fragments.append("})();\n")
     
-    return js_code
+    return fragments
 
 
-def minify_js(code: str) -> str:
-    """Basic JavaScript minification - removes comments and extra whitespace
-    Note: This is a simple minification. For production, consider using a proper
-    JS minifier library like jsmin or integrating with a build tool.
+def generate_loader_script(db: Session, advertiser: Advertiser, minified: bool = False) -> str:
+    """Generate the loader JavaScript that will be served at /c/{container_id}/l.js
+
+    With ``minified=True`` every fragment (wrapper, each script) is minified
+    on its own and memoized by content hash, so re-rendering a bundle only
+    minifies scripts that actually changed.
     """
-    lines = []
-    in_string = False
-    string_char = None
-    
-    for line in code.split('\n'):
-        cleaned = []
-        i = 0
-        while i < len(line):
-            char = line[i]
-            
-            # Track string state to avoid removing // inside strings
-            if char in ('"', "'") and (i == 0 or line[i-1] != '\\'):
-                if not in_string:
-                    in_string = True
-                    string_char = char
-                elif char == string_char:
-                    in_string = False
-                    string_char = None
-            
-            # Remove comments only when not in a string
-            if not in_string and i < len(line) - 1:
-                if line[i:i+2] == '//':
-                    break
-            
-            cleaned.append(char)
-            i += 1
-        
-        lines.append(''.join(cleaned).strip())
-    
-    # Join and remove extra whitespace
-    minified = ' '.join(lines)
-    minified = ' '.join(minified.split())
-    
-    return minified
+    fragments = _loader_fragments(db, advertiser)
+    if not minified:
+        return ''.join(fragments)
+    return join_minified(fragment_cache.minify(fragment) for fragment in fragments)
+
+
+def minify_js(code: str) -> str:
+    """Minify JavaScript with the single-pass tokenizer in services.js_minifier"""
+    return minify(code)
@@ -0,0 +1,117 @@
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+import json
+
+from ..models.advertiser import Advertiser
+
+# Marks a trie node where an allowed domain ends; not a string, so it can
+# not collide with a label (empty labels from stray dots are labels too)
+_TERMINAL = object()
+
+
+def _normalize(domain: str) -> str:
+    """Lowercase a domain and strip a leading www. prefix"""
+    domain = domain.lower()
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    return domain
+
+
+def referer_host(referer: Optional[str]) -> Optional[str]:
+    """Host of a referer URL as the matcher sees it (lowercase, no www.)"""
+    if not referer:
+        return None
+    try:
+        host = urlparse(referer).netloc
+    except ValueError:
+        return None
+    return _normalize(host) or None
+
+
+class DomainMatcher:
+    """Compiled domain allowlist.
+
+    Allowed domains are stored in a trie keyed by their labels in reverse
+    order (``shop.example.com`` -> ``com`` -> ``example`` -> ``shop``), so a
+    referer host is matched exactly or as a subdomain in O(labels) dict
+    lookups regardless of how many domains are allowed.
+
+    Empty labels (leading, trailing or doubled dots) are kept as labels, as
+    the string comparison of ``is_domain_allowed`` does: ``.example.com``
+    only matches hosts that have the same empty label.
+    """
+
+    __slots__ = ('_root', 'size')
+
+    def __init__(self, allowed_domains: Iterable[str]):
+        self._root: Dict = {}
+        self.size = 0
+        for allowed in allowed_domains:
+            if not isinstance(allowed, str):
+                continue
+            node = self._root
+            for label in reversed(_normalize(allowed).split('.')):
+                node = node.setdefault(label, {})
+            if _TERMINAL not in node:
+                node[_TERMINAL] = True
+                self.size += 1
+
+    def matches_host(self, host: str) -> bool:
+        """Check if a host equals an allowed domain or is a subdomain of one"""
+        node = self._root
+        for label in reversed(_normalize(host).split('.')):
+            node = node.get(label)
+            if node is None:
+                return False
+            if _TERMINAL in node:
+                return True
+        return False
+
+    def matches(self, referer: str) -> bool:
+        """Check if the domain of a referer URL is allowed"""
+        if not referer or not self.size:
+            return False
+        try:
+            return self.matches_host(urlparse(referer).netloc)
+        except ValueError:
+            return False
+
+
+_matchers: Dict[int, Tuple[Optional[str], DomainMatcher]] = {}
+_matchers_lock = Lock()
+
+
+def compile_domains(raw_domains: Optional[str]) -> DomainMatcher:
+    """Build a matcher from the JSON list stored in Advertiser.domains"""
+    try:
+        allowed_domains = json.loads(raw_domains) if raw_domains else []
+    except json.JSONDecodeError:
+        # If JSON parsing fails, treat as no domains configured
+        allowed_domains = []
+    if not isinstance(allowed_domains, list):
+        allowed_domains = []
+    return DomainMatcher(allowed_domains)
+
+
+def get_domain_matcher(advertiser: Advertiser) -> DomainMatcher:
+    """Return the compiled matcher for an advertiser.
+
+    The matcher is reused across requests and only rebuilt when the stored
+    ``domains`` value differs from the one it was compiled from.
+    """
+    raw_domains = advertiser.domains
+    cached = _matchers.get(advertiser.id)
+    if cached is not None and cached[0] == raw_domains:
+        return cached[1]
+
+    matcher = compile_domains(raw_domains)
+    with _matchers_lock:
+        _matchers[advertiser.id] = (raw_domains, matcher)
+    return matcher
+
+
+def forget_domain_matcher(advertiser_id: int) -> None:
+    """Drop the compiled matcher of a deleted advertiser"""
+    with _matchers_lock:
+        _matchers.pop(advertiser_id, None)
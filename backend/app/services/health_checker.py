@@ -1,9 +1,33 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import and_, or_, update
 from ..models.advertiser import Advertiser
 from ..models.health_log import HealthLog
+from ..models.container_load_rollup import ContainerLoadRollup
+from .domain_matcher import referer_host as extract_referer_host
+from .rollups import load_summary_query, to_utc_naive
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+import base64
+
+
+def _build_stats(container_id: str, summary, one_day_ago: datetime) -> Dict:
+    last_load = summary.last_load if summary else None
+    
+    # Determine status
+    if last_load is None:
+        status = 'never'
+    elif last_load >= one_day_ago:
+        status = 'active'
+    else:
+        status = 'inactive'
+    
+    return {
+        'container_id': container_id,
+        'loads_today': summary.loads_today if summary else 0,
+        'loads_week': summary.loads_week if summary else 0,
+        'last_load': last_load,
+        'status': status
+    }
 
 
 def get_container_stats(db: Session, container_id: str) -> Dict:
@@ -18,54 +42,50 @@ def get_container_stats(db: Session, container_id: str) -> Dict:
     one_day_ago = now - timedelta(days=1)
     one_week_ago = now - timedelta(days=7)
     
-    # Count loads today
-    loads_today = db.query(func.count(HealthLog.id)).filter(
-        HealthLog.container_id == container_id,
-        HealthLog.created_at >= one_day_ago
-    ).scalar()
+    summary = load_summary_query(db, one_day_ago, one_week_ago).filter(
+        ContainerLoadRollup.container_id == container_id
+    ).first()
     
-    # Count loads this week
-    loads_week = db.query(func.count(HealthLog.id)).filter(
-        HealthLog.container_id == container_id,
-        HealthLog.created_at >= one_week_ago
-    ).scalar()
-    
-    # Get last load time
-    last_log = db.query(HealthLog).filter(
-        HealthLog.container_id == container_id
-    ).order_by(HealthLog.created_at.desc()).first()
-    
-    last_load = last_log.created_at if last_log else None
+    return _build_stats(container_id, summary, one_day_ago)
+
+
+def get_all_container_stats(db: Session) -> List[Dict]:
+    """Get statistics for every advertiser's container with two queries on the rollups"""
     
-    # Determine status
-    if not last_log:
-        status = 'never'
-    elif last_load and last_load >= one_day_ago:
-        status = 'active'
-    else:
-        status = 'inactive'
+    now = datetime.utcnow()
+    one_day_ago = now - timedelta(days=1)
+    one_week_ago = now - timedelta(days=7)
     
-    return {
-        'container_id': container_id,
-        'loads_today': loads_today,
-        'loads_week': loads_week,
-        'last_load': last_load,
-        'status': status
+    advertisers = db.query(Advertiser.id, Advertiser.name, Advertiser.container_id).all()
+    summaries = {
+        row.container_id: row
+        for row in load_summary_query(db, one_day_ago, one_week_ago)
     }
+    
+    return [
+        {
+            'advertiser_id': advertiser.id,
+            'advertiser_name': advertiser.name,
+            **_build_stats(advertiser.container_id, summaries.get(advertiser.container_id), one_day_ago)
+        }
+        for advertiser in advertisers
+    ]
 
 
 def get_all_containers_health(db: Session) -> Dict:
     """Get health status of all containers"""
+    return summarize_container_stats(get_all_container_stats(db))
+
+
+def summarize_container_stats(all_stats: List[Dict]) -> Dict:
+    """Overall health status from the result of get_all_container_stats"""
     
-    advertisers = db.query(Advertiser).all()
-    
-    total_containers = len(advertisers)
+    total_containers = len(all_stats)
     active_containers = 0
     inactive_containers = 0
     never_loaded_containers = 0
     
-    for advertiser in advertisers:
-        stats = get_container_stats(db, advertiser.container_id)
+    for stats in all_stats:
         if stats['status'] == 'active':
             active_containers += 1
         elif stats['status'] == 'inactive':
@@ -82,11 +102,85 @@ def get_all_containers_health(db: Session) -> Dict:
     }
 
 
-def get_container_logs(db: Session, container_id: str, limit: int = 100) -> List[HealthLog]:
-    """Get recent logs for a container"""
-    
-    logs = db.query(HealthLog).filter(
-        HealthLog.container_id == container_id
-    ).order_by(HealthLog.created_at.desc()).limit(limit).all()
+def encode_log_cursor(log: HealthLog) -> str:
+    """Opaque cursor pointing just past ``log`` in newest-first order"""
+    raw = f"{log.created_at.isoformat()}|{log.id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_log_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_log_cursor; raises ValueError on malformed input"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        created_at, log_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def get_container_logs(
+    db: Session,
+    container_id: str,
+    limit: int = 100,
+    after: Optional[Tuple[datetime, int]] = None,
+    is_allowed: Optional[bool] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    referer_host: Optional[str] = None
+) -> List[HealthLog]:
+    """Get a container's logs, newest first.
+
+    Paginated by keyset on (created_at, id): ``after`` is the position of
+    the last row of the previous page, so every page is an index range scan
+    no matter how deep it is. Filters pick the (container_id, is_allowed,
+    created_at) or (container_id, referer_host, created_at) index.
+    """
+    query = db.query(HealthLog).filter(HealthLog.container_id == container_id)
+    if is_allowed is not None:
+        query = query.filter(HealthLog.is_allowed == is_allowed)
+    if referer_host:
+        # Same normalization as the stored value ("WWW.Example.com" -> "example.com")
+        query = query.filter(
+            HealthLog.referer_host == extract_referer_host('//' + referer_host.strip())
+        )
+    if start is not None:
+        query = query.filter(HealthLog.created_at >= to_utc_naive(start))
+    if end is not None:
+        query = query.filter(HealthLog.created_at < to_utc_naive(end))
+    if after is not None:
+        created_at, log_id = after
+        query = query.filter(or_(
+            HealthLog.created_at < created_at,
+            and_(HealthLog.created_at == created_at, HealthLog.id < log_id)
+        ))
     
-    return logs
+    return query.order_by(HealthLog.created_at.desc(), HealthLog.id.desc()).limit(limit).all()
+
+
+def backfill_referer_hosts(db: Session, batch_size: int = 5000) -> int:
+    """Fill referer_host of rows written before the column existed.
+
+    Works through the rows in id order, one short transaction per batch.
+    Returns the number of rows updated.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.query(HealthLog.id, HealthLog.referer).filter(
+            HealthLog.id > last_id,
+            HealthLog.referer_host.is_(None),
+            HealthLog.referer.isnot(None)
+        ).order_by(HealthLog.id).limit(batch_size).all()
+        if not rows:
+            return updated
+        values = [
+            {'id': log_id, 'referer_host': host}
+            for log_id, host in ((log_id, extract_referer_host(referer)) for log_id, referer in rows)
+            if host
+        ]
+        if values:
+            # Bulk UPDATE by primary key
+            db.execute(update(HealthLog), values)
+            db.commit()
+        updated += len(values)
+        last_id = rows[-1].id
@@ -0,0 +1,287 @@
+"""Top referers and user agents per container (Space-Saving heavy hitters).
+
+Every container keeps, per UTC day, three bounded Space-Saving summaries:
+allowed referer hosts, user agents and denied referer hosts (the latter
+point at domains missing from an advertiser's allowlist). A summary tracks
+at most ``TOPK_CAPACITY`` items. Any value seen more than ``n / capacity``
+times out of ``n`` is guaranteed to be in it, and each count overestimates
+the true one by at most its ``error``.
+
+The health log writer feeds each batch into in-memory summaries. Every
+``TOPK_SNAPSHOT_SECONDS`` they are merged into ``container_top_snapshots``
+(one row of at most ``capacity`` items per container, day and kind) and
+reset. The summaries are mergeable, so several worker processes snapshot
+into the same rows, and reading the top K is a single row per day.
+"""
+from collections import Counter
+from datetime import date
+from threading import Event, Lock, Thread
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq
+import json
+import logging
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.container_top_snapshot import ContainerTopSnapshot
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('referers', 'user_agents', 'denied_referers')
+
+# Longer user agents are truncated so a summary stays small
+MAX_VALUE_LENGTH = 256
+
+# Keys per IN (...) list, well below SQLite's bound parameter limit
+_CHUNK = 500
+
+
+class SpaceSaving:
+    """Space-Saving summary: counts of the (at most) ``capacity`` heaviest items"""
+
+    __slots__ = ('capacity', 'counts', 'errors', '_heap')
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # Min-heap of (count, item), one entry per item, built at the first
+        # eviction. Counts only grow, so an entry is a lower bound of its
+        # item's count and is refreshed when it reaches the top.
+        self._heap: Optional[List[Tuple[int, str]]] = None
+
+    def offer(self, item: str, weight: int = 1) -> None:
+        if item in self.counts:
+            self.counts[item] += weight
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+            if self._heap is not None:
+                heapq.heappush(self._heap, (weight, item))
+            return
+        # Replace the smallest item; the newcomer inherits its count as error
+        victim = self._smallest()
+        floor = self.counts.pop(victim)
+        del self.errors[victim]
+        self.counts[item] = floor + weight
+        self.errors[item] = floor
+        heapq.heapreplace(self._heap, (floor + weight, item))
+
+    def _smallest(self) -> str:
+        """Item with the lowest count, left at the top of the heap"""
+        heap = self._heap
+        if heap is None:
+            heap = self._heap = [(count, item) for item, count in self.counts.items()]
+            heapq.heapify(heap)
+        while True:
+            count, item = heap[0]
+            current = self.counts[item]
+            if count == current:
+                return item
+            heapq.heapreplace(heap, (current, item))
+
+    def min_count(self) -> int:
+        """Upper bound on the count of any item not in a full summary"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """Fold ``other`` in; items missing from a full side get its minimum"""
+        mine, theirs = self.min_count(), other.min_count()
+        counts: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, mine) + other.counts.get(item, theirs)
+            errors[item] = (
+                (self.errors[item] if item in self.counts else mine)
+                + (other.errors[item] if item in other.counts else theirs)
+            )
+        kept = sorted(counts, key=counts.__getitem__, reverse=True)[:self.capacity]
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        self._heap = None
+
+    def top(self, k: int) -> List[Dict]:
+        items = sorted(self.counts.items(), key=lambda pair: pair[1], reverse=True)[:k]
+        return [{'value': item, 'count': count, 'error': self.errors[item]} for item, count in items]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            [[item, count, self.errors[item]] for item, count in self.counts.items()],
+            separators=(',', ':')
+        )
+
+    @classmethod
+    def from_json(cls, capacity: int, data: str) -> "SpaceSaving":
+        summary = cls(capacity)
+        for item, count, error in json.loads(data):
+            summary.counts[item] = count
+            summary.errors[item] = error
+        return summary
+
+
+def _batch_counts(rows: Iterable[Dict]) -> Dict[Tuple[str, date, str], Counter]:
+    """Count the values of a batch of health log rows per (container, day, kind)"""
+    counts: Dict[Tuple[str, date, str], Counter] = {}
+    for row in rows:
+        container_id, day = row['container_id'], row['created_at'].date()
+        host = row.get('referer_host')
+        if host:
+            kind = 'referers' if row['is_allowed'] else 'denied_referers'
+            counts.setdefault((container_id, day, kind), Counter())[host] += 1
+        user_agent = row.get('user_agent')
+        if user_agent:
+            counts.setdefault((container_id, day, 'user_agents'), Counter())[user_agent[:MAX_VALUE_LENGTH]] += 1
+    return counts
+
+
+class HeavyHitters:
+    """In-memory summaries since the last snapshot, flushed by a background thread"""
+
+    def __init__(self, capacity: int, interval_seconds: int, session_factory=SessionLocal):
+        self.capacity = capacity
+        self.interval = interval_seconds
+        self.session_factory = session_factory
+        self._summaries: Dict[Tuple[str, date, str], SpaceSaving] = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self.snapshots = 0
+
+    def observe(self, rows: Iterable[Dict]) -> None:
+        """Add a batch of health log rows (called from the log writer thread)"""
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            for key, counter in _batch_counts(rows).items():
+                summary = self._summaries.get(key)
+                if summary is None:
+                    summary = self._summaries[key] = SpaceSaving(self.capacity)
+                # Heaviest first, so a full summary evicts the light tail
+                for item, weight in counter.most_common():
+                    summary.offer(item, weight)
+
+    def snapshot(self) -> int:
+        """Merge the in-memory summaries into the stored ones and reset them.
+
+        Worker processes snapshot into the same rows, so the read and the
+        upsert must not interleave with another snapshot. The rows are
+        claimed first with an upsert that leaves them as they are: it takes
+        the SQLite write lock, and on PostgreSQL it locks the rows (or waits
+        for a concurrent insert of them) until commit. The read that follows
+        runs on the writer, in the same transaction.
+        """
+        with self._lock:
+            pending, self._summaries = self._summaries, {}
+        if not pending:
+            return 0
+
+        db = self.session_factory()
+        try:
+            if db.get_bind().dialect.name == 'postgresql':
+                insert = postgresql.insert
+            else:
+                insert = sqlite.insert
+            empty = SpaceSaving(self.capacity).to_json()
+            claim = insert(ContainerTopSnapshot)
+            db.execute(
+                claim.on_conflict_do_update(
+                    index_elements=['container_id', 'day', 'kind'],
+                    set_={'summary': ContainerTopSnapshot.summary}
+                ),
+                [{'container_id': container_id, 'day': day, 'kind': kind, 'summary': empty}
+                 for container_id, day, kind in pending]
+            )
+            # Merge into the stored summaries, so pending stays intact for a retry
+            merged = {}
+            keys = list(pending)
+            for offset in range(0, len(keys), _CHUNK):
+                stored = db.execute(
+                    select(ContainerTopSnapshot.container_id, ContainerTopSnapshot.day,
+                           ContainerTopSnapshot.kind, ContainerTopSnapshot.summary)
+                    .where(tuple_(
+                        ContainerTopSnapshot.container_id, ContainerTopSnapshot.day, ContainerTopSnapshot.kind
+                    ).in_(keys[offset:offset + _CHUNK]))
+                )
+                for container_id, day, kind, summary in stored:
+                    key = (container_id, day, kind)
+                    merged[key] = SpaceSaving.from_json(self.capacity, summary)
+                    merged[key].merge(pending[key])
+
+            stmt = insert(ContainerTopSnapshot)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['container_id', 'day', 'kind'],
+                set_={'summary': stmt.excluded.summary}
+            )
+            db.execute(stmt, [
+                {'container_id': container_id, 'day': day, 'kind': kind, 'summary': summary.to_json()}
+                for (container_id, day, kind), summary in merged.items()
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._restore(pending)
+            raise
+        finally:
+            db.close()
+        self.snapshots += 1
+        return len(pending)
+
+    def _restore(self, pending: Dict[Tuple[str, date, str], SpaceSaving]) -> None:
+        """Put back the summaries of a failed snapshot for the next one"""
+        with self._lock:
+            for key, summary in pending.items():
+                current = self._summaries.get(key)
+                if current is not None:
+                    summary.merge(current)
+                self._summaries[key] = summary
+
+    def start(self) -> None:
+        if self.capacity <= 0 or self.interval <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='heavy-hitters-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the thread and write a last snapshot"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            self.snapshot()
+        except Exception:
+            logger.exception("Final heavy hitter snapshot failed")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.snapshot()
+            except Exception:
+                logger.exception("Heavy hitter snapshot failed")
+
+
+def get_top_hitters(db: Session, container_id: str, first_day: date, last_day: date, k: int) -> Dict:
+    """Top ``k`` values per kind of a container over [first_day, last_day]"""
+    capacity = max(1, settings.topk_capacity)
+    merged = {kind: SpaceSaving(capacity) for kind in KINDS}
+    for kind, summary in db.query(ContainerTopSnapshot.kind, ContainerTopSnapshot.summary).filter(
+        ContainerTopSnapshot.container_id == container_id,
+        ContainerTopSnapshot.day >= first_day,
+        ContainerTopSnapshot.day <= last_day
+    ):
+        if kind in merged:
+            merged[kind].merge(SpaceSaving.from_json(capacity, summary))
+    return {kind: summary.top(k) for kind, summary in merged.items()}
+
+
+heavy_hitters = HeavyHitters(settings.topk_capacity, settings.topk_snapshot_seconds)
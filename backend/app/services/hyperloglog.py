@@ -0,0 +1,81 @@
+"""HyperLogLog cardinality sketch.
+
+A sketch of precision ``p`` has ``m = 2**p`` one-byte registers and
+estimates the number of distinct values added to it with a relative
+standard error of ``1.04 / sqrt(m)``, whatever that number is. The default
+``p = 12`` takes 4 KB and is accurate to about 1.6% (3.3% for 95% of
+estimates). Two sketches of the same precision merge losslessly by taking
+the register-wise maximum, so per-day sketches combine into weekly or
+monthly counts.
+"""
+from typing import Iterable, Optional
+import hashlib
+import math
+
+DEFAULT_PRECISION = 12
+
+
+def standard_error(precision: int = DEFAULT_PRECISION) -> float:
+    """Relative standard error of an estimate"""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """Mergeable distinct-count estimator with a fixed memory footprint"""
+
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[bytes] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(size)
+        elif len(registers) != size:
+            raise ValueError(f"expected {size} registers, got {len(registers)}")
+        else:
+            self.registers = bytearray(registers)
+
+    def add(self, value: str) -> None:
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = hashed & ((1 << rest_bits) - 1)
+        # Position of the first 1-bit in the remaining bits
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """Fold ``other`` into this sketch (union of the counted values)"""
+        if other.precision != self.precision:
+            raise ValueError("can only merge sketches of the same precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct values added"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / math.fsum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction: linear counting
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """Serialized form: one precision byte followed by the registers"""
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(data[0], data[1:])
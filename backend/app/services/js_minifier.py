@@ -0,0 +1,260 @@
+"""Streaming, tokenizer-based JavaScript minifier.
+
+The minifier makes a single left-to-right pass over the source using one
+compiled master regex, so it runs in linear time and only allocates the
+output tokens. It understands everything that can contain comment-like or
+whitespace-significant text:
+
+* line and block comments (removed),
+* single and double quoted strings with escapes (kept verbatim),
+* template literals, including nested ``${...}`` substitutions,
+* regular expression literals, told apart from division by the previous
+  significant token.
+
+Whitespace is collapsed to nothing, a single space where two tokens would
+otherwise merge (``var a``, ``a + +b``), or a newline where it may matter
+for automatic semicolon insertion. No renaming or other rewriting is done.
+
+Bundles are rendered from many small fragments (the wrapper and one per
+script), so ``fragment_cache`` memoizes the output per fragment by content
+hash and ``join_minified`` stitches the pieces back together.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterable, List
+import hashlib
+import re
+
+# Every match is optional leading whitespace plus one token. A "code" token
+# is a run of identifiers, numbers, operators and horizontal whitespace that
+# can not contain comments, strings, regex literals or template literals.
+# Braces only need to be seen one by one inside ${ ... } substitutions.
+_TOKEN_PATTERN = r"""
+    (?P<ws>[\s\ufeff]*)
+    (?:
+        (?P<code>[\w$\\!%%&*+,\-.:;<=>?^|~()\[\] \t%s]+)
+        |(?P<string>'(?:[^'\\\n\r]|\\[\s\S])*'?|"(?:[^"\\\n\r]|\\[\s\S])*"?)
+        |(?P<comment>//[^\n\r\u2028\u2029]*|/\*[\s\S]*?(?:\*/|\Z))
+        |(?P<other>[\s\S])
+    )?
+"""
+_TOKEN = re.compile(_TOKEN_PATTERN % '{}', re.VERBOSE)
+_TOKEN_IN_TEMPLATE = re.compile(_TOKEN_PATTERN % '', re.VERBOSE)
+
+_HORIZONTAL_SPACE = re.compile(r'[ \t]+')
+
+# Spaces inside a code token that can be dropped: everything except the ones
+# between two identifier characters, in "+ +", "- -" and "< !", and after an
+# integer before "." ("1 .toString()")
+_REDUNDANT_SPACE = re.compile(
+    r"""
+    (?<=[^\w$\\\u0080-\U0010ffff+\-<])\x20
+    |(?<=\+)\x20(?!\+)
+    |(?<=-)\x20(?!-)
+    |(?<=<)\x20(?!!)
+    |(?<=[\w$\\\u0080-\U0010ffff])\x20(?=[^\w$\\\u0080-\U0010ffff.])
+    |(?<=[^\W\d]|[$\\\u0080-\U0010ffff])\x20(?=\.)
+    """,
+    re.VERBOSE,
+)
+
+_NEWLINE = re.compile(r'[\n\r\u2028\u2029]')
+_TRAILING_WORD = re.compile(r'[\w$\\]+\Z')
+
+# A regex literal body: escapes, character classes (which may contain /)
+# and anything but a line terminator, followed by the flags
+_REGEX_LITERAL = re.compile(
+    r"/(?![*/])(?:\\[^\n\r\u2028\u2029]|\[(?:\\[^\n\r\u2028\u2029]|[^\]\\\n\r\u2028\u2029])*\]|[^/\\\[\n\r\u2028\u2029])+/[\w$]*"
+)
+
+# Template literal text up to the closing backtick or the next ${
+_TEMPLATE_CHUNK = re.compile(r"(?:[^`\\$]|\\[\s\S]|\$(?!\{))*")
+
+# After these words an expression (and therefore a regex literal) may start
+_KEYWORDS_BEFORE_EXPRESSION = frozenset((
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void',
+    'throw', 'case', 'do', 'else', 'yield', 'await',
+))
+
+# A newline after these characters can never end a statement
+_NO_NEWLINE_AFTER = frozenset('{;,([=:?&|*%^!~')
+# A newline before these characters can never start a new statement
+_NO_NEWLINE_BEFORE = frozenset(')]},;')
+# Character pairs that would form a different token if joined
+_SPACE_PAIRS = frozenset(('++', '--', '//', '/*', '<!'))
+
+
+_ASCII_WORD_CHARS = frozenset(
+    'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$\\'
+)
+
+
+def _is_word_char(char: str) -> bool:
+    return char in _ASCII_WORD_CHARS or char > '\x7f'
+
+
+def _trailing_word(token: str) -> str:
+    match = _TRAILING_WORD.search(token)
+    return match.group() if match else ''
+
+
+def _regex_allowed(previous: str) -> bool:
+    """Whether a "/" after the token ``previous`` starts a regex literal"""
+    if not previous or previous == '/':
+        return True
+    last = previous[-1]
+    if last in ')]\'"`/':
+        # After a value, a string, a template or a regex literal: division
+        return False
+    if _is_word_char(last):
+        return _trailing_word(previous) in _KEYWORDS_BEFORE_EXPRESSION
+    return True
+
+
+def _separator(previous: str, next_char: str, had_newline: bool) -> str:
+    """Return what must stand between two tokens that had whitespace between them"""
+    last = previous[-1]
+    if had_newline and last not in _NO_NEWLINE_AFTER and next_char not in _NO_NEWLINE_BEFORE:
+        return '\n'
+    if _is_word_char(last) and _is_word_char(next_char):
+        return ' '
+    if last + next_char in _SPACE_PAIRS:
+        return ' '
+    # "1 .toString()" must not become the number "1."
+    if next_char == '.' and _trailing_word(previous).isdigit():
+        return ' '
+    return ''
+
+
+def minify(code: str) -> str:
+    """Minify JavaScript source in a single pass"""
+    out: List[str] = []
+    append = out.append
+    pos = 0
+    length = len(code)
+
+    previous = ''  # last emitted token
+    pending = 0    # whitespace before the next token: 0 none, 1 space, 2 newline
+    templates: List[int] = []  # brace depth inside each open ${ ... }
+
+    while pos < length:
+        token = (_TOKEN_IN_TEMPLATE if templates else _TOKEN).match(code, pos)
+        kind = token.lastgroup
+        if token.end('ws') > pos and pending < 2:
+            pending = 2 if _NEWLINE.search(code, pos, token.end('ws')) else 1
+        pos = token.end()
+
+        if kind == 'comment':
+            if pending < 2:
+                pending = 2 if _NEWLINE.search(token.group(kind)) else 1
+            continue
+        if kind is None or kind == 'ws':
+            # Trailing whitespace at the end of the input
+            break
+
+        text = token.group(kind)
+        template_start = False
+        if kind == 'code':
+            if text[-1] in ' \t':
+                text = text.rstrip(' \t')
+                trailing_space = True
+            else:
+                trailing_space = False
+            if '\t' in text or '  ' in text:
+                text = _HORIZONTAL_SPACE.sub(' ', text)
+            if ' ' in text:
+                text = _REDUNDANT_SPACE.sub('', text)
+        elif kind == 'other':
+            if text == '/':
+                if _regex_allowed(previous):
+                    literal = _REGEX_LITERAL.match(code, pos - 1)
+                    if literal is not None:
+                        text = literal.group()
+                        pos = literal.end()
+            elif text == '`':
+                template_start = True
+            elif text == '{':
+                if templates:
+                    templates[-1] += 1
+            elif text == '}' and templates:
+                if templates[-1] == 0:
+                    # End of a ${ ... } substitution: back to template text
+                    templates.pop()
+                    template_start = True
+                else:
+                    templates[-1] -= 1
+
+        if template_start:
+            # Template text is copied verbatim up to the closing backtick or
+            # the next ${, which opens a nested code section
+            end = _TEMPLATE_CHUNK.match(code, pos).end()
+            if code.startswith('${', end):
+                end += 2
+                templates.append(0)
+            else:
+                end = min(end + 1, length)
+            text += code[pos:end]
+            pos = end
+
+        if pending:
+            if previous:
+                separator = _separator(previous, text[0], pending == 2)
+                if separator:
+                    append(separator)
+            pending = 0
+        append(text)
+        previous = text
+        if kind == 'code' and trailing_space:
+            pending = 1
+
+    return ''.join(out)
+
+
+def join_minified(fragments: Iterable[str]) -> str:
+    """Join independently minified fragments that were separated by newlines"""
+    out: List[str] = []
+    last = ''
+    for fragment in fragments:
+        if not fragment:
+            continue
+        if last and last not in _NO_NEWLINE_AFTER and fragment[0] not in _NO_NEWLINE_BEFORE:
+            out.append('\n')
+        out.append(fragment)
+        last = fragment[-1]
+    return ''.join(out)
+
+
+class MinifyCache:
+    """Bounded LRU memo of minified fragments keyed by their content hash"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, str]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def minify(self, code: str) -> str:
+        key = hashlib.blake2b(code.encode('utf-8'), digest_size=16).digest()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        result = minify(code)
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        """Forget every memoized fragment"""
+        with self._lock:
+            self._entries.clear()
+
+
+fragment_cache = MinifyCache()
@@ -0,0 +1,219 @@
+"""Live health events for the admin UI, pushed over Server-Sent Events.
+
+Every process has one ``LiveEventPublisher``. The health log writer hands
+it each batch it has written; one asyncio task then fans events out to all
+connected clients (``GET /api/health/stream``):
+
+* ``snapshot`` - ``{"health": ..., "containers": [...]}``, the payloads of
+  ``/api/health`` and ``/api/health/containers``. It is read from the
+  rollups once every ``LIVE_SNAPSHOT_SECONDS`` and shared by every client
+  (a new client gets the latest one right away), so the database load does
+  not grow with the number of open dashboards.
+* ``counters`` - every ``LIVE_TICK_MS`` with traffic: allowed and denied
+  loads and the last load time per container since the previous tick.
+  Clients add them to the snapshot.
+* ``loads`` - the individual loads of that tick, at most
+  ``LIVE_MAX_LOADS`` (``skipped`` counts the others).
+
+Counters only include loads logged by this process; with several workers
+the next snapshot brings in the others. A client that does not keep up
+with its ``LIVE_CLIENT_QUEUE`` buffered events is disconnected (browsers
+reconnect and start from a snapshot).
+"""
+from collections import deque
+from threading import Lock
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+import asyncio
+import json
+import logging
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from ..config import settings
+from ..database import SessionLocal
+from .domain_matcher import referer_host
+from .health_checker import get_all_container_stats, summarize_container_stats
+
+logger = logging.getLogger(__name__)
+
+# Comment line sent when nothing else was, so proxies keep the stream open
+KEEPALIVE_SECONDS = 15
+# Reconnection delay suggested to EventSource clients
+RETRY_MS = 5000
+
+
+def _event(name: str, data) -> bytes:
+    payload = json.dumps(jsonable_encoder(data), separators=(',', ':'))
+    return f"event: {name}\ndata: {payload}\n\n".encode('utf-8')
+
+
+class LiveEventPublisher:
+    """Aggregates logged loads and broadcasts them to the subscribed streams"""
+
+    def __init__(self, tick_ms: int, snapshot_seconds: int, max_loads: int, client_queue: int,
+                 session_factory=SessionLocal):
+        self.tick = max(tick_ms, 100) / 1000
+        self.snapshot_interval = snapshot_seconds
+        self.client_queue = max(client_queue, 2)
+        self.session_factory = session_factory
+        self._lock = Lock()
+        # Held by the log writer from its commit through observe(), and by
+        # the snapshot read: a batch is then either in the snapshot or in
+        # the counters that follow it, never in both
+        self.commit_lock = Lock()
+        # container_id -> [allowed, denied, last_load] since the last tick
+        self._counts: Dict[str, List] = {}
+        self._loads = deque(maxlen=max(max_loads, 0))
+        self._skipped = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._snapshot: Optional[bytes] = None
+        self._snapshot_at: Optional[float] = None
+        self._closed = False
+        self.snapshots = 0
+        self.events_sent = 0
+        self.clients_dropped = 0
+
+    def observe(self, rows: Iterable[Dict]) -> None:
+        """Count a batch of written health log rows (called from the log writer thread)"""
+        if not self._subscribers:
+            return
+        with self._lock:
+            for row in rows:
+                counts = self._counts.get(row['container_id'])
+                if counts is None:
+                    counts = self._counts[row['container_id']] = [0, 0, None]
+                counts[0 if row['is_allowed'] else 1] += 1
+                if counts[2] is None or row['created_at'] > counts[2]:
+                    counts[2] = row['created_at']
+                if len(self._loads) == self._loads.maxlen:
+                    self._skipped += 1
+                self._loads.append({
+                    'container_id': row['container_id'],
+                    'referer_host': row.get('referer_host') or referer_host(row.get('referer')),
+                    'is_allowed': row['is_allowed'],
+                    'created_at': row['created_at'],
+                })
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        """Event stream of one client, starting with a snapshot"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.client_queue)
+        queue.put_nowait(f"retry: {RETRY_MS}\n\n".encode('ascii'))
+        if self._closed:
+            return
+        if self._task is not None and self._snapshot is not None:
+            # Counters have been tracked since this snapshot was read
+            queue.put_nowait(self._snapshot)
+        self._subscribers.add(queue)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"
+                if message is None:
+                    return
+                yield message
+        finally:
+            self._subscribers.discard(queue)
+
+    def close(self) -> None:
+        """End every stream, so open dashboards do not hold up a server shutdown"""
+        self._closed = True
+        for queue in list(self._subscribers):
+            self._end(queue)
+        self._subscribers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            'clients': len(self._subscribers),
+            'snapshots': self.snapshots,
+            'events_sent': self.events_sent,
+            'clients_dropped': self.clients_dropped,
+        }
+
+    @staticmethod
+    def _end(queue: asyncio.Queue) -> None:
+        while True:
+            try:
+                queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                queue.get_nowait()
+
+    def _broadcast(self, message: bytes) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+                self.events_sent += 1
+            except asyncio.QueueFull:
+                self._subscribers.discard(queue)
+                self._end(queue)
+                self.clients_dropped += 1
+
+    def _read_snapshot(self) -> Dict:
+        db = self.session_factory()
+        try:
+            with self.commit_lock:
+                containers = get_all_container_stats(db)
+                # Loads counted so far are in the rollups just read
+                with self._lock:
+                    self._counts = {}
+        finally:
+            db.close()
+        return {'health': summarize_container_stats(containers), 'containers': containers}
+
+    def _take_tick(self) -> List[bytes]:
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            loads, skipped = list(self._loads), self._skipped
+            self._loads.clear()
+            self._skipped = 0
+        if not counts:
+            return []
+        events = [_event('counters', {
+            'containers': {
+                container_id: {'allowed': allowed, 'denied': denied, 'last_load': last_load}
+                for container_id, (allowed, denied, last_load) in counts.items()
+            },
+        })]
+        if loads or skipped:
+            events.append(_event('loads', {'loads': loads, 'skipped': skipped}))
+        return events
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self._subscribers:
+                if self._snapshot_at is None or time.monotonic() - self._snapshot_at >= self.snapshot_interval:
+                    try:
+                        snapshot = await loop.run_in_executor(None, self._read_snapshot)
+                    except Exception:
+                        logger.exception("Live health snapshot failed")
+                    else:
+                        self._snapshot = _event('snapshot', snapshot)
+                        self.snapshots += 1
+                        self._broadcast(self._snapshot)
+                    self._snapshot_at = time.monotonic()
+                for message in self._take_tick():
+                    self._broadcast(message)
+                await asyncio.sleep(self.tick)
+        finally:
+            # Loads were not counted while nobody listened: start over
+            self._snapshot_at = None
+            if self._task is asyncio.current_task():
+                self._task = None
+
+
+live_events = LiveEventPublisher(
+    tick_ms=settings.live_tick_ms,
+    snapshot_seconds=settings.live_snapshot_seconds,
+    max_loads=settings.live_max_loads,
+    client_queue=settings.live_client_queue,
+)
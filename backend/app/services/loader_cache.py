@@ -0,0 +1,256 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+import hashlib
+import time
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.advertiser import Advertiser
+from ..models.container_load_rollup import ContainerLoadRollup
+from .compression import compress_variants
+from .container_generator import generate_loader_script
+
+
+# Invalidated bundles still served to pages that ran the bootstrap before
+# the change, and for how long (seconds)
+RETIRED_BUNDLES = 1000
+RETIRE_SECONDS = 300
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the content hash of a response body"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+@dataclass(frozen=True)
+class CachedBundle:
+    """Rendered and minified loader bundle for a single container.
+
+    ``variants`` holds the body precompressed once per content coding.
+    """
+    container_id: str
+    advertiser_id: int
+    body: bytes
+    etag: str
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def content_hash(self) -> str:
+        """Hex content hash used in the immutable bundle URL"""
+        return self.etag[1:-1]
+
+    def representation(self, encoding: Optional[str]) -> Tuple[bytes, str]:
+        """Return the body and strong ETag for a content coding (None = identity)"""
+        if encoding is None or encoding not in self.variants:
+            return self.body, self.etag
+        # Each coding is a distinct representation and needs its own validator
+        return self.variants[encoding], self.etag[:-1] + '-' + encoding + '"'
+
+    def size_stats(self) -> Dict:
+        """Identity and compressed sizes of the bundle in bytes"""
+        compressed = {encoding: len(data) for encoding, data in self.variants.items()}
+        return {
+            'bundle_bytes': len(self.body),
+            'compressed_bytes': compressed,
+            'bytes_saved': {encoding: len(self.body) - size for encoding, size in compressed.items()},
+        }
+
+
+class LoaderCache:
+    """Process-level LRU cache of rendered loader bundles keyed by container_id.
+
+    Entries are invalidated explicitly by the admin write paths. Every
+    invalidation bumps ``generation`` so that a render which started before
+    the invalidation can not put stale output back into the cache.
+
+    Invalidated bundles are retired rather than forgotten: a page that ran
+    the bootstrap just before the change still requests the old hash, so
+    the last ``RETIRED_BUNDLES`` of them stay available by (container_id,
+    hash) for ``retire_seconds``.
+    """
+
+    def __init__(self, max_entries: int, retire_seconds: float = 0):
+        self.max_entries = max_entries
+        self.retire_seconds = retire_seconds
+        self.generation = 0
+        self._entries: "OrderedDict[str, CachedBundle]" = OrderedDict()
+        self._retired: "OrderedDict[Tuple[str, str], Tuple[float, CachedBundle]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, container_id: str) -> Optional[CachedBundle]:
+        """Return the cached bundle for a container and mark it recently used"""
+        with self._lock:
+            entry = self._entries.get(container_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(container_id)
+            self.hits += 1
+            return entry
+
+    def put(self, container_id: str, advertiser_id: int, body: bytes, generation: int) -> CachedBundle:
+        """Store a rendered bundle unless the cache was invalidated since ``generation``"""
+        entry = CachedBundle(
+            container_id=container_id,
+            advertiser_id=advertiser_id,
+            body=body,
+            etag=make_etag(body),
+            variants=compress_variants(body),
+        )
+        if self.max_entries <= 0:
+            return entry
+        with self._lock:
+            if generation != self.generation:
+                return entry
+            self._entries[container_id] = entry
+            self._entries.move_to_end(container_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def get_retired(self, container_id: str, content_hash: str) -> Optional[CachedBundle]:
+        """A container's bundle invalidated less than ``retire_seconds`` ago"""
+        with self._lock:
+            retired = self._retired.get((container_id, content_hash))
+            if retired is None:
+                return None
+            retired_at, entry = retired
+            if time.monotonic() - retired_at > self.retire_seconds:
+                del self._retired[(container_id, content_hash)]
+                return None
+            return entry
+
+    def _retire(self, entries: Iterable[CachedBundle]) -> None:
+        """Keep invalidated bundles by hash (lock held)"""
+        if self.retire_seconds <= 0:
+            return
+        now = time.monotonic()
+        for entry in entries:
+            key = (entry.container_id, entry.content_hash)
+            self._retired[key] = (now, entry)
+            self._retired.move_to_end(key)
+        while len(self._retired) > RETIRED_BUNDLES:
+            self._retired.popitem(last=False)
+
+    def invalidate_container(self, container_id: str) -> None:
+        """Drop the cached bundle of a single container"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            entry = self._entries.pop(container_id, None)
+            if entry is not None:
+                self._retire([entry])
+
+    def invalidate_advertiser(self, advertiser_id: int) -> None:
+        """Drop the cached bundle belonging to an advertiser"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            stale = [cid for cid, entry in self._entries.items() if entry.advertiser_id == advertiser_id]
+            self._retire(self._entries.pop(container_id) for container_id in stale)
+
+    def invalidate_all(self) -> None:
+        """Drop every cached bundle (used when global scripts change)"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._retire(self._entries.values())
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Return cache size, hit/miss counters and cached byte totals"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            encoded_bytes: Dict[str, int] = {}
+            for entry in self._entries.values():
+                for encoding, data in entry.variants.items():
+                    encoded_bytes[encoding] = encoded_bytes.get(encoding, 0) + len(data)
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'identity_bytes': sum(len(entry.body) for entry in self._entries.values()),
+                'compressed_bytes': encoded_bytes,
+            }
+
+
+loader_cache = LoaderCache(settings.loader_cache_size, retire_seconds=RETIRE_SECONDS)
+
+
+def get_loader_bundle(db: Session, advertiser: Advertiser) -> CachedBundle:
+    """Return the minified loader bundle for an advertiser, rendering it on a cache miss"""
+    entry = loader_cache.get(advertiser.container_id)
+    if entry is not None:
+        return entry
+
+    generation = loader_cache.generation
+    js_code = generate_loader_script(db, advertiser, minified=True)
+    return loader_cache.put(advertiser.container_id, advertiser.id, js_code.encode('utf-8'), generation)
+
+
+def render_loader_bundle(advertiser: Advertiser) -> CachedBundle:
+    """Render and cache an advertiser's bundle using a session of its own.
+
+    For the async loader endpoints, which run it in the threadpool on a
+    cache miss so that rendering and minifying never block the event loop.
+    Only the already loaded id and container_id of ``advertiser`` are read.
+    """
+    generation = loader_cache.generation
+    db = SessionLocal()
+    try:
+        js_code = generate_loader_script(db, advertiser, minified=True)
+    finally:
+        db.close()
+    return loader_cache.put(advertiser.container_id, advertiser.id, js_code.encode('utf-8'), generation)
+
+
+def warm_loader_cache(limit: int) -> int:
+    """Render the bundles of the ``limit`` busiest active containers of the last day.
+
+    Run at startup, before the worker accepts requests, so a new or
+    restarted worker does not send its first requests down the render path.
+    """
+    limit = min(limit, loader_cache.max_entries)
+    if limit <= 0:
+        return 0
+    since = datetime.utcnow() - timedelta(days=1)
+    db = SessionLocal()
+    try:
+        busiest = db.query(Advertiser).join(
+            ContainerLoadRollup, ContainerLoadRollup.container_id == Advertiser.container_id
+        ).filter(
+            ContainerLoadRollup.bucket_start >= since,
+            ContainerLoadRollup.is_allowed == True,
+            Advertiser.is_active == True
+        ).group_by(Advertiser.id).order_by(func.sum(ContainerLoadRollup.loads).desc()).limit(limit).all()
+        for advertiser in busiest:
+            get_loader_bundle(db, advertiser)
+    finally:
+        db.close()
+    return len(busiest)
+
+
+def invalidate_script_change(advertiser_id: Optional[int]) -> None:
+    """Invalidate the bundles affected by a change to a script.
+
+    Global scripts (advertiser_id is NULL) are part of every bundle.
+    """
+    if advertiser_id is None:
+        loader_cache.invalidate_all()
+    else:
+        loader_cache.invalidate_advertiser(advertiser_id)
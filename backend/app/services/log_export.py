@@ -0,0 +1,140 @@
+"""Streaming bulk export of health logs as NDJSON or CSV.
+
+Rows are read in keyset-ordered batches of ``EXPORT_BATCH_ROWS``, each
+fetched (with ``yield_per``) in its own short read transaction that ends
+before the batch is sent. A single cursor spanning the whole export would
+hold SQLite's shared lock for as long as the client takes to download it
+and keep the health log writer from committing. Memory use depends on the
+batch size only, never on the number of rows exported.
+
+A per-container export walks the (container_id, created_at) index in
+time order; a full export walks the table in id order, which follows
+creation time.
+"""
+from datetime import datetime
+from typing import Iterator, List, Optional
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import and_, or_
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.health_log import HealthLog
+from .rollups import to_utc_naive
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+COLUMNS = (
+    'id', 'container_id', 'referer', 'referer_host', 'ip_address',
+    'user_agent', 'is_allowed', 'created_at',
+)
+
+# Rows fetched per round trip and encoded per chunk of the response body
+_ROWS_PER_WRITE = 1000
+
+
+def _query_batches(
+    container_id: Optional[str],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    session_factory
+) -> Iterator[List[tuple]]:
+    columns = [getattr(HealthLog, column) for column in COLUMNS]
+    batch_rows = settings.export_batch_rows
+    last = None
+    while True:
+        db = session_factory()
+        try:
+            query = db.query(*columns)
+            if container_id is not None:
+                query = query.filter(HealthLog.container_id == container_id)
+            if start is not None:
+                query = query.filter(HealthLog.created_at >= start)
+            if end is not None:
+                query = query.filter(HealthLog.created_at < end)
+
+            if container_id is not None:
+                if last is not None:
+                    query = query.filter(or_(
+                        HealthLog.created_at > last[7],
+                        and_(HealthLog.created_at == last[7], HealthLog.id > last[0])
+                    ))
+                query = query.order_by(HealthLog.created_at, HealthLog.id)
+            else:
+                if last is not None:
+                    query = query.filter(HealthLog.id > last[0])
+                query = query.order_by(HealthLog.id)
+
+            batch = list(query.limit(batch_rows).yield_per(_ROWS_PER_WRITE))
+        finally:
+            # Closed before anything is sent, so a slow client never keeps
+            # the read transaction open
+            db.close()
+
+        for offset in range(0, len(batch), _ROWS_PER_WRITE):
+            yield batch[offset:offset + _ROWS_PER_WRITE]
+        if len(batch) < batch_rows:
+            return
+        last = batch[-1]
+
+
+def _encode_ndjson(rows: List[tuple]) -> bytes:
+    lines = []
+    for row in rows:
+        record = dict(zip(COLUMNS, row))
+        record['is_allowed'] = bool(record['is_allowed'])
+        record['created_at'] = record['created_at'].isoformat() if record['created_at'] else None
+        lines.append(json.dumps(record, separators=(',', ':')))
+    lines.append('')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _encode_csv(rows: List[tuple], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(COLUMNS)
+    for row in rows:
+        *values, is_allowed, created_at = row
+        writer.writerow([
+            *('' if value is None else value for value in values),
+            'true' if is_allowed else 'false',
+            created_at.isoformat() if created_at else '',
+        ])
+    return buffer.getvalue().encode('utf-8')
+
+
+def export_logs(
+    fmt: str = 'ndjson',
+    container_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    compress: bool = False,
+    session_factory=SessionLocal
+) -> Iterator[bytes]:
+    """Yield the encoded export body chunk by chunk (gzip-compressed with ``compress``)"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    start = to_utc_naive(start) if start else None
+    end = to_utc_naive(end) if end else None
+
+    # wbits=31: gzip container, so the output is a regular .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    if fmt == 'csv':
+        yield emit(_encode_csv([], header=True))
+    for rows in _query_batches(container_id, start, end, session_factory):
+        data = emit(_encode_ndjson(rows) if fmt == 'ndjson' else _encode_csv(rows))
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,236 @@
+from datetime import datetime
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional
+import logging
+import queue
+import time
+
+from sqlalchemy import insert
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.health_log import HealthLog
+from .domain_matcher import referer_host
+from .heavy_hitters import heavy_hitters
+from .live_events import live_events
+from .rollups import apply_log_rows
+from .uniques import apply_unique_rows
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+
+class HealthLogWriter:
+    """Batches loader health logs in memory and writes them in bulk.
+
+    ``submit`` only touches an in-memory bounded queue, so the loader never
+    waits on the database. A background thread flushes the queue with one
+    bulk INSERT every ``batch_size`` rows or ``flush_interval_ms``
+    milliseconds, whichever comes first.
+
+    When the queue is full the ``overflow_policy`` decides what happens:
+    ``drop_newest`` discards the incoming row, ``drop_oldest`` discards the
+    oldest queued row, and ``block`` waits up to ``block_timeout_ms`` for
+    space before dropping the incoming row.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval_ms: int = 200,
+        overflow_policy: str = 'drop_newest',
+        block_timeout_ms: int = 5,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log overflow policy: {overflow_policy}")
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout_ms / 1000
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_queue)
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._stats_lock = Lock()
+        self.rows_submitted = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_failed = 0
+        self.flushes = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_seconds = 0.0
+
+    @property
+    def may_block(self) -> bool:
+        """Whether ``submit`` can wait for room in the queue"""
+        return self.overflow_policy == 'block'
+
+    def submit(
+        self,
+        container_id: str,
+        referer: Optional[str],
+        ip_address: Optional[str],
+        user_agent: Optional[str],
+        is_allowed: bool,
+    ) -> bool:
+        """Queue a health log row. Returns False if the row was dropped.
+
+        With the ``block`` policy this may wait up to ``block_timeout``:
+        call it off the event loop then (see ``may_block``).
+        """
+        row = {
+            'container_id': container_id,
+            'referer': referer,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'is_allowed': is_allowed,
+            'created_at': datetime.utcnow(),
+        }
+        try:
+            if self.overflow_policy == 'block':
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            if self.overflow_policy != 'drop_oldest':
+                self._count_dropped(1)
+                return False
+            # Make room by discarding the oldest queued row
+            try:
+                self._queue.get_nowait()
+                self._count_dropped(1)
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self._count_dropped(1)
+                return False
+        with self._stats_lock:
+            self.rows_submitted += 1
+        return True
+
+    def start(self) -> None:
+        """Start the background flush thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='health-log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the background thread after flushing every queued row"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Anything left (e.g. the writer was never started) is flushed inline
+        self.flush()
+
+    def flush(self) -> None:
+        """Synchronously write every queued row"""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict:
+        """Return queue depth and write/drop/latency counters"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'overflow_policy': self.overflow_policy,
+                'rows_submitted': self.rows_submitted,
+                'rows_written': self.rows_written,
+                'rows_dropped': self.rows_dropped,
+                'rows_failed': self.rows_failed,
+                'flushes': self.flushes,
+                'last_flush_ms': self.last_flush_seconds * 1000,
+                'max_flush_ms': self.flush_seconds_max * 1000,
+                'avg_flush_ms': (self.flush_seconds_total / self.flushes * 1000) if self.flushes else 0.0,
+            }
+
+    def _count_dropped(self, count: int) -> None:
+        with self._stats_lock:
+            self.rows_dropped += count
+
+    def _drain(self, limit: int) -> List[Dict]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop.is_set():
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+        self.flush()
+
+    def _write(self, batch: List[Dict]) -> None:
+        started = time.perf_counter()
+        # Derived off the request path, in the writer thread
+        for row in batch:
+            row['referer_host'] = referer_host(row['referer'])
+        heavy_hitters.observe(batch)
+        db = self.session_factory()
+        try:
+            db.execute(insert(HealthLog), batch)
+            # Hourly rollups and daily unique visitor sketches are updated in
+            # the same transaction as the raw rows
+            apply_log_rows(db, batch)
+            apply_unique_rows(db, batch)
+            with live_events.commit_lock:
+                db.commit()
+                live_events.observe(batch)
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to write %d health log rows", len(batch))
+            with self._stats_lock:
+                self.rows_failed += len(batch)
+            return
+        finally:
+            db.close()
+
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.rows_written += len(batch)
+            self.flushes += 1
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+            self.last_flush_seconds = elapsed
+
+
+log_writer = HealthLogWriter(
+    max_queue=settings.log_queue_size,
+    batch_size=settings.log_batch_size,
+    flush_interval_ms=settings.log_flush_interval_ms,
+    overflow_policy=settings.log_overflow_policy,
+    block_timeout_ms=settings.log_block_timeout_ms,
+)
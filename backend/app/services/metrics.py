@@ -0,0 +1,414 @@
+"""In-process request metrics exposed in the Prometheus text format.
+
+Counters and histograms are plain Python objects guarded by a lock, so
+recording a request costs a few dictionary operations. Values owned by other
+components (loader cache, fragment memo, health log queue) are read when
+``/metrics`` is scraped instead of being mirrored on every request.
+
+Under ``run.py`` a scrape reaches one worker process out of several, so the
+workers share their metrics through files in ``METRICS_DIR``. Every worker
+writes its own every ``SHARE_SECONDS`` and at shutdown. The worker that
+answers a scrape adds up its current values and the files of the others:
+counters and histograms of every worker that ever ran (the master folds
+those of stopped workers into one file), gauges of the running ones only.
+"""
+from bisect import bisect_left
+from threading import Event, Lock, Thread
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+import time
+
+from ..config import settings
+from ..database import QueryStats, current_query_stats
+from .js_minifier import fragment_cache
+from .loader_cache import loader_cache
+from .live_events import live_events
+from .log_writer import log_writer
+from .rate_limiter import loader_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+# (name, type, help, [(series, value)]); a series is the sample name suffix
+# and labels, e.g. '_bucket{route="/api",le="0.5"}'
+Family = Tuple[str, str, str, List[Tuple[str, float]]]
+
+# Request latency and DB time buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# SQL statements per request
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+# Label used once the per-container series limit is reached
+OTHER_CONTAINERS = "other"
+
+# How often a worker shares its metrics with the others
+SHARE_SECONDS = 2
+# Counters and histograms of stopped workers
+RETIRED_FILE = 'retired.json'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = Lock()
+
+    def inc(self, labels: LabelValues = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def series_count(self) -> int:
+        return len(self._values)
+
+    def has_series(self, labels: LabelValues) -> bool:
+        return labels in self._values
+
+    def family(self) -> Family:
+        with self._lock:
+            items = list(self._values.items())
+        return self.name, 'counter', self.documentation, [
+            (_format_labels(self.labels, labels), value) for labels, value in items
+        ]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of label names"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...], buckets: Iterable[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = Lock()
+
+    def observe(self, labels: LabelValues, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def family(self) -> Family:
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        samples = []
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                samples.append((f'_bucket{_format_labels(self.labels, labels, le)}', cumulative))
+            samples.append((f'_sum{_format_labels(self.labels, labels)}', total))
+            samples.append((f'_count{_format_labels(self.labels, labels)}', cumulative))
+        return self.name, 'histogram', self.documentation, samples
+
+
+def _gauge(name: str, documentation: str, samples: Iterable[Tuple[str, float]]) -> Family:
+    return name, 'gauge', documentation, list(samples)
+
+
+def _counter(name: str, documentation: str, value: float) -> Family:
+    return name, 'counter', documentation, [('', value)]
+
+
+def _render(families: Iterable[Family]) -> str:
+    lines: List[str] = []
+    for name, kind, documentation, samples in families:
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{name}{series} {_format_value(value)}' for series, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def _add_up(sources: Iterable[Iterable[Family]]) -> List[Family]:
+    """Sum the samples of the same series over several processes"""
+    merged: Dict[str, Tuple[str, str, Dict[str, float]]] = {}
+    for families in sources:
+        for name, kind, documentation, samples in families:
+            if name not in merged:
+                merged[name] = (kind, documentation, {})
+            values = merged[name][2]
+            for series, value in samples:
+                values[series] = values.get(series, 0) + value
+    return [(name, kind, documentation, list(values.items()))
+            for name, (kind, documentation, values) in merged.items()]
+
+
+http_requests = Counter(
+    'tsprtg_http_requests_total', 'HTTP requests by route template, method and status.',
+    ('route', 'method', 'status'),
+)
+http_duration = Histogram(
+    'tsprtg_http_request_duration_seconds', 'Total request time by route template.',
+    ('route',), LATENCY_BUCKETS,
+)
+db_queries = Histogram(
+    'tsprtg_db_queries_per_request', 'SQL statements executed per request by route template.',
+    ('route',), QUERY_BUCKETS,
+)
+db_duration = Histogram(
+    'tsprtg_db_time_per_request_seconds', 'Time spent in SQL statements per request by route template.',
+    ('route',), LATENCY_BUCKETS,
+)
+container_loads = Counter(
+    'tsprtg_container_loads_total', 'Loader bootstrap requests per container and domain check result.',
+    ('container_id', 'allowed'),
+)
+loader_rate_limited = Counter(
+    'tsprtg_loader_rate_limited_total', 'Loader bootstrap requests answered 429 by the exhausted limit.',
+    ('limit',),
+)
+
+
+def observe_request(route: str, method: str, status: int, seconds: float, queries: QueryStats) -> None:
+    """Record one finished HTTP request"""
+    http_requests.inc((route, method, str(status)))
+    http_duration.observe((route,), seconds)
+    db_queries.observe((route,), queries.count)
+    db_duration.observe((route,), queries.seconds)
+
+
+def record_container_load(container_id: Optional[str], is_allowed: bool) -> None:
+    """Count a loader request; unknown or excess containers share one series.
+
+    ``container_id`` is None for containers that do not exist, so random
+    ids can not create new series.
+    """
+    allowed = 'true' if is_allowed else 'false'
+    labels = (container_id or OTHER_CONTAINERS, allowed)
+    if (
+        container_id is not None
+        and not container_loads.has_series(labels)
+        # Two series (allowed true/false) per container
+        and container_loads.series_count() >= settings.metrics_max_containers * 2
+    ):
+        labels = (OTHER_CONTAINERS, allowed)
+    container_loads.inc(labels)
+
+
+def record_rate_limited(limit: str) -> None:
+    """Count a loader request shed by the ``ip`` or ``container`` limit"""
+    loader_rate_limited.inc((limit,))
+
+
+def loader_stats() -> Dict:
+    """In-memory loader cache, rate limit, health log writer and live stream statistics"""
+    return {
+        'cache': loader_cache.stats(),
+        'rate_limits': loader_rate_limiter.stats(),
+        'log_writer': log_writer.stats(),
+        'live': live_events.stats(),
+    }
+
+
+def collect(stats: Optional[Dict] = None) -> List[Family]:
+    """Every metric of this process"""
+    stats = stats or loader_stats()
+    cache, limits, writer = stats['cache'], stats['rate_limits'], stats['log_writer']
+
+    families = [metric.family() for metric in (
+        http_requests, http_duration, db_queries, db_duration, container_loads, loader_rate_limited
+    )]
+    families.extend([
+        _counter('tsprtg_loader_cache_hits_total', 'Loader bundle cache hits.', cache['hits']),
+        _counter('tsprtg_loader_cache_misses_total', 'Loader bundle cache misses.', cache['misses']),
+        _counter('tsprtg_loader_cache_evictions_total', 'Loader bundles evicted by the LRU.', cache['evictions']),
+        _gauge('tsprtg_loader_cache_entries', 'Loader bundles held in memory.', [('', cache['entries'])]),
+        _gauge('tsprtg_loader_cache_bytes', 'Cached loader bundle bytes by encoding.', [
+            ('{encoding="identity"}', cache['identity_bytes']),
+            *((f'{{encoding="{encoding}"}}', size) for encoding, size in cache['compressed_bytes'].items()),
+        ]),
+        _gauge('tsprtg_loader_rate_buckets', 'Rate limit buckets held in memory by limit.', [
+            (f'{{limit="{limit}"}}', buckets['keys']) for limit, buckets in limits.items()
+        ]),
+        ('tsprtg_loader_rate_evicted_total', 'counter',
+         'Rate limit buckets dropped at the key limit before refilling.', [
+             (f'{{limit="{limit}"}}', buckets['evicted']) for limit, buckets in limits.items()
+         ]),
+        _counter('tsprtg_minify_cache_hits_total', 'Memoized minified fragment hits.', fragment_cache.hits),
+        _counter('tsprtg_minify_cache_misses_total', 'Memoized minified fragment misses.', fragment_cache.misses),
+
+        _gauge('tsprtg_log_queue_depth', 'Health log rows waiting to be written.', [('', writer['queue_depth'])]),
+        _gauge('tsprtg_log_queue_capacity', 'Health log queue bound.', [('', writer['queue_capacity'])]),
+        _counter('tsprtg_log_rows_written_total', 'Health log rows written.', writer['rows_written']),
+        _counter('tsprtg_log_rows_dropped_total', 'Health log rows dropped on overflow.', writer['rows_dropped']),
+        _counter('tsprtg_log_rows_failed_total', 'Health log rows lost to write errors.', writer['rows_failed']),
+        _counter('tsprtg_log_flushes_total', 'Bulk health log writes.', writer['flushes']),
+        _gauge('tsprtg_workers', 'Worker processes included in these metrics.', [('', 1)]),
+    ])
+    return families
+
+
+class SharedMetrics:
+    """Exchanges the metrics of the worker processes through ``directory``"""
+
+    def __init__(self, directory: str, interval: float = SHARE_SECONDS):
+        self.directory = directory
+        self.interval = interval
+        # Unlike the pid, never reused by a later worker
+        self.worker_id = f'{os.getpid()}-{time.time_ns()}'
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read(self, name: str) -> Optional[Dict]:
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Missing, or retired between listing and reading
+            return None
+
+    def _write(self, name: str, state: Dict) -> None:
+        temporary = self._path(f'{name}.{os.getpid()}.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(temporary, self._path(name))
+
+    def publish(self, stats: Optional[Dict] = None) -> Tuple[Dict, List[Family]]:
+        """Write the current metrics of this process for the other workers"""
+        stats = stats or loader_stats()
+        families = collect(stats)
+        self._write(f'{os.getpid()}.json', {
+            'pid': os.getpid(), 'worker': self.worker_id, 'stats': stats, 'families': families,
+        })
+        return stats, families
+
+    def _workers(self) -> Tuple[List[Dict], Dict]:
+        """States of the other running workers and the retired totals"""
+        own = f'{os.getpid()}.json'
+        names = [name for name in os.listdir(self.directory)
+                 if name.endswith('.json') and name not in (own, RETIRED_FILE)]
+        states = [state for state in map(self._read, names) if state is not None]
+        # Read after the worker files: the master writes it before deleting one
+        retired = self._read(RETIRED_FILE) or {'workers': [], 'families': []}
+        stopped = set(retired['workers'])
+        return [state for state in states if state['worker'] not in stopped], retired
+
+    def render(self) -> str:
+        """Metrics of all workers added up"""
+        _, families = self.publish()
+        workers, retired = self._workers()
+        return _render(_add_up([families, *(state['families'] for state in workers), retired['families']]))
+
+    def worker_stats(self, stats: Optional[Dict] = None) -> List[Dict]:
+        """``loader_stats()`` of every running worker, this one first"""
+        stats, _ = self.publish(stats)
+        workers, _ = self._workers()
+        return [{'pid': os.getpid(), **stats}, *({'pid': state['pid'], **state['stats']} for state in workers)]
+
+    def retire(self, pid: int) -> None:
+        """Keep the counters of a stopped worker (called by the master)"""
+        state = self._read(f'{pid}.json')
+        if state is None:
+            return
+        retired = self._read(RETIRED_FILE) or {'workers': [], 'families': []}
+        counters = [family for family in state['families'] if family[1] != 'gauge']
+        self._write(RETIRED_FILE, {
+            'workers': retired['workers'] + [state['worker']],
+            'families': _add_up([retired['families'], counters]),
+        })
+        os.unlink(self._path(f'{pid}.json'))
+
+    def start(self) -> None:
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='metrics-share', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread and share the final values"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        if self.enabled:
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Final metrics share failed")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Metrics share failed")
+
+
+shared_metrics = SharedMetrics(settings.metrics_dir)
+
+
+def render_metrics() -> str:
+    """Render every metric in the Prometheus text exposition format"""
+    if shared_metrics.enabled:
+        return shared_metrics.render()
+    return _render(collect())
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware recording time, status and SQL usage per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_query_stats.reset(token)
+            # FastAPI stores the matched route in the scope while routing
+            route = scope.get('route')
+            template = getattr(route, 'path', None) or 'unmatched'
+            observe_request(template, scope['method'], status, time.perf_counter() - started, stats)
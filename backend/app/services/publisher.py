@@ -0,0 +1,279 @@
+"""Static publish mode: pre-render container bundles to disk for nginx.
+
+Every active advertiser's minified bundle is written to
+``{publish_dir}/c/{container_id}/{hash}.js`` (plus ``.gz``/``.br`` siblings
+for ``gzip_static``/``brotli_static``), byte-identical to what the
+``/c/{container_id}/{hash}.js`` endpoint serves. nginx serves these files
+directly and falls back to the backend for anything not published yet.
+
+Publishing is incremental: ``manifest.json`` records a fingerprint of the
+inputs of every published bundle, and only containers whose fingerprint
+changed (or whose file went missing) are rendered again.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import fcntl
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.advertiser import Advertiser
+from ..models.script import Script
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".publish.lock"
+
+# File suffixes of the precompressed variants nginx can serve statically
+STATIC_ENCODINGS = {'gzip': '.gz', 'br': '.br'}
+
+# Container ids end up in paths; anything else is never published
+_SAFE_CONTAINER_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Containers rendered per worker task
+_CHUNK_SIZE = 50
+
+
+class PublishInProgress(RuntimeError):
+    """Raised when another publish holds the publish directory lock"""
+
+
+def _script_key(script: Script) -> Tuple:
+    # Everything generate_loader_script reads from a script
+    return (
+        script.id, script.name, script.script_type, script.content,
+        script.priority, bool(script.is_async), bool(script.is_defer),
+    )
+
+
+def compute_fingerprints(db: Session) -> Dict[str, Tuple[int, str]]:
+    """Return {container_id: (advertiser_id, fingerprint)} for active advertisers.
+
+    The fingerprint hashes every input of the rendered bundle, so it changes
+    whenever a global or advertiser script is added, edited, toggled or removed.
+    """
+    scripts = db.query(Script).filter(Script.is_enabled == True).order_by(
+        Script.priority, Script.id
+    ).all()
+
+    global_digest = hashlib.sha256()
+    own_scripts: Dict[int, List[Tuple]] = {}
+    for script in scripts:
+        if script.advertiser_id is None:
+            global_digest.update(repr(_script_key(script)).encode('utf-8'))
+        else:
+            own_scripts.setdefault(script.advertiser_id, []).append(_script_key(script))
+    global_hex = global_digest.hexdigest()
+
+    fingerprints = {}
+    advertisers = db.query(Advertiser.id, Advertiser.container_id).filter(
+        Advertiser.is_active == True
+    ).all()
+    for advertiser_id, container_id in advertisers:
+        if not _SAFE_CONTAINER_ID.match(container_id):
+            continue
+        digest = hashlib.sha256(global_hex.encode('ascii'))
+        digest.update(container_id.encode('utf-8'))
+        digest.update(repr(own_scripts.get(advertiser_id, [])).encode('utf-8'))
+        fingerprints[container_id] = (advertiser_id, digest.hexdigest())
+    return fingerprints
+
+
+def write_atomic(path: str, data: bytes, fsync: bool = False) -> None:
+    """Write a file via a temporary file in the same directory and a rename.
+
+    With ``fsync`` the data is on disk before the rename, for files whose
+    source is deleted afterwards.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+            if fsync:
+                tmp.flush()
+                os.fsync(tmp.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _container_dir(publish_dir: str, container_id: str) -> str:
+    return os.path.join(publish_dir, 'c', container_id)
+
+
+def _write_bundle(publish_dir: str, container_id: str, body: bytes) -> Tuple[str, int]:
+    """Write a bundle and its static variants; return (content hash, bytes written)"""
+    # Imported here so worker processes only load what rendering needs
+    from .compression import compress_variants
+    from .loader_cache import make_etag
+
+    content_hash = make_etag(body)[1:-1]
+    directory = _container_dir(publish_dir, container_id)
+    os.makedirs(directory, exist_ok=True)
+
+    filename = content_hash + '.js'
+    keep = {filename}
+    written = 0
+    # Variants first, so the .js never exists without them
+    for encoding, data in compress_variants(body).items():
+        suffix = STATIC_ENCODINGS.get(encoding)
+        if suffix is None:
+            continue
+        write_atomic(os.path.join(directory, filename + suffix), data)
+        keep.add(filename + suffix)
+        written += len(data)
+    write_atomic(os.path.join(directory, filename), body)
+    written += len(body)
+
+    # Old hashes fall back to the backend, which serves recently replaced
+    # bundles and answers 404 otherwise
+    for name in os.listdir(directory):
+        if name not in keep and not name.startswith('.tmp-'):
+            os.unlink(os.path.join(directory, name))
+    return content_hash, written
+
+
+def _render_chunk(publish_dir: str, advertiser_ids: List[int]) -> List[Tuple[str, str, int]]:
+    """Render and write the bundles of a batch of advertisers (runs in a worker)"""
+    from ..database import SessionLocal
+    from .container_generator import generate_loader_script
+
+    results = []
+    db = SessionLocal()
+    try:
+        advertisers = db.query(Advertiser).filter(Advertiser.id.in_(advertiser_ids)).all()
+        for advertiser in advertisers:
+            body = generate_loader_script(db, advertiser, minified=True).encode('utf-8')
+            content_hash, written = _write_bundle(publish_dir, advertiser.container_id, body)
+            results.append((advertiser.container_id, content_hash, written))
+    finally:
+        db.close()
+    return results
+
+
+def read_manifest(publish_dir: Optional[str] = None) -> Dict:
+    """Load the manifest of the last publish (empty when never published)"""
+    path = os.path.join(publish_dir or settings.publish_dir, MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'containers': {}}
+
+
+def _chunks(items: List[int], size: int) -> Iterable[List[int]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def publish(
+    db: Session,
+    publish_dir: Optional[str] = None,
+    full: bool = False,
+    workers: Optional[int] = None
+) -> Dict:
+    """Publish every active container bundle to ``publish_dir``.
+
+    Only containers whose inputs changed since the last publish are rendered
+    unless ``full`` is set. Bundles of inactive or deleted advertisers are
+    removed so that nginx falls back to the backend for them.
+    """
+    publish_dir = os.path.abspath(publish_dir or settings.publish_dir)
+    workers = workers or settings.publish_workers or os.cpu_count() or 1
+    os.makedirs(os.path.join(publish_dir, 'c'), exist_ok=True)
+
+    lock_file = open(os.path.join(publish_dir, LOCK_NAME), 'w')
+    try:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise PublishInProgress("Another publish is already running")
+        return _publish_locked(db, publish_dir, full, workers)
+    finally:
+        lock_file.close()
+
+
+def _publish_locked(db: Session, publish_dir: str, full: bool, workers: int) -> Dict:
+    started = time.perf_counter()
+    previous = read_manifest(publish_dir).get('containers', {})
+    fingerprints = compute_fingerprints(db)
+
+    pending = []
+    for container_id, (advertiser_id, fingerprint) in fingerprints.items():
+        entry = previous.get(container_id)
+        if (
+            not full
+            and entry is not None
+            and entry.get('fingerprint') == fingerprint
+            and os.path.exists(os.path.join(
+                _container_dir(publish_dir, container_id), entry['hash'] + '.js'
+            ))
+        ):
+            continue
+        pending.append(advertiser_id)
+
+    results: List[Tuple[str, str, int]] = []
+    chunks = list(_chunks(pending, _CHUNK_SIZE))
+    if workers > 1 and len(chunks) > 1:
+        # spawn: forking a threaded server process is not safe
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+            for chunk_results in pool.map(_render_chunk, [publish_dir] * len(chunks), chunks):
+                results.extend(chunk_results)
+    else:
+        for chunk in chunks:
+            results.extend(_render_chunk(publish_dir, chunk))
+
+    containers = {
+        container_id: entry for container_id, entry in previous.items()
+        if container_id in fingerprints
+    }
+    bytes_written = 0
+    for container_id, content_hash, written in results:
+        containers[container_id] = {
+            'hash': content_hash,
+            'fingerprint': fingerprints[container_id][1],
+        }
+        bytes_written += written
+
+    # Drop bundles of containers that are no longer active
+    removed = 0
+    bundles_root = os.path.join(publish_dir, 'c')
+    for name in os.listdir(bundles_root):
+        if name not in fingerprints:
+            shutil.rmtree(os.path.join(bundles_root, name), ignore_errors=True)
+            removed += 1
+
+    manifest = {
+        'published_at': datetime.utcnow().isoformat() + 'Z',
+        'containers': containers,
+    }
+    write_atomic(
+        os.path.join(publish_dir, MANIFEST_NAME),
+        json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+    )
+
+    return {
+        'publish_dir': publish_dir,
+        'published_at': manifest['published_at'],
+        'total': len(fingerprints),
+        'rendered': len(results),
+        'unchanged': len(fingerprints) - len(results),
+        'removed': removed,
+        'bytes_written': bytes_written,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
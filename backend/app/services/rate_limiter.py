@@ -0,0 +1,122 @@
+"""Token-bucket rate limits for the loader bootstrap (``/c/{id}/l.js``).
+
+Requests are limited per client IP and per container_id, each with its own
+rate and burst. A request must get a token from both buckets; a limited
+request is answered with a prebuilt 429 before the advertiser lookup and
+without a health log row.
+
+Buckets are kept in GCRA form: a bucket is a single float, the time at
+which it will be full again, so a key costs one entry in an ``OrderedDict``
+kept in last-use order. A bucket whose time has passed is full, which is
+the same as not tracking it, so idle keys are evicted from the old end a
+couple per request. ``LOADER_RATE_MAX_KEYS`` bounds the number of keys;
+past it the least recently used bucket is dropped, even if not yet full.
+
+Limits apply per worker process.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import time
+
+from ..config import settings
+
+# Idle buckets evicted per call
+_SWEEP = 2
+
+
+class TokenBuckets:
+    """One bucket of ``burst`` tokens refilled at ``rate`` per second per key"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int):
+        self.rate = rate
+        self.interval = 1 / rate if rate > 0 else 0.0
+        # How far ahead of now a bucket's full time may be after taking a token
+        self.capacity = max(1, burst) * self.interval
+        self.max_keys = max(1, max_keys)
+        self._full_at: "OrderedDict[str, float]" = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, key: str, now: float) -> float:
+        """Take a token for ``key``: 0 if granted, else seconds until one is"""
+        buckets = self._full_at
+        full_at = buckets.get(key)
+        if full_at is None or full_at < now:
+            full_at = now
+        ahead = full_at + self.interval - now
+        if ahead > self.capacity:
+            wait = ahead - self.capacity
+        else:
+            wait = 0.0
+            full_at += self.interval
+        buckets[key] = full_at
+        buckets.move_to_end(key)
+        self._evict(now)
+        if wait:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def _evict(self, now: float) -> None:
+        buckets = self._full_at
+        for _ in range(_SWEEP):
+            oldest = next(iter(buckets))
+            if buckets[oldest] > now:
+                break
+            del buckets[oldest]
+        while len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> Dict:
+        return {
+            'rate': self.rate,
+            'keys': len(self._full_at),
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'evicted': self.evicted,
+        }
+
+
+class LoaderRateLimiter:
+    """Per-IP and per-container buckets for the loader bootstrap"""
+
+    def __init__(self, ip_rate: float, ip_burst: int, container_rate: float, container_burst: int,
+                 max_keys: int):
+        self.by_ip = TokenBuckets(ip_rate, ip_burst, max_keys)
+        self.by_container = TokenBuckets(container_rate, container_burst, max_keys)
+
+    def check(self, ip_address: Optional[str], container_id: str) -> Tuple[Optional[str], float]:
+        """``(None, 0)`` when the request may proceed, else the exhausted limit
+        (``'ip'`` or ``'container'``) and the seconds until it has a token.
+
+        Called on the event loop only, so the buckets need no lock.
+        """
+        now = time.monotonic()
+        if ip_address and self.by_ip.enabled:
+            wait = self.by_ip.take(ip_address, now)
+            if wait:
+                return 'ip', wait
+        if self.by_container.enabled:
+            wait = self.by_container.take(container_id, now)
+            if wait:
+                return 'container', wait
+        return None, 0.0
+
+    def stats(self) -> Dict:
+        return {'ip': self.by_ip.stats(), 'container': self.by_container.stats()}
+
+
+loader_rate_limiter = LoaderRateLimiter(
+    ip_rate=settings.loader_rate_per_ip,
+    ip_burst=settings.loader_burst_per_ip,
+    container_rate=settings.loader_rate_per_container,
+    container_burst=settings.loader_burst_per_container,
+    max_keys=settings.loader_rate_max_keys,
+)
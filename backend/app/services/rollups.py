@@ -0,0 +1,179 @@
+"""Hourly container load rollups.
+
+``container_load_rollups`` holds one row per (container_id, UTC hour,
+allowed/denied) with the number of loader requests and the latest request
+time. The health log writer updates it in the same transaction as the raw
+rows, so statistics and load curves never scan ``health_logs``.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models.container_load_rollup import ContainerLoadRollup
+from ..models.health_log import HealthLog
+
+INTERVALS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+# Upper bound on the points of one time series response
+MAX_SERIES_POINTS = 10000
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """Timestamps are stored as naive UTC; convert aware datetimes"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def truncate(value: datetime, interval: str = 'hour') -> datetime:
+    """Start of the hour or UTC day containing ``value``"""
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if interval == 'day':
+        value = value.replace(hour=0)
+    return value
+
+
+def aggregate_logs(rows: Iterable[Dict]) -> List[Dict]:
+    """Fold health log rows into rollup increments"""
+    buckets: Dict[Tuple, Dict] = {}
+    for row in rows:
+        created_at = row['created_at']
+        key = (row['container_id'], truncate(created_at), bool(row['is_allowed']))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = {
+                'container_id': key[0],
+                'bucket_start': key[1],
+                'is_allowed': key[2],
+                'loads': 1,
+                'last_load': created_at,
+            }
+        else:
+            bucket['loads'] += 1
+            bucket['last_load'] = max(bucket['last_load'], created_at)
+    return list(buckets.values())
+
+
+def apply_log_rows(db: Session, rows: List[Dict]) -> None:
+    """Add freshly inserted health log rows to the rollups (caller commits)"""
+    increments = aggregate_logs(rows)
+    if not increments:
+        return
+
+    if db.get_bind().dialect.name == 'postgresql':
+        stmt = postgresql.insert(ContainerLoadRollup)
+        latest = func.greatest
+    else:
+        stmt = sqlite.insert(ContainerLoadRollup)
+        # SQLite's two-argument max() is a scalar function
+        latest = func.max
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['container_id', 'bucket_start', 'is_allowed'],
+        set_={
+            'loads': ContainerLoadRollup.loads + stmt.excluded.loads,
+            'last_load': latest(ContainerLoadRollup.last_load, stmt.excluded.last_load),
+        }
+    )
+    db.execute(stmt, increments)
+
+
+def _hour_bucket(db: Session, column):
+    if db.get_bind().dialect.name == 'postgresql':
+        return func.date_trunc('hour', column)
+    # Same text format SQLAlchemy uses for DateTime values on SQLite
+    return func.strftime('%Y-%m-%d %H:00:00.000000', column)
+
+
+def rebuild_rollups(db: Session) -> int:
+    """Recompute the rollups of every hour still in health_logs, in one transaction.
+
+    Rollups of earlier hours, whose rows have been archived, are kept. So is
+    the rollup of the earliest hour when it starts before the oldest row
+    left, as the archiver may have moved part of that hour out. The health
+    log writer updates rows in its own transactions, so rebuilding while the
+    app runs neither loses nor double counts loads. Returns the number of
+    rollup rows.
+    """
+    first = db.query(func.min(HealthLog.created_at)).scalar()
+    if first is None:
+        return db.query(func.count()).select_from(ContainerLoadRollup).scalar()
+    start = truncate(to_utc_naive(first))
+    if start < to_utc_naive(first):
+        start += timedelta(hours=1)
+
+    bucket = _hour_bucket(db, HealthLog.created_at)
+    allowed = func.coalesce(HealthLog.is_allowed, False)
+    db.query(ContainerLoadRollup).filter(
+        ContainerLoadRollup.bucket_start >= start
+    ).delete(synchronize_session=False)
+    db.execute(
+        insert(ContainerLoadRollup).from_select(
+            ['container_id', 'bucket_start', 'is_allowed', 'loads', 'last_load'],
+            select(
+                HealthLog.container_id, bucket, allowed,
+                func.count(), func.max(HealthLog.created_at)
+            ).where(HealthLog.created_at >= start).group_by(HealthLog.container_id, bucket, allowed)
+        )
+    )
+    db.commit()
+    return db.query(func.count()).select_from(ContainerLoadRollup).scalar()
+
+
+def load_summary_query(db: Session, one_day_ago: datetime, one_week_ago: datetime):
+    """Loads in the last day/week and last load time per container.
+
+    Counts include the whole hour that contains ``one_day_ago`` and
+    ``one_week_ago``.
+    """
+    R = ContainerLoadRollup
+    return db.query(
+        R.container_id,
+        func.sum(case((R.bucket_start >= truncate(one_day_ago), R.loads), else_=0)).label('loads_today'),
+        func.sum(case((R.bucket_start >= truncate(one_week_ago), R.loads), else_=0)).label('loads_week'),
+        func.max(R.last_load).label('last_load')
+    ).group_by(R.container_id)
+
+
+def get_load_series(
+    db: Session,
+    container_id: str,
+    start: datetime,
+    end: datetime,
+    interval: str = 'hour'
+) -> List[Dict]:
+    """Allowed/denied loads per hour or UTC day in [start, end), zero-filled"""
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of: {', '.join(INTERVALS)}")
+    step = INTERVALS[interval]
+    start = truncate(to_utc_naive(start), interval)
+    end = to_utc_naive(end)
+    if end <= start:
+        raise ValueError("end must be after start")
+    if (end - start) / step > MAX_SERIES_POINTS:
+        raise ValueError(f"range too large: at most {MAX_SERIES_POINTS} {interval} points")
+
+    points: Dict[datetime, Dict] = {}
+    bucket = start
+    while bucket < end:
+        points[bucket] = {'bucket_start': bucket, 'allowed': 0, 'denied': 0, 'total': 0}
+        bucket += step
+
+    rows = db.query(
+        ContainerLoadRollup.bucket_start,
+        ContainerLoadRollup.is_allowed,
+        ContainerLoadRollup.loads
+    ).filter(
+        ContainerLoadRollup.container_id == container_id,
+        ContainerLoadRollup.bucket_start >= start,
+        ContainerLoadRollup.bucket_start < end
+    )
+    for bucket_start, is_allowed, loads in rows:
+        point = points.get(truncate(bucket_start, interval))
+        if point is None:
+            continue
+        point['allowed' if is_allowed else 'denied'] += loads
+        point['total'] += loads
+    return list(points.values())
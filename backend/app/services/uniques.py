@@ -0,0 +1,159 @@
+"""Daily unique visitor sketches per container.
+
+``container_unique_sketches`` holds one HyperLogLog sketch (4 KB) of the
+distinct visitors (IP address + user agent) seen per container and UTC
+day. The health log writer folds every batch into the sketches in the same
+transaction as the raw rows. Counting the visitors of any range of days
+merges that range's sketches and never touches ``health_logs``.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models.container_unique_sketch import ContainerUniqueSketch
+from ..models.health_log import HealthLog
+from .hyperloglog import HyperLogLog, standard_error
+from .rollups import to_utc_naive
+
+# Relative standard error of every unique visitor estimate
+UNIQUES_ERROR = round(standard_error(), 4)
+
+# Keys per IN (...) list, well below SQLite's bound parameter limit
+_CHUNK = 500
+
+
+def visitor_key(ip_address: Optional[str], user_agent: Optional[str]) -> Optional[str]:
+    """What identifies a visitor; None when a row carries neither part"""
+    if not ip_address and not user_agent:
+        return None
+    return f"{ip_address or ''}|{user_agent or ''}"
+
+
+def sketch_rows(rows: Iterable[Dict]) -> Dict[Tuple[str, date], HyperLogLog]:
+    """Fold health log rows into a sketch per (container_id, day)"""
+    sketches: Dict[Tuple[str, date], HyperLogLog] = {}
+    for row in rows:
+        key = visitor_key(row.get('ip_address'), row.get('user_agent'))
+        if key is None:
+            continue
+        bucket = (row['container_id'], row['created_at'].date())
+        sketch = sketches.get(bucket)
+        if sketch is None:
+            sketch = sketches[bucket] = HyperLogLog()
+        sketch.add(key)
+    return sketches
+
+
+def _chunks(items: List, size: int = _CHUNK) -> Iterable[List]:
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+# Placeholder of a claimed row; always overwritten in the same transaction
+_EMPTY_SKETCH = HyperLogLog().to_bytes()
+
+
+def _store(db: Session, sketches: Dict[Tuple[str, date], HyperLogLog]) -> None:
+    """Merge sketches into the stored ones (caller commits)"""
+    if not sketches:
+        return
+    if db.get_bind().dialect.name == 'postgresql':
+        insert = postgresql.insert
+    else:
+        insert = sqlite.insert
+    # Claim the rows with an upsert that leaves them as they are, so that
+    # other processes merging into them wait for this transaction (the read
+    # below then runs on the writer, in the same transaction)
+    claim = insert(ContainerUniqueSketch)
+    db.execute(
+        claim.on_conflict_do_update(
+            index_elements=['container_id', 'day'],
+            set_={'sketch': ContainerUniqueSketch.sketch}
+        ),
+        [{'container_id': container_id, 'day': day, 'sketch': _EMPTY_SKETCH}
+         for container_id, day in sketches]
+    )
+    for chunk in _chunks(list(sketches)):
+        stored = db.execute(
+            select(ContainerUniqueSketch.container_id, ContainerUniqueSketch.day, ContainerUniqueSketch.sketch)
+            .where(tuple_(ContainerUniqueSketch.container_id, ContainerUniqueSketch.day).in_(chunk))
+        )
+        for container_id, day, blob in stored:
+            sketches[(container_id, day)].merge(HyperLogLog.from_bytes(blob))
+
+    stmt = insert(ContainerUniqueSketch)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['container_id', 'day'],
+        set_={'sketch': stmt.excluded.sketch}
+    )
+    db.execute(stmt, [
+        {'container_id': container_id, 'day': day, 'sketch': sketch.to_bytes()}
+        for (container_id, day), sketch in sketches.items()
+    ])
+
+
+def apply_unique_rows(db: Session, rows: Iterable[Dict]) -> None:
+    """Add freshly inserted health log rows to the daily sketches (caller commits)"""
+    _store(db, sketch_rows(rows))
+
+
+def rebuild_unique_sketches(db: Session, batch_size: int = 50000) -> int:
+    """Recompute the sketches of every day still in health_logs.
+
+    Sketches of earlier days, whose rows have been archived, are kept. So is
+    the sketch of the earliest day when it starts before the oldest row
+    left, as the archiver may have moved part of that day out. Rows are
+    folded in batches, so memory stays bounded. Runs in one transaction,
+    like rebuild_rollups. Returns the number of sketches.
+    """
+    first = db.query(func.min(HealthLog.created_at)).scalar()
+    if first is None:
+        return db.query(func.count()).select_from(ContainerUniqueSketch).scalar()
+    first = to_utc_naive(first)
+    start = datetime.combine(first.date(), time.min)
+    if start < first:
+        start += timedelta(days=1)
+    db.query(ContainerUniqueSketch).filter(
+        ContainerUniqueSketch.day >= start.date()
+    ).delete(synchronize_session=False)
+
+    columns = (HealthLog.id, HealthLog.container_id, HealthLog.ip_address,
+               HealthLog.user_agent, HealthLog.created_at)
+    last_id = 0
+    while True:
+        rows = db.query(*columns).filter(
+            HealthLog.id > last_id, HealthLog.created_at >= start
+        ).order_by(HealthLog.id).limit(batch_size).all()
+        if not rows:
+            break
+        apply_unique_rows(db, (row._asdict() for row in rows))
+        last_id = rows[-1].id
+    db.commit()
+    return db.query(func.count()).select_from(ContainerUniqueSketch).scalar()
+
+
+def unique_visitor_stats(db: Session, container_id: str, today: date) -> Dict:
+    """Unique visitors of UTC day ``today`` and of the last 7 and 30 days"""
+    today_sketch = HyperLogLog()
+    week = HyperLogLog()
+    month = HyperLogLog()
+    for day, blob in db.query(ContainerUniqueSketch.day, ContainerUniqueSketch.sketch).filter(
+        ContainerUniqueSketch.container_id == container_id,
+        ContainerUniqueSketch.day > today - timedelta(days=30),
+        ContainerUniqueSketch.day <= today
+    ):
+        sketch = HyperLogLog.from_bytes(blob)
+        month.merge(sketch)
+        if day > today - timedelta(days=7):
+            week.merge(sketch)
+        if day == today:
+            today_sketch = sketch
+    return {
+        'uniques_today': today_sketch.count(),
+        'uniques_week': week.count(),
+        'uniques_month': month.count(),
+        'uniques_error': UNIQUES_ERROR,
+    }
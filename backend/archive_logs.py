@@ -0,0 +1,21 @@
+"""Move health logs older than the retention period into archive segments.
+
+The app does this every ARCHIVE_INTERVAL_MINUTES when LOG_RETENTION_DAYS is
+set; this command runs it once, e.g. from cron.
+
+Usage:
+    python archive_logs.py [--days N]
+"""
+import argparse
+import json
+
+from app.database import init_db
+from app.services.archiver import archive_old_logs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old health logs")
+    parser.add_argument("--days", type=int, help="retention in days (default: LOG_RETENTION_DAYS)")
+    args = parser.parse_args()
+
+    init_db()
+    print(json.dumps(archive_old_logs(retention_days=args.days), indent=2))
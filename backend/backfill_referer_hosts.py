@@ -0,0 +1,22 @@
+"""Fill health_logs.referer_host for rows written before the column existed.
+
+Run once after upgrading so that filtering logs by referer host also
+covers older rows. Safe while the app is running.
+
+Usage:
+    python backfill_referer_hosts.py
+"""
+import time
+
+from app.database import SessionLocal, init_db
+from app.services.health_checker import backfill_referer_hosts
+
+if __name__ == "__main__":
+    init_db()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        rows = backfill_referer_hosts(db)
+    finally:
+        db.close()
+    print(f"Updated {rows} health log rows in {time.perf_counter() - started:.1f}s")
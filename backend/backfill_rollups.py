@@ -0,0 +1,27 @@
+"""Rebuild the hourly container load rollups and the daily unique visitor
+sketches from the raw health logs.
+
+Run once after upgrading (existing logs predate the rollups), or at any
+time to repair them. Safe while the app is running. Periods whose logs
+have been archived keep their rollups and sketches.
+
+Usage:
+    python backfill_rollups.py
+"""
+import time
+
+from app.database import SessionLocal, init_db
+from app.services.rollups import rebuild_rollups
+from app.services.uniques import rebuild_unique_sketches
+
+if __name__ == "__main__":
+    init_db()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        rows = rebuild_rollups(db)
+        sketches = rebuild_unique_sketches(db)
+    finally:
+        db.close()
+    print(f"Rebuilt {rows} rollup rows and {sketches} unique visitor sketches "
+          f"in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,157 @@
+"""Advertiser listing benchmark: full list vs. keyset pages and search.
+
+Seeds ``--advertisers`` advertisers with a few random domains each into a
+scratch SQLite database (production profile, FTS5 search index) and times:
+
+* full     - the previous endpoint: every row, json.loads and an
+             AdvertiserResponse per row (run ``--full-repeat`` times)
+* first    - first page of ``--limit`` in creation order
+* deep     - pages at random positions, following a cursor
+* by name  - pages at random positions sorted by name, descending
+* search   - name/domain word and container_id prefix searches
+
+reporting p50/p99 latency of the query plus the JSON rendering. Run from
+the backend directory:
+
+    python -m benchmarks.bench_advertisers [--advertisers 100000] [--limit 50]
+"""
+import argparse
+import json
+import math
+import random
+import shutil
+import string
+import tempfile
+import time
+
+from sqlalchemy import insert
+
+from app.database import Base, make_engine, make_session_factory
+from app.models.advertiser import Advertiser
+from app.schemas.schemas import AdvertiserResponse
+from app.services.advertiser_search import (
+    encode_advertiser_cursor, list_advertisers_page, render_advertisers_json
+)
+from benchmarks.datasets import random_domain
+
+WORDS = ('acme', 'globex', 'initech', 'umbrella', 'hooli', 'stark', 'wayne', 'wonka', 'tyrell', 'cyberdyne')
+
+
+def container_id(rng: random.Random) -> str:
+    """Random like generate_container_id, so prefixes are as selective"""
+    return 'adv_' + ''.join(rng.choice(string.ascii_lowercase + string.digits) for _ in range(8))
+
+
+def seed(session_factory, count: int, rng: random.Random) -> list:
+    container_ids = set()
+    while len(container_ids) < count:
+        container_ids.add(container_id(rng))
+    container_ids = sorted(container_ids)
+    rng.shuffle(container_ids)
+    db = session_factory()
+    try:
+        for start in range(1, count + 1, 10000):
+            db.execute(insert(Advertiser), [{
+                'id': i,
+                'name': f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}",
+                'container_id': container_ids[i - 1],
+                'domains': json.dumps([random_domain(rng) for _ in range(rng.randint(1, 5))]),
+                'is_active': rng.random() < 0.95,
+            } for i in range(start, min(start + 10000, count + 1))])
+        db.commit()
+    finally:
+        db.close()
+    return container_ids
+
+
+def legacy_list(db) -> bytes:
+    """Copy of the previous list_advertisers, serialized like FastAPI does"""
+    result = []
+    for adv in db.query(Advertiser).all():
+        result.append(AdvertiserResponse(
+            id=adv.id, name=adv.name, container_id=adv.container_id,
+            domains=json.loads(adv.domains) if adv.domains else [],
+            is_active=adv.is_active, created_at=adv.created_at, updated_at=adv.updated_at
+        ))
+    return json.dumps([item.model_dump(mode='json') for item in result]).encode('utf-8')
+
+
+def page(db, limit: int, sort: str = 'created_at', descending: bool = False, after=None, q=None) -> bytes:
+    """What the endpoint does for one page"""
+    rows = list_advertisers_page(db, limit=limit + 1, sort=sort, descending=descending, after=after, q=q)
+    body = render_advertisers_json(rows[:limit])
+    if len(rows) > limit:
+        encode_advertiser_cursor(sort, rows[limit - 1])
+    return body
+
+
+def measure(session_factory, calls) -> dict:
+    timings = []
+    for call in calls:
+        db = session_factory()
+        try:
+            started = time.perf_counter()
+            call(db)
+            timings.append(time.perf_counter() - started)
+        finally:
+            db.close()
+    timings.sort()
+
+    def pct(p):
+        return timings[max(0, math.ceil(p / 100 * len(timings)) - 1)] * 1000
+
+    return {'runs': len(timings), 'p50_ms': pct(50), 'p99_ms': pct(99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--advertisers", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=50, help="rows per page")
+    parser.add_argument("--repeat", type=int, default=300, help="pages timed per workload")
+    parser.add_argument("--full-repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    directory = tempfile.mkdtemp(prefix="tsprtg-bench-")
+    url = f"sqlite:///{directory}/advertisers.db"
+    engine = make_engine(url, 'production')
+    writer_engine = make_engine(url, 'production', writer=True)
+    session_factory = make_session_factory(engine, writer_engine)
+    try:
+        Base.metadata.create_all(bind=writer_engine)
+        container_ids = seed(session_factory, args.advertisers, rng)
+
+        db = session_factory()
+        try:
+            # Cursor positions spread over the whole table, per sort order
+            by_id = [(i, i) for i in range(1, args.advertisers + 1)]
+            by_name = [(name, i) for i, name in db.query(Advertiser.id, Advertiser.name)]
+        finally:
+            db.close()
+        size = len(page(session_factory(), args.limit))
+        searches = [rng.choice(WORDS)[:rng.randint(2, 6)] for _ in range(args.repeat // 2)]
+        searches += [rng.choice(container_ids)[:rng.randint(6, 12)] for _ in range(args.repeat // 2)]
+
+        workloads = [
+            ('full', [legacy_list] * args.full_repeat),
+            ('first', [lambda db: page(db, args.limit)] * args.repeat),
+            ('deep', [lambda db, after=rng.choice(by_id): page(db, args.limit, after=after)
+                      for _ in range(args.repeat)]),
+            ('by name', [lambda db, after=rng.choice(by_name): page(db, args.limit, 'name', True, after)
+                         for _ in range(args.repeat)]),
+            ('search', [lambda db, q=q: page(db, args.limit, q=q) for q in searches]),
+        ]
+
+        print(f"{args.advertisers:,} advertisers, pages of {args.limit} ({size:,} bytes)")
+        print(f"{'workload':>9} {'runs':>6} {'p50 ms':>9} {'p99 ms':>9}")
+        for name, calls in workloads:
+            result = measure(session_factory, calls)
+            print(f"{name:>9} {result['runs']:>6,} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+    finally:
+        engine.dispose()
+        writer_engine.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
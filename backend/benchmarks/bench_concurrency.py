@@ -0,0 +1,189 @@
+"""Concurrency benchmark: sync (threadpool) vs. async loader endpoint.
+
+Starts the app under uvicorn against a scratch SQLite database seeded with
+the medium dataset and opens ``--connections`` simultaneous keep-alive
+connections, each sending ``--requests`` bootstrap requests. It runs once
+against ``/legacy/c/{id}/l.js``, a copy of the previous sync endpoint (one
+threadpool worker per request, about 40), and once against the async
+``/c/{id}/l.js``, and reports throughput, latency and failed requests.
+Run from the backend directory:
+
+    python -m benchmarks.bench_concurrency [--connections 1000] [--requests 20]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+if __name__ == "__main__":
+    # The app binds its engines at import time: point them at a scratch
+    # database, which the server process inherits through the environment
+    _DB_DIR = tempfile.mkdtemp(prefix="tsprtg-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/bench.db"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    # All requests come from one IP: the loader rate limits would shed them
+    os.environ["LOADER_RATE_PER_IP"] = "0"
+    os.environ["LOADER_RATE_PER_CONTAINER"] = "0"
+
+from fastapi import Depends, Request  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import SessionLocal, get_db, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.advertiser import Advertiser  # noqa: E402
+from app.routers.loader import (  # noqa: E402
+    BOOTSTRAP_HEADERS, NOT_FOUND_ETAG, NOT_FOUND_JS, js_response
+)
+from app.services.container_generator import generate_bootstrap_script  # noqa: E402
+from app.services.domain_matcher import get_domain_matcher  # noqa: E402
+from app.services.loader_cache import get_loader_bundle, make_etag  # noqa: E402
+from app.services.log_writer import log_writer  # noqa: E402
+from benchmarks.datasets import SCENARIOS, seed  # noqa: E402
+
+
+@app.get("/legacy/c/{container_id}/l.js", include_in_schema=False)
+def legacy_load_container(container_id: str, request: Request, db: Session = Depends(get_db)):
+    """Copy of the previous sync load_container"""
+    advertiser = db.query(Advertiser).filter(Advertiser.container_id == container_id).first()
+    referer = request.headers.get('referer', '')
+    js_code, etag, is_allowed = NOT_FOUND_JS, NOT_FOUND_ETAG, False
+    if advertiser:
+        is_allowed = advertiser.is_active and get_domain_matcher(advertiser).matches(referer)
+        if is_allowed:
+            bundle = get_loader_bundle(db, advertiser)
+            bundle_url = f"//{request.url.netloc}/c/{container_id}/{bundle.content_hash}.js"
+            js_code = generate_bootstrap_script(bundle_url).encode('utf-8')
+            etag = make_etag(js_code)
+    log_writer.submit(
+        container_id=container_id,
+        referer=referer,
+        ip_address=request.client.host if request.client else None,
+        user_agent=request.headers.get('user-agent', ''),
+        is_allowed=is_allowed
+    )
+    return js_response(request, js_code, etag, BOOTSTRAP_HEADERS)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def connection(port: int, targets: list, requests: int, latencies: list, errors: list, rng: random.Random):
+    """One keep-alive connection sending ``requests`` requests back to back"""
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError as e:
+        errors.append(repr(e))
+        return
+    try:
+        for _ in range(requests):
+            path, referer = rng.choice(targets)
+            started = time.perf_counter()
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: bench.local\r\nReferer: {referer}\r\n\r\n".encode()
+            )
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if not head.startswith(b"HTTP/1.1 200"):
+                errors.append(head.split(b"\r\n", 1)[0].decode())
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errors.append(repr(e))
+    finally:
+        writer.close()
+
+
+async def load(port: int, targets: list, connections: int, requests: int) -> dict:
+    latencies, errors = [], []
+    rng = random.Random(1)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        connection(port, targets, requests, latencies, errors, random.Random(rng.random()))
+        for _ in range(connections)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(p):
+        return latencies[max(0, math.ceil(p / 100 * len(latencies)) - 1)] * 1000 if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "req_per_sec": len(latencies) / elapsed,
+        "p50_ms": pct(50),
+        "p99_ms": pct(99),
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20, help="requests per connection")
+    parser.add_argument("--containers", type=int, default=200, help="distinct containers requested")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        seed(db, SCENARIOS["medium"], 42)
+        advertisers = db.query(Advertiser).filter(Advertiser.is_active == True).limit(args.containers).all()
+        targets = [
+            (f"/c/{advertiser.container_id}/l.js", f"https://{json.loads(advertiser.domains)[0]}/")
+            for advertiser in advertisers if json.loads(advertiser.domains)
+        ]
+    finally:
+        db.close()
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_concurrency:app",
+         "--port", str(port), "--log-level", "warning", "--no-access-log", "--backlog", "4096"],
+        env=os.environ.copy()
+    )
+    try:
+        wait_for_server(port)
+        # Render every bundle once so both variants measure the cached path
+        asyncio.run(load(port, targets, 10, len(targets)))
+
+        print(f"{args.connections:,} connections x {args.requests} requests, {len(targets)} containers")
+        print(f"{'endpoint':>8} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+        for name, prefix in (("sync", "/legacy"), ("async", "")):
+            variant = [(prefix + path, referer) for path, referer in targets]
+            result = asyncio.run(load(port, variant, args.connections, args.requests))
+            print(f"{name:>8} {result['requests']:>9,} {result['req_per_sec']:>8,.0f} {result['p50_ms']:>9.1f} "
+                  f"{result['p99_ms']:>9.1f} {result['max_ms']:>9.1f} {result['errors']:>7,}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
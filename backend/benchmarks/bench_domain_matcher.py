@@ -0,0 +1,95 @@
+"""Microbenchmark: compiled domain matcher vs. the linear is_domain_allowed.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_domain_matcher [--domains 10,100,1000]
+"""
+import argparse
+import json
+import random
+import string
+import timeit
+
+from app.routers.loader import is_domain_allowed
+from app.services.domain_matcher import compile_domains
+
+
+def random_domain(rng: random.Random) -> str:
+    name = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+    return f"{name}.{rng.choice(['com', 'net', 'org', 'io', 'co.uk'])}"
+
+
+def build_referers(rng: random.Random, domains: list, count: int) -> list:
+    """Mix of exact, subdomain, www and unknown referers"""
+    referers = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.3:
+            host = rng.choice(domains)
+        elif kind < 0.6:
+            host = f"shop.{rng.choice(domains)}"
+        elif kind < 0.8:
+            host = f"www.{rng.choice(domains)}"
+        else:
+            host = random_domain(rng)
+        referers.append(f"https://{host}/some/page?q=1")
+    return referers
+
+
+# Allowlist entries with stray dots and referers they could be confused with
+EDGE_DOMAINS = ['example.com', '.example.com', 'example.com.', 'shop..example.com', '.co', 'com..a', '.', '..', '']
+EDGE_HOSTS = [
+    'example.com', 'www.example.com', 'shop.example.com', '.example.com', 'x..example.com',
+    'example.com.', 'shop.example.com.', 'shop..example.com', 'a.shop..example.com', 'evil.co',
+    'x.co', '.co', 'b.a', 'com..a', 'x.com..a', '.', '..', 'a.', 'a..', 'example..com',
+]
+
+
+def check_edge_cases() -> None:
+    """The matcher must agree with is_domain_allowed on malformed entries"""
+    for size in range(1, len(EDGE_DOMAINS) + 1):
+        for start in range(len(EDGE_DOMAINS) - size + 1):
+            domains = EDGE_DOMAINS[start:start + size]
+            matcher = compile_domains(json.dumps(domains))
+            for host in EDGE_HOSTS:
+                referer = f"https://{host}/page"
+                assert matcher.matches(referer) == is_domain_allowed(referer, domains), (domains, referer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--domains", default="1,10,100,1000", help="comma-separated allowlist sizes")
+    parser.add_argument("--referers", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    check_edge_cases()
+    rng = random.Random(42)
+    print(f"{'domains':>8} {'linear ops/s':>14} {'compiled ops/s':>15} {'speedup':>8}")
+    for size in [int(n) for n in args.domains.split(",")]:
+        domains = [random_domain(rng) for _ in range(size)]
+        raw_domains = json.dumps(domains)
+        referers = build_referers(rng, domains, args.referers)
+        matcher = compile_domains(raw_domains)
+
+        # Both implementations must agree before timing them
+        for referer in referers:
+            assert matcher.matches(referer) == is_domain_allowed(referer, domains), referer
+
+        # The old loader parsed the JSON column on every request
+        def linear():
+            for referer in referers:
+                is_domain_allowed(referer, json.loads(raw_domains))
+
+        def compiled():
+            for referer in referers:
+                matcher.matches(referer)
+
+        linear_time = min(timeit.repeat(linear, number=1, repeat=args.repeat))
+        compiled_time = min(timeit.repeat(compiled, number=1, repeat=args.repeat))
+        print(f"{size:>8} {len(referers) / linear_time:>14,.0f} "
+              f"{len(referers) / compiled_time:>15,.0f} {linear_time / compiled_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Scaling benchmark: per-advertiser (N+1) health stats vs. set-based GROUP BY.
+
+Seeds advertisers and health logs spread over the last two weeks into a
+scratch SQLite database (and backfills the hourly rollups), then times
+building the /api/health/containers payload from raw logs per advertiser
+and from the rollups, counting the SQL statements each issues. Run from the
+backend directory:
+
+    python -m benchmarks.bench_health [--advertisers 100,1000,5000] [--logs 100]
+"""
+from datetime import datetime, timedelta
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, func, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.advertiser import Advertiser
+from app.models.health_log import HealthLog
+from app.services.health_checker import get_all_container_stats
+from app.services.rollups import rebuild_rollups
+
+
+def legacy_container_stats(db, container_id: str) -> dict:
+    """Copy of the previous get_container_stats: three queries per container"""
+    advertiser = db.query(Advertiser).filter(Advertiser.container_id == container_id).first()
+    if not advertiser:
+        return None
+    now = datetime.utcnow()
+    one_day_ago = now - timedelta(days=1)
+    one_week_ago = now - timedelta(days=7)
+    loads_today = db.query(func.count(HealthLog.id)).filter(
+        HealthLog.container_id == container_id,
+        HealthLog.created_at >= one_day_ago
+    ).scalar()
+    loads_week = db.query(func.count(HealthLog.id)).filter(
+        HealthLog.container_id == container_id,
+        HealthLog.created_at >= one_week_ago
+    ).scalar()
+    last_log = db.query(HealthLog).filter(
+        HealthLog.container_id == container_id
+    ).order_by(HealthLog.created_at.desc()).first()
+    last_load = last_log.created_at if last_log else None
+    if not last_log:
+        status = 'never'
+    elif last_load >= one_day_ago:
+        status = 'active'
+    else:
+        status = 'inactive'
+    return {'container_id': container_id, 'loads_today': loads_today,
+            'loads_week': loads_week, 'last_load': last_load, 'status': status}
+
+
+def legacy_all_container_stats(db) -> list:
+    """Copy of the previous /api/health/containers loop"""
+    result = []
+    for advertiser in db.query(Advertiser).all():
+        stats = legacy_container_stats(db, advertiser.container_id)
+        result.append({'advertiser_id': advertiser.id, 'advertiser_name': advertiser.name, **stats})
+    return result
+
+
+def seed(session_factory, advertisers: int, logs_per_container: int, rng: random.Random) -> int:
+    now = datetime.utcnow()
+    db = session_factory()
+    try:
+        db.execute(insert(Advertiser), [
+            {'id': i, 'name': f'Advertiser {i}', 'container_id': f'adv_{i:08x}', 'domains': '[]'}
+            for i in range(1, advertisers + 1)
+        ])
+        rows = []
+        total = 0
+        for i in range(1, advertisers + 1):
+            # Some containers never load, the rest with a varying volume
+            if rng.random() < 0.1:
+                continue
+            for _ in range(rng.randint(1, 2 * logs_per_container)):
+                rows.append({
+                    'container_id': f'adv_{i:08x}',
+                    'referer': 'https://example.com/',
+                    'is_allowed': rng.random() < 0.9,
+                    'created_at': now - timedelta(seconds=rng.randint(0, 14 * 86400)),
+                })
+            if len(rows) >= 50000:
+                db.execute(insert(HealthLog), rows)
+                total += len(rows)
+                rows = []
+        if rows:
+            db.execute(insert(HealthLog), rows)
+            total += len(rows)
+        db.commit()
+        rebuild_rollups(db)
+    finally:
+        db.close()
+    return total
+
+
+def timed(session_factory, func, counter: list, repeat: int) -> tuple:
+    """Best time over ``repeat`` runs and the statements of one run"""
+    best = None
+    for _ in range(repeat):
+        db = session_factory()
+        try:
+            before = counter[0]
+            started = time.perf_counter()
+            result = func(db)
+            elapsed = time.perf_counter() - started
+            queries = counter[0] - before
+        finally:
+            db.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, queries, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--advertisers", default="100,1000,5000", help="comma-separated advertiser counts")
+    parser.add_argument("--logs", type=int, default=100, help="average health logs per container")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'advertisers':>11} {'log rows':>10} {'N+1 ms':>10} {'queries':>8} "
+          f"{'GROUP BY ms':>12} {'queries':>8} {'speedup':>8}")
+    for count in [int(n) for n in args.advertisers.split(",")]:
+        directory = tempfile.mkdtemp(prefix="tsprtg-bench-")
+        engine = create_engine(f"sqlite:///{directory}/health.db")
+        counter = [0]
+        event.listen(engine, "before_cursor_execute",
+                     lambda *_: counter.__setitem__(0, counter[0] + 1))
+        try:
+            Base.metadata.create_all(bind=engine)
+            session_factory = sessionmaker(bind=engine)
+            log_rows = seed(session_factory, count, args.logs, rng)
+
+            legacy_time, legacy_queries, expected = timed(
+                session_factory, legacy_all_container_stats, counter, args.repeat
+            )
+            grouped_time, grouped_queries, actual = timed(
+                session_factory, get_all_container_stats, counter, args.repeat
+            )
+            # Both must produce the same payload (the reference time moves slightly)
+            for old, new in zip(expected, actual):
+                assert old['container_id'] == new['container_id'] and old['status'] == new['status']
+                assert old['last_load'] == new['last_load'], (old, new)
+
+            print(f"{count:>11,} {log_rows:>10,} {legacy_time * 1000:>10.1f} {legacy_queries:>8,} "
+                  f"{grouped_time * 1000:>12.1f} {grouped_queries:>8,} {legacy_time / grouped_time:>7.1f}x")
+        finally:
+            engine.dispose()
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
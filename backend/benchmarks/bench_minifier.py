@@ -0,0 +1,180 @@
+"""Throughput benchmark: tokenizer minifier vs. the previous line-based one.
+
+Checks the tricky-input corpus first, then reports MB/s for the old
+minifier, the tokenizer, and the memoized per-fragment path used when
+rendering bundles. Run from the backend directory:
+
+    python -m benchmarks.bench_minifier [--size-kb 256] [--file some.js] [--node]
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import timeit
+
+from app.services.js_minifier import MinifyCache, minify
+from benchmarks.js_corpus import CORPUS
+
+SAMPLE_SCRIPT = """
+/**
+ * Typical vendor tag: event queue, config and a lazy loader.
+ */
+(function (window, document, name) {
+    'use strict';
+
+    // Queue calls made before the library is ready
+    var queue = window[name] = window[name] || function () {
+        (queue.q = queue.q || []).push(arguments);
+    };
+    queue.l = +new Date();
+
+    var config = {
+        endpoint: 'https://collect.example.com/v1/events',
+        sampleRate: 0.25,
+        cookieDomain: location.hostname.replace(/^www\\./, ''),
+        retries: 3
+    };
+
+    function send(event, payload) {
+        if (Math.random() > config.sampleRate) {
+            return false;
+        }
+        var body = JSON.stringify({ event: event, payload: payload, ts: Date.now() });
+        for (var attempt = 0; attempt < config.retries; attempt++) {
+            try {
+                navigator.sendBeacon(config.endpoint, body);
+                return true;
+            } catch (e) {
+                /* retry on the next attempt */
+            }
+        }
+        return false;
+    }
+
+    function onReady(callback) {
+        if (document.readyState !== 'loading') {
+            callback();
+        } else {
+            document.addEventListener('DOMContentLoaded', callback);
+        }
+    }
+
+    onReady(function () {
+        var label = `visit ${location.pathname} in ${document.title.length} chars`;
+        send('pageview', { label: label, ref: document.referrer || null });
+        var s = document.createElement('script');
+        s.async = true;
+        s.src = 'https://cdn.example.com/lib.js?v=' + (queue.l / 1000 | 0);
+        (document.body || document.head).appendChild(s);
+    });
+})(window, document, 'vendorTag');
+"""
+
+
+def legacy_minify_js(code: str) -> str:
+    """Line-based minifier that was used before the tokenizer (for comparison)"""
+    lines = []
+    in_string = False
+    string_char = None
+    
+    for line in code.split('\n'):
+        cleaned = []
+        i = 0
+        while i < len(line):
+            char = line[i]
+            
+            # Track string state to avoid removing // inside strings
+            if char in ('"', "'") and (i == 0 or line[i-1] != '\\'):
+                if not in_string:
+                    in_string = True
+                    string_char = char
+                elif char == string_char:
+                    in_string = False
+                    string_char = None
+            
+            # Remove comments only when not in a string
+            if not in_string and i < len(line) - 1:
+                if line[i:i+2] == '//':
+                    break
+            
+            cleaned.append(char)
+            i += 1
+        
+        lines.append(''.join(cleaned).strip())
+    
+    # Join and remove extra whitespace
+    minified = ' '.join(lines)
+    minified = ' '.join(minified.split())
+    
+    return minified
+
+
+def check_corpus(use_node: bool) -> None:
+    """Verify the expected output of every corpus entry"""
+    for name, source, expected in CORPUS:
+        actual = minify(source)
+        assert actual == expected, f"{name}: {actual!r} != {expected!r}"
+
+    if not use_node:
+        return
+    if shutil.which("node") is None:
+        raise SystemExit("--node requires node on PATH")
+    for name, source, expected in CORPUS:
+        script = (
+            f"var a=(function(){{var result;{source}\n;return JSON.stringify(result)}})();"
+            f"var b=(function(){{var result;{expected}\n;return JSON.stringify(result)}})();"
+            "if(a!==b){console.error(a+' != '+b);process.exit(1)}"
+        )
+        result = subprocess.run(["node", "-e", script], capture_output=True, text=True)
+        assert result.returncode == 0, f"{name}: {result.stderr.strip()}"
+
+
+def throughput(func, data: str, repeat: int) -> float:
+    """Best-of-N throughput in MB/s"""
+    seconds = min(timeit.repeat(lambda: func(data), number=1, repeat=repeat))
+    return len(data.encode("utf-8")) / seconds / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-kb", type=int, default=256, help="approximate input size")
+    parser.add_argument("--file", help="benchmark this JavaScript file instead of the sample")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--node", action="store_true", help="also execute the corpus with node")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    check_corpus(args.node)
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            data = f.read()
+    else:
+        data = SAMPLE_SCRIPT * max(1, args.size_kb * 1024 // len(SAMPLE_SCRIPT))
+
+    # Bundles are rendered from many small fragments that rarely change
+    fragments = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+    cache = MinifyCache(max_entries=len(fragments) + 1)
+    for fragment in fragments:
+        cache.minify(fragment)
+
+    results = {
+        "input_bytes": len(data.encode("utf-8")),
+        "legacy_mb_s": throughput(legacy_minify_js, data, args.repeat),
+        "tokenizer_mb_s": throughput(minify, data, args.repeat),
+        "memoized_mb_s": throughput(lambda _: [cache.minify(f) for f in fragments], data, args.repeat),
+        "size_ratio": len(minify(data)) / len(data),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"corpus: {len(CORPUS)} cases OK")
+    print(f"input:  {results['input_bytes'] / 1024:.0f} KiB, minified to {results['size_ratio']:.0%}")
+    print(f"legacy line-based:  {results['legacy_mb_s']:8.2f} MB/s")
+    print(f"tokenizer:          {results['tokenizer_mb_s']:8.2f} MB/s")
+    print(f"memoized fragments: {results['memoized_mb_s']:8.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
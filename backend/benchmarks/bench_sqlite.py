@@ -0,0 +1,179 @@
+"""SQLite storage profile benchmark: read and write throughput with the
+production profile (WAL, pragmas, single writer connection) on and off.
+
+For each profile a scratch database is seeded with the medium dataset and
+health logs, then worker threads run for ``--seconds``:
+
+* reads   - reader threads look up a container and its latest 50 logs
+* writes  - writer threads insert batches of health logs plus rollups
+* mixed   - both at once, the production traffic pattern
+
+and the report shows reads/s, written rows/s, p99 read latency and how
+many operations failed with "database is locked". Run from the backend
+directory:
+
+    python -m benchmarks.bench_sqlite [--seconds 5] [--readers 8] [--writers 2]
+"""
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+import argparse
+import math
+import random
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from app.database import Base, make_engine, make_session_factory
+from app.models.advertiser import Advertiser
+from app.models.health_log import HealthLog
+from app.services.health_checker import get_container_logs
+from app.services.rollups import apply_log_rows
+from benchmarks.datasets import SCENARIOS, seed
+
+WORKLOADS = ('reads', 'writes', 'mixed')
+
+
+def open_database(url: str, profile: str):
+    engine = make_engine(url, profile)
+    writer = make_engine(url, profile, writer=True) if profile == 'production' else engine
+    return engine, writer, make_session_factory(engine, writer)
+
+
+def log_rows(container_ids: list, count: int, rng: random.Random) -> list:
+    now = datetime.utcnow()
+    return [{
+        'container_id': rng.choice(container_ids),
+        'referer': 'https://example.com/page',
+        'referer_host': 'example.com',
+        'is_allowed': rng.random() < 0.9,
+        'created_at': now - timedelta(seconds=rng.randint(0, 86400)),
+    } for _ in range(count)]
+
+
+def populate(session_factory, logs: int) -> list:
+    rng = random.Random(7)
+    db = session_factory()
+    try:
+        seed(db, SCENARIOS['medium'], 42)
+        container_ids = [row[0] for row in db.query(Advertiser.container_id)]
+        for start in range(0, logs, 50000):
+            rows = log_rows(container_ids, min(50000, logs - start), rng)
+            db.execute(insert(HealthLog), rows)
+            apply_log_rows(db, rows)
+        db.commit()
+    finally:
+        db.close()
+    return container_ids
+
+
+class Results:
+    def __init__(self):
+        self.lock = Lock()
+        self.reads = 0
+        self.rows_written = 0
+        self.locked = 0
+        self.read_timings = []
+
+    def add_read(self, seconds: float) -> None:
+        with self.lock:
+            self.reads += 1
+            self.read_timings.append(seconds)
+
+
+def reader(session_factory, container_ids, stop: Event, results: Results, seed_value: int) -> None:
+    rng = random.Random(seed_value)
+    while not stop.is_set():
+        started = time.perf_counter()
+        db = session_factory()
+        try:
+            container_id = rng.choice(container_ids)
+            db.query(Advertiser).filter(Advertiser.container_id == container_id).first()
+            get_container_logs(db, container_id, limit=50)
+        except OperationalError:
+            with results.lock:
+                results.locked += 1
+            continue
+        finally:
+            db.close()
+        results.add_read(time.perf_counter() - started)
+
+
+def writer(session_factory, container_ids, stop: Event, results: Results, batch: int, seed_value: int) -> None:
+    rng = random.Random(seed_value)
+    while not stop.is_set():
+        rows = log_rows(container_ids, batch, rng)
+        db = session_factory()
+        try:
+            # Same statements as the health log writer
+            db.execute(insert(HealthLog), rows)
+            apply_log_rows(db, rows)
+            db.commit()
+        except OperationalError:
+            db.rollback()
+            with results.lock:
+                results.locked += 1
+            continue
+        finally:
+            db.close()
+        with results.lock:
+            results.rows_written += batch
+
+
+def run_workload(session_factory, container_ids, workload: str, args) -> dict:
+    stop = Event()
+    results = Results()
+    threads = []
+    if workload in ('reads', 'mixed'):
+        threads += [Thread(target=reader, args=(session_factory, container_ids, stop, results, i))
+                    for i in range(args.readers)]
+    if workload in ('writes', 'mixed'):
+        threads += [Thread(target=writer, args=(session_factory, container_ids, stop, results, args.batch, 1000 + i))
+                    for i in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    timings = sorted(results.read_timings)
+    p99 = timings[max(0, math.ceil(0.99 * len(timings)) - 1)] * 1000 if timings else 0.0
+    return {
+        'reads_per_sec': results.reads / args.seconds,
+        'rows_per_sec': results.rows_written / args.seconds,
+        'read_p99_ms': p99,
+        'locked': results.locked,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--batch", type=int, default=100, help="health log rows per write transaction")
+    parser.add_argument("--logs", type=int, default=200000, help="health log rows seeded")
+    args = parser.parse_args()
+
+    print(f"{'profile':>10} {'workload':>8} {'reads/s':>9} {'rows/s':>9} {'read p99 ms':>12} {'locked':>7}")
+    for profile in ('default', 'production'):
+        directory = tempfile.mkdtemp(prefix="tsprtg-bench-")
+        engine, writer_engine, session_factory = open_database(f"sqlite:///{directory}/bench.db", profile)
+        try:
+            Base.metadata.create_all(bind=writer_engine)
+            container_ids = populate(session_factory, args.logs)
+            for workload in WORKLOADS:
+                result = run_workload(session_factory, container_ids, workload, args)
+                print(f"{profile:>10} {workload:>8} {result['reads_per_sec']:>9,.0f} {result['rows_per_sec']:>9,.0f} "
+                      f"{result['read_p99_ms']:>12.1f} {result['locked']:>7,}")
+        finally:
+            engine.dispose()
+            writer_engine.dispose()
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Benchmark suite for the loader hot path and config scaling.
+
+Seeds a synthetic dataset per scenario (see benchmarks.datasets) into a
+temporary SQLite database and measures:
+
+* generate_loader_script  - render a container's loader source
+* minify_js               - minify a rendered loader (no memo)
+* is_domain_allowed       - linear allowlist check, JSON parsed per call
+* domain_matcher          - compiled allowlist used by the loader
+* loader_request_cold     - GET /c/{id}/l.js through the ASGI app, empty caches
+* loader_request_warm     - GET /c/{id}/l.js with the bundle cached
+* bundle_request          - GET /c/{id}/{hash}.js with the bundle cached
+
+For each it reports the best of ``--rounds`` rounds: ops/s, p50/p99 latency and SQL statements per operation
+(background health log inserts excluded), then compares against a stored
+baseline JSON. Run from the backend directory:
+
+    python -m benchmarks.bench_suite [--scenarios small,medium] [--save-baseline]
+    python -m benchmarks.bench_suite --scenarios large --ops 500
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# The app binds its engine at import time, so point it at a scratch database first
+_DB_DIR = tempfile.mkdtemp(prefix="tsprtg-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/bench.db"
+# All requests come from one IP: the loader rate limits would shed them
+os.environ["LOADER_RATE_PER_IP"] = "0"
+os.environ["LOADER_RATE_PER_CONTAINER"] = "0"
+
+from sqlalchemy import event  # noqa: E402
+
+from app.database import Base, SessionLocal, async_engine, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.advertiser import Advertiser  # noqa: E402
+from app.routers.loader import is_domain_allowed  # noqa: E402
+from app.services.container_generator import generate_loader_script, minify_js  # noqa: E402
+from app.services.domain_matcher import get_domain_matcher  # noqa: E402
+from app.services.js_minifier import fragment_cache  # noqa: E402
+from app.services.loader_cache import loader_cache  # noqa: E402
+from app.services.log_writer import log_writer  # noqa: E402
+from benchmarks.datasets import SCENARIOS, random_domain, seed  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+class QueryCounter:
+    """Counts SQL statements executed by request paths"""
+
+    def __init__(self, *binds):
+        self.count = 0
+        for bind in binds:
+            event.listen(bind, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Batched health log writes happen off the request path
+        if not statement.startswith("INSERT INTO health_logs"):
+            self.count += 1
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(timings: list, queries: int) -> dict:
+    timings.sort()
+    return {
+        "ops": len(timings),
+        "ops_per_sec": round(len(timings) / sum(timings), 1),
+        "p50_ms": round(percentile(timings, 50) * 1000, 4),
+        "p99_ms": round(percentile(timings, 99) * 1000, 4),
+        "queries_per_op": round(queries / len(timings), 2),
+    }
+
+
+def best_round(run_round, rounds: int) -> dict:
+    """Run ``rounds`` timed rounds and keep the fastest, like timeit's min()"""
+    results = [run_round() for _ in range(max(1, rounds))]
+    return max(results, key=lambda result: result["ops_per_sec"])
+
+
+def measure(func, args: list, ops: int, counter: QueryCounter, rounds: int, before=None) -> dict:
+    """Time ``func(arg)`` for ``ops`` calls cycling over ``args`` after one warm-up pass"""
+    for arg in args:
+        func(arg)
+
+    def run_round():
+        timings = []
+        queries = 0
+        for i in range(ops):
+            arg = args[i % len(args)]
+            if before is not None:
+                before(arg)
+            start_count = counter.count
+            start = time.perf_counter()
+            func(arg)
+            timings.append(time.perf_counter() - start)
+            queries += counter.count - start_count
+        return summarize(timings, queries)
+
+    return best_round(run_round, rounds)
+
+
+async def asgi_get(path: str, headers: dict) -> tuple:
+    """Call the ASGI app in-process and return (status, body)"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench.local")] + [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench.local", 80),
+    }
+    response = {"status": None, "body": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+def measure_requests(requests: list, ops: int, counter: QueryCounter, rounds: int,
+                     expected_status: int, before=None) -> dict:
+    """Time in-process ASGI GETs for ``ops`` calls cycling over (path, headers)"""
+
+    async def run_round():
+        timings = []
+        queries = 0
+        for i in range(ops):
+            path, headers = requests[i % len(requests)]
+            if before is not None:
+                before(path)
+            start_count = counter.count
+            start = time.perf_counter()
+            status, _ = await asgi_get(path, headers)
+            timings.append(time.perf_counter() - start)
+            queries += counter.count - start_count
+            assert status == expected_status, f"{path}: HTTP {status}"
+        return summarize(timings, queries)
+
+    async def run():
+        for path, headers in requests:
+            await asgi_get(path, headers)
+        results = [await run_round() for _ in range(max(1, rounds))]
+        return max(results, key=lambda result: result["ops_per_sec"])
+
+    return asyncio.run(run())
+
+
+def run_scenario(scenario, args, counter: QueryCounter) -> dict:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    loader_cache.invalidate_all()
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        counts = seed(db, scenario, seed=args.seed)
+        print(f"\n[{scenario.name}] seeded {counts['advertisers']:,} advertisers, "
+              f"{counts['scripts']:,} scripts in {time.perf_counter() - started:.1f}s")
+
+        rng = random.Random(args.seed)
+        active_ids = [row.id for row in db.query(Advertiser.id).filter(Advertiser.is_active == True)]
+        sample_ids = rng.sample(active_ids, min(args.samples, len(active_ids)))
+        sample = db.query(Advertiser).filter(Advertiser.id.in_(sample_ids)).all()
+
+        sources = [generate_loader_script(db, advertiser) for advertiser in sample]
+        domain_lists = [json.loads(advertiser.domains) for advertiser in sample]
+        checks = []
+        for advertiser, domains in zip(sample, domain_lists):
+            host = rng.choice(domains) if rng.random() < 0.7 else random_domain(rng)
+            checks.append((advertiser, f"https://www.{host}/page?id=1"))
+
+        results = {}
+        results["generate_loader_script"] = measure(
+            lambda advertiser: generate_loader_script(db, advertiser), sample, args.ops, counter, args.rounds
+        )
+        results["minify_js"] = measure(minify_js, sources, args.ops, counter, args.rounds)
+        results["is_domain_allowed"] = measure(
+            lambda check: is_domain_allowed(check[1], json.loads(check[0].domains)),
+            checks, args.ops, counter, args.rounds
+        )
+        results["domain_matcher"] = measure(
+            lambda check: get_domain_matcher(check[0]).matches(check[1]), checks, args.ops, counter, args.rounds
+        )
+    finally:
+        db.close()
+
+    loader_requests = [
+        (f"/c/{advertiser.container_id}/l.js",
+         {"referer": f"https://{domains[0]}/", "accept-encoding": "gzip, br"})
+        for advertiser, domains in zip(sample, domain_lists)
+    ]
+
+    def drop_caches(path):
+        loader_cache.invalidate_all()
+        fragment_cache.clear()
+
+    results["loader_request_cold"] = measure_requests(
+        loader_requests, args.ops, counter, args.rounds, 200, before=drop_caches
+    )
+    results["loader_request_warm"] = measure_requests(loader_requests, args.ops, counter, args.rounds, 200)
+
+    bundle_requests = []
+    for path, headers in loader_requests:
+        _, body = asyncio.run(asgi_get(path, headers))
+        bundle_path = "/" + body.decode().split("src='//", 1)[1].split("'", 1)[0].split("/", 1)[1]
+        bundle_requests.append((bundle_path, {"accept-encoding": "gzip, br"}))
+    results["bundle_request"] = measure_requests(bundle_requests, args.ops, counter, args.rounds, 200)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Print each result next to its baseline and return the regressions"""
+    regressions = []
+    print(f"\n{'benchmark':<34} {'ops/s':>12} {'base':>12} {'change':>8} "
+          f"{'p50 ms':>9} {'p99 ms':>9} {'q/op':>6}")
+    for scenario, benchmarks in results.items():
+        for name, current in benchmarks.items():
+            key = f"{scenario}/{name}"
+            base = baseline.get(scenario, {}).get(name)
+            change = ""
+            flag = ""
+            if base:
+                ratio = current["ops_per_sec"] / base["ops_per_sec"] - 1
+                change = f"{ratio:+.0%}"
+                if ratio < -tolerance:
+                    flag = "  << slower"
+                    regressions.append(key)
+                elif current["queries_per_op"] > base["queries_per_op"] + 0.01:
+                    flag = "  << more queries"
+                    regressions.append(key)
+            print(f"{key:<34} {current['ops_per_sec']:>12,.0f} "
+                  f"{(base or {}).get('ops_per_sec', 0):>12,.0f} {change:>8} "
+                  f"{current['p50_ms']:>9.3f} {current['p99_ms']:>9.3f} "
+                  f"{current['queries_per_op']:>6.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default="small,medium",
+                        help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--ops", type=int, default=1000, help="operations per benchmark")
+    parser.add_argument("--rounds", type=int, default=3, help="timed rounds per benchmark, best one kept")
+    parser.add_argument("--samples", type=int, default=200, help="advertisers sampled per scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="ops/s drop that counts as a regression (0.25 = 25%%)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # The loader endpoints read through the async engine
+    counter = QueryCounter(engine, async_engine.sync_engine)
+    log_writer.start()
+    try:
+        results = {}
+        for name in args.scenarios.split(","):
+            results[name] = run_scenario(SCENARIOS[name.strip()], args, counter)
+    finally:
+        log_writer.stop()
+        engine.dispose()
+        shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2)
+    if args.save_baseline:
+        merged = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": merged}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline written to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s) against {args.baseline}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Multi-process benchmark: loader throughput from 1 to N worker processes.
+
+Seeds the medium dataset into a scratch SQLite database (plus a day of load
+rollups, so workers warm their loader caches at startup), then for each
+worker count starts ``run.py --workers n`` and drives ``/c/{id}/l.js``
+from ``--clients`` load generator processes, each with
+``--connections`` keep-alive connections. Reports req/s and latency per
+worker count and the speedup over one worker.
+
+With ``--reload-check`` it also sends SIGHUP to the master halfway through
+a run at the highest worker count and reports the failed requests, which
+should be zero: connections closed by a stopping worker between two
+requests are reopened (as HTTP clients do), while refused connections,
+truncated responses and non-200 answers count as errors.
+
+The load generators share the machine with the workers, so the scaling
+measured here is only meaningful with spare cores. Run from the backend
+directory:
+
+    python -m benchmarks.bench_workers [--max-workers 4] [--duration 10] [--reload-check]
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+if __name__ == "__main__":
+    # The app binds its engines at import time: point them at a scratch
+    # database, which the server processes inherit through the environment
+    _DB_DIR = tempfile.mkdtemp(prefix="tsprtg-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/bench.db"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    # All requests come from one IP: the loader rate limits would shed them
+    os.environ["LOADER_RATE_PER_IP"] = "0"
+    os.environ["LOADER_RATE_PER_CONTAINER"] = "0"
+
+from sqlalchemy import insert  # noqa: E402
+
+from app.database import SessionLocal, engine, init_db, writer_engine  # noqa: E402
+from app.main import app  # noqa: E402,F401
+from app.models.advertiser import Advertiser  # noqa: E402
+from app.models.container_load_rollup import ContainerLoadRollup  # noqa: E402
+from benchmarks.bench_concurrency import free_port  # noqa: E402
+from benchmarks.datasets import SCENARIOS, seed  # noqa: E402
+
+
+async def _request(reader, writer, path: str, referer: str) -> bytes:
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench.local\r\nReferer: {referer}\r\n\r\n".encode())
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return head
+
+
+async def connection(port: int, targets: list, deadline: float, latencies: list, errors: list,
+                     rng: random.Random) -> None:
+    """Keep-alive requests until ``deadline``, reconnecting when the server closes"""
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            path, referer = rng.choice(targets)
+            started = time.perf_counter()
+            try:
+                head = await _request(reader, writer, path, referer)
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    raise
+                # Closed before any byte of the answer: a keep-alive close
+                writer.close()
+                writer = None
+                continue
+            latencies.append(time.perf_counter() - started)
+            if not head.startswith(b"HTTP/1.1 200"):
+                errors.append(head.split(b"\r\n", 1)[0].decode())
+            if b"connection: close" in head.lower():
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError) as e:
+            errors.append(repr(e))
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+def client(port: int, targets: list, connections: int, duration: float, seed_value: int, results) -> None:
+    """One load generator process"""
+    latencies, errors = [], []
+    rng = random.Random(seed_value)
+    deadline = time.monotonic() + duration
+
+    async def run():
+        await asyncio.gather(*(
+            connection(port, targets, deadline, latencies, errors, random.Random(rng.random()))
+            for _ in range(connections)
+        ))
+
+    asyncio.run(run())
+    results.put((latencies, errors))
+
+
+def load(port: int, targets: list, clients: int, connections: int, duration: float,
+         on_halfway=None) -> dict:
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [
+        context.Process(target=client, args=(port, targets, connections, duration, index, results))
+        for index in range(clients)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    if on_halfway is not None:
+        time.sleep(duration / 2)
+        on_halfway()
+    latencies, errors = [], []
+    for _ in processes:
+        chunk_latencies, chunk_errors = results.get()
+        latencies += chunk_latencies
+        errors += chunk_errors
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(p):
+        return latencies[max(0, math.ceil(p / 100 * len(latencies)) - 1)] * 1000 if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "req_per_sec": len(latencies) / elapsed,
+        "p50_ms": pct(50),
+        "p99_ms": pct(99),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+    }
+
+
+def prepare(containers: int) -> list:
+    init_db()
+    db = SessionLocal()
+    try:
+        seed(db, SCENARIOS["medium"], 42)
+        advertisers = db.query(Advertiser).filter(Advertiser.is_active == True).limit(containers).all()
+        targets = [
+            (f"/c/{advertiser.container_id}/l.js", f"https://{json.loads(advertiser.domains)[0]}/")
+            for advertiser in advertisers if json.loads(advertiser.domains)
+        ]
+        # Recent traffic for the startup warm-up to pick from
+        hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+        db.execute(insert(ContainerLoadRollup), [
+            {"container_id": advertiser.container_id, "bucket_start": hour, "is_allowed": True, "loads": 100}
+            for advertiser in advertisers
+        ])
+        db.commit()
+    finally:
+        db.close()
+    engine.dispose()
+    writer_engine.dispose()
+    return targets
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "run.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    # The socket is bound before the workers start: wait for an answer
+    deadline = time.monotonic() + 120
+    while True:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=5).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError("server did not start")
+            time.sleep(0.2)
+    # Give the other workers time to get ready as well
+    time.sleep(2 * workers)
+    return server
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.send_signal(signal.SIGTERM)
+    server.wait(60)
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=cores)
+    parser.add_argument("--clients", type=int, default=max(1, cores // 2), help="load generator processes")
+    parser.add_argument("--connections", type=int, default=50, help="connections per load generator")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument("--containers", type=int, default=200, help="distinct containers requested")
+    parser.add_argument("--reload-check", action="store_true", help="SIGHUP the master during a run")
+    args = parser.parse_args()
+
+    try:
+        targets = prepare(args.containers)
+        print(f"{cores} CPUs, {args.clients} load generators x {args.connections} connections, "
+              f"{len(targets)} containers, {args.duration:g}s per run")
+        print(f"{'workers':>7} {'requests':>9} {'req/s':>8} {'speedup':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        single = None
+        for workers in range(1, args.max_workers + 1):
+            port = free_port()
+            server = start_server(port, workers)
+            try:
+                # Workers only accept once warm; the ready check is in the supervisor
+                result = load(port, targets, args.clients, args.connections, args.duration)
+            finally:
+                stop_server(server)
+            single = single or result["req_per_sec"]
+            print(f"{workers:>7} {result['requests']:>9,} {result['req_per_sec']:>8,.0f} "
+                  f"{result['req_per_sec'] / single:>7.2f}x {result['p50_ms']:>9.1f} "
+                  f"{result['p99_ms']:>9.1f} {result['errors']:>7,}")
+
+        if args.reload_check:
+            port = free_port()
+            server = start_server(port, args.max_workers)
+            try:
+                result = load(port, targets, args.clients, args.connections, args.duration,
+                              on_halfway=lambda: server.send_signal(signal.SIGHUP))
+            finally:
+                stop_server(server)
+            print(f"\nSIGHUP during load ({args.max_workers} workers): {result['requests']:,} requests, "
+                  f"{result['errors']:,} failed")
+            for sample in result["error_samples"]:
+                print(f"  {sample}")
+    finally:
+        shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Deterministic synthetic datasets for the benchmarks.
+
+Script and domain counts per advertiser are skewed: most advertisers have a
+few, a long tail has up to the maximum, which is what production data
+looks like and keeps the 100k-advertiser scenario seedable.
+"""
+from dataclasses import dataclass
+import json
+import random
+import string
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.advertiser import Advertiser
+from app.models.script import Script
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    advertisers: int
+    max_scripts: int
+    max_domains: int
+    global_scripts: int = 5
+
+
+SCENARIOS = {
+    'small': Scenario('small', advertisers=10, max_scripts=20, max_domains=10),
+    'medium': Scenario('medium', advertisers=1000, max_scripts=50, max_domains=100),
+    'large': Scenario('large', advertisers=100000, max_scripts=200, max_domains=1000),
+}
+
+INLINE_SNIPPETS = (
+    "window.dataLayer = window.dataLayer || [];\n"
+    "function gtag(){ dataLayer.push(arguments); }\n"
+    "gtag('js', new Date());\ngtag('config', 'G-%s');\n",
+    "/* consent banner */\n"
+    "(function (d) {\n"
+    "    var el = d.createElement('div');\n"
+    "    el.className = 'consent-%s';\n"
+    "    el.innerHTML = `<p>We use cookies</p>`;\n"
+    "    if (!/consent=1/.test(d.cookie)) { d.body.appendChild(el); }\n"
+    "})(document);\n",
+    "var _pix = _pix || [];\n_pix.push(['init', '%s']); // pixel id\n",
+)
+
+BATCH_SIZE = 5000
+
+
+def _skewed(rng: random.Random, maximum: int, power: float) -> int:
+    return int(maximum * rng.random() ** power)
+
+
+def random_domain(rng: random.Random) -> str:
+    name = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+    return f"{name}.{rng.choice(['com', 'net', 'org', 'io', 'co.uk'])}"
+
+
+def _script_row(rng: random.Random, advertiser_id, index: int) -> dict:
+    tag = ''.join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(10))
+    if rng.random() < 0.5:
+        return {
+            'advertiser_id': advertiser_id,
+            'name': f'External {index}',
+            'script_type': 'external',
+            'content': f'https://cdn.example.com/tags/{tag}.js',
+            'is_enabled': rng.random() < 0.9,
+            'priority': rng.randint(0, 100),
+            'is_async': True,
+            'is_defer': rng.random() < 0.2,
+        }
+    return {
+        'advertiser_id': advertiser_id,
+        'name': f'Inline {index}',
+        'script_type': 'inline',
+        'content': rng.choice(INLINE_SNIPPETS) % tag,
+        'is_enabled': rng.random() < 0.9,
+        'priority': rng.randint(0, 100),
+        'is_async': False,
+        'is_defer': False,
+    }
+
+
+def seed(db: Session, scenario: Scenario, seed: int = 42) -> dict:
+    """Bulk insert a scenario into an empty database and return row counts"""
+    rng = random.Random(seed)
+
+    db.execute(insert(Script), [
+        _script_row(rng, None, i) for i in range(scenario.global_scripts)
+    ])
+
+    script_count = 0
+    advertisers = []
+    scripts = []
+    for i in range(1, scenario.advertisers + 1):
+        domains = [random_domain(rng) for _ in range(1 + _skewed(rng, scenario.max_domains - 1, 3))]
+        advertisers.append({
+            'id': i,
+            'name': f'Advertiser {i}',
+            'container_id': f'adv_{i:08x}',
+            'domains': json.dumps(domains),
+            'is_active': rng.random() < 0.95,
+        })
+        for j in range(_skewed(rng, scenario.max_scripts, 4)):
+            scripts.append(_script_row(rng, i, j))
+
+        if len(advertisers) >= BATCH_SIZE or i == scenario.advertisers:
+            db.execute(insert(Advertiser), advertisers)
+            if scripts:
+                db.execute(insert(Script), scripts)
+            script_count += len(scripts)
+            advertisers, scripts = [], []
+    db.commit()
+
+    return {
+        'advertisers': scenario.advertisers,
+        'scripts': script_count,
+        'global_scripts': scenario.global_scripts,
+    }
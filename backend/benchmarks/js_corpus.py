@@ -0,0 +1,54 @@
+"""Corpus of tricky JavaScript inputs for the minifier.
+
+Each entry is ``(name, source, expected)``. Every source assigns ``result``
+so the original and the minified code can also be compared by running
+them (see ``bench_minifier.py --node``).
+"""
+
+CORPUS = [
+    ('asi',
+     'var a = 1\nvar b = a\n++b\nresult = [a, b]',
+     'var a=1\nvar b=a\n++b\nresult=[a,b]'),
+    ('return_asi',
+     'function f(){ return\n 5 }\nresult = f()',
+     'function f(){return\n5}\nresult=f()'),
+    ('regex',
+     "var r = /[/]\\/*x/g; var s = 'a//b'.replace(/\\//g, '-'); result = [r.source, s, 4 / 2 / 1]",
+     "var r=/[/]\\/*x/g;var s='a//b'.replace(/\\//g,'-');result=[r.source,s,4/2/1]"),
+    ('block',
+     '/* comment // not line */ var x = 1 /* inline */ + 2; /**\n * doc\n */ result = x',
+     'var x=1+2;result=x'),
+    ('template',
+     'var n = 3; var t = `a ${n + 1} // not comment ${ `nested ${n}` } /* x */ ${ {a:1}.a }`; result = t',
+     'var n=3;var t=`a ${n+1} // not comment ${`nested ${n}`} /* x */ ${{a:1}.a}`;result=t'),
+    ('escaped',
+     'var s = \'it\\\'s \\\\\'; var d = "say \\"hi\\" // no"; result = s + d',
+     'var s=\'it\\\'s \\\\\';var d="say \\"hi\\" // no";result=s+d'),
+    ('plusplus',
+     'var a = 1, b = 2; var c = a + +b; var d = a - -b; var e = a+ ++b; result = [c, d, e]',
+     'var a=1,b=2;var c=a+ +b;var d=a- -b;var e=a+ ++b;result=[c,d,e]'),
+    ('inttodot',
+     'result = 1 .toString() + 2..toString()',
+     'result=1 .toString()+2..toString()'),
+    ('regex_after_return',
+     "function f(s){ return /ab+c/i.test(s) }\nresult = f('xABBc')",
+     "function f(s){return/ab+c/i.test(s)}\nresult=f('xABBc')"),
+    ('division_after_paren',
+     'var a = (10) / 2 / 5; result = a',
+     'var a=(10)/2/5;result=a'),
+    ('keyword_spacing',
+     "var x = typeof result; if (x === 'undefined') { result = void 0 } else result = 2; result = [result, 'a' in {a:1}]",
+     "var x=typeof result;if(x==='undefined'){result=void 0}else result=2;result=[result,'a'in{a:1}]"),
+    ('line_cont',
+     "var s = 'a\\\nb'; result = s",
+     "var s='a\\\nb';result=s"),
+    ('unicode',
+     "var café = 'naïve – ok'; result = café",
+     "var café='naïve – ok';result=café"),
+    ('html_like',
+     'var a = 1, b = 2; result = a < !b',
+     'var a=1,b=2;result=a< !b'),
+    ('obj_regex',
+     'var o = { re: /}/ }; result = o.re.source',
+     'var o={re:/}/};result=o.re.source'),
+]
@@ -0,0 +1,25 @@
+"""Pre-render container bundles to the static publish directory.
+
+Usage:
+    python publish.py [--full] [--dir PATH] [--workers N]
+"""
+import argparse
+import json
+
+from app.database import SessionLocal, init_db
+from app.services.publisher import publish
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish container bundles for nginx")
+    parser.add_argument("--full", action="store_true", help="re-render every container, not only changed ones")
+    parser.add_argument("--dir", help="output directory (default: PUBLISH_DIR)")
+    parser.add_argument("--workers", type=int, help="render processes (default: PUBLISH_WORKERS or CPU count)")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        result = publish(db, publish_dir=args.dir, full=args.full, workers=args.workers)
+    finally:
+        db.close()
+    print(json.dumps(result, indent=2))
@@ -1,9 +1,19 @@
-import uvicorn
+import argparse
+import logging
+import sys
+
+from app.config import settings
+from app.server import Supervisor
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=False
+    parser = argparse.ArgumentParser(description="Run the TSPRTG API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=settings.web_workers,
+        help="worker processes (0 = CPU count; default: WEB_WORKERS)"
     )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     [master] %(message)s")
+    sys.exit(Supervisor(args.host, args.port, args.workers, settings.web_graceful_timeout).run())
@@ -9,8 +9,10 @@ const api = axios.create({
 
 export default {
   // Advertisers
-  getAdvertisers() {
-    return api.get('/advertisers')
+  // params: { limit, cursor, sort, order, q }; the X-Next-Cursor header
+  // holds the cursor of the next page
+  getAdvertisers(params = {}) {
+    return api.get('/advertisers', { params })
   },
   getAdvertiser(id) {
     return api.get(`/advertisers/${id}`)
@@ -77,5 +79,9 @@ export default {
   },
   getContainerLogs(advertiserId) {
     return api.get(`/health/containers/${advertiserId}/logs`)
+  },
+  // Server-Sent Events: snapshot, counters and loads (see stores/health.js)
+  openHealthStream() {
+    return new EventSource(`${api.defaults.baseURL}/health/stream`)
   }
 }
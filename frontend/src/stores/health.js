@@ -0,0 +1,82 @@
+import { defineStore } from 'pinia'
+import api from '../api'
+
+const RECENT_LOADS = 20
+
+// Views share one event stream: opened by the first connect(), closed by
+// the last disconnect()
+let source = null
+let users = 0
+
+const summarize = (containers) => {
+  const health = {
+    status: 'ok',
+    total_containers: containers.length,
+    active_containers: 0,
+    inactive_containers: 0,
+    never_loaded_containers: 0
+  }
+  for (const container of containers) {
+    if (container.status === 'active') health.active_containers++
+    else if (container.status === 'inactive') health.inactive_containers++
+    else health.never_loaded_containers++
+  }
+  return health
+}
+
+export const useHealthStore = defineStore('health', {
+  state: () => ({
+    health: null,
+    containers: [],
+    recentLoads: [],
+    connected: false
+  }),
+
+  actions: {
+    connect() {
+      users++
+      if (source) return
+      source = api.openHealthStream()
+      source.onopen = () => { this.connected = true }
+      source.onerror = () => { this.connected = false }
+      source.addEventListener('snapshot', (event) => this.applySnapshot(JSON.parse(event.data)))
+      source.addEventListener('counters', (event) => this.applyCounters(JSON.parse(event.data)))
+      source.addEventListener('loads', (event) => this.applyLoads(JSON.parse(event.data)))
+    },
+
+    disconnect() {
+      users = Math.max(0, users - 1)
+      if (users === 0 && source) {
+        source.close()
+        source = null
+        this.connected = false
+      }
+    },
+
+    applySnapshot(snapshot) {
+      this.health = snapshot.health
+      this.containers = snapshot.containers
+    },
+
+    // Loads since the previous tick, added to the last snapshot
+    applyCounters(counters) {
+      const updates = counters.containers
+      for (const container of this.containers) {
+        const update = updates[container.container_id]
+        if (!update) continue
+        const loads = update.allowed + update.denied
+        container.loads_today += loads
+        container.loads_week += loads
+        if (!container.last_load || update.last_load > container.last_load) {
+          container.last_load = update.last_load
+        }
+        container.status = 'active'
+      }
+      this.health = summarize(this.containers)
+    },
+
+    applyLoads(batch) {
+      this.recentLoads = [...batch.loads.reverse(), ...this.recentLoads].slice(0, RECENT_LOADS)
+    }
+  }
+})